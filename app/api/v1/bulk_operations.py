@@ -0,0 +1,166 @@
+from fastapi import APIRouter, Depends, HTTPException, Query, Request
+from pydantic import ValidationError
+from sqlalchemy.ext.asyncio import AsyncSession
+from typing import AsyncIterator, Optional, Tuple
+from uuid import UUID
+from app.core.config import settings
+from app.domain.bulk import notify_bulk_runner
+from app.domain.enums import OperationStatus
+from app.domain.models import BulkOperationJob
+from app.infra.db import get_db
+from app.infra.repositories import BulkOperationRepository
+from app.schemas.bulk import BulkOperationLine, BulkJobResponse, BulkItemResult, BulkItemsPage
+from app.utils.correlation import get_correlation_id_from_context
+import json
+import logging
+
+logger = logging.getLogger(__name__)
+
+router = APIRouter()
+
+
+async def _iter_lines(request: Request) -> AsyncIterator[Tuple[int, object]]:
+    """
+    Itère sur les opérations reçues, avec leur position (à partir de 1) :
+    - application/json : un tableau JSON (corps lu en entier)
+    - sinon NDJSON (une opération par ligne), lu au fil de l'eau
+    """
+    if request.headers.get("content-type", "").startswith("application/json"):
+        try:
+            payload = json.loads(await request.body())
+        except ValueError:
+            raise HTTPException(status_code=422, detail="Invalid JSON body")
+        if not isinstance(payload, list):
+            raise HTTPException(status_code=422, detail="Expected a JSON array of operations")
+        for position, line in enumerate(payload, start=1):
+            yield position, line
+        return
+    
+    position = 0
+    buffer = b""
+    async for chunk in request.stream():
+        buffer += chunk
+        *lines, buffer = buffer.split(b"\n")
+        for raw in lines:
+            if raw.strip():
+                position += 1
+                yield position, _parse_ndjson_line(position, raw)
+    if buffer.strip():
+        yield position + 1, _parse_ndjson_line(position + 1, buffer)
+
+
+def _parse_ndjson_line(position: int, raw: bytes):
+    try:
+        return json.loads(raw)
+    except ValueError:
+        raise HTTPException(status_code=422, detail=f"Line {position}: invalid JSON")
+
+
+def _job_response(job: BulkOperationJob) -> BulkJobResponse:
+    return BulkJobResponse(
+        jobId=job.id,
+        status=job.status,
+        totalItems=job.total_items,
+        processedItems=job.processed_items,
+        succeededItems=job.succeeded_items,
+        failedItems=job.failed_items,
+        createdAt=job.created_at,
+        finishedAt=job.finished_at
+    )
+
+
+@router.post("", status_code=202, response_model=BulkJobResponse)
+async def create_bulk_operation_job(
+    request: Request,
+    db: AsyncSession = Depends(get_db)
+):
+    """
+    Crée un job d'opérations carte en masse (ex: blocage de cartes lors d'un incident).
+    
+    Corps : NDJSON (`application/x-ndjson`, une opération par ligne, lu en streaming)
+    ou tableau JSON (`application/json`), chaque opération étant
+    `{"cardId": 12345, "panAlias": "CMSPARTNER-12345", "operation": "card_blocking"}`.
+    
+    Les opérations sont enregistrées par lots ; le job n'est visible (et traité)
+    qu'une fois la liste entièrement reçue et valide. Le traitement est
+    asynchrone : suivre la progression via GET /{jobId} et /{jobId}/items.
+    """
+    repo = BulkOperationRepository(db)
+    job = repo.create_job(get_correlation_id_from_context())
+    await db.flush()
+    
+    batch = []
+    total = 0
+    async for position, line in _iter_lines(request):
+        if position > settings.bulk_max_items:
+            raise HTTPException(status_code=413, detail=f"Too many operations (max {settings.bulk_max_items})")
+        try:
+            operation = BulkOperationLine.model_validate(line)
+        except ValidationError as e:
+            raise HTTPException(
+                status_code=422,
+                detail=f"Line {position}: {e.errors(include_url=False)}"
+            )
+        batch.append({
+            "position": position,
+            "skaleet_card_id": operation.cardId,
+            "pan_alias": operation.panAlias,
+            "operation_type": operation.operation.value
+        })
+        total = position
+        if len(batch) >= settings.bulk_insert_batch_size:
+            await repo.add_items(job.id, batch)
+            batch = []
+    
+    if total == 0:
+        raise HTTPException(status_code=422, detail="No operations received")
+    await repo.add_items(job.id, batch)
+    
+    job.total_items = total
+    await db.commit()
+    notify_bulk_runner()
+    
+    logger.info(f"Bulk operation job {job.id} created with {total} operations")
+    return _job_response(job)
+
+
+@router.get("/{job_id}", response_model=BulkJobResponse)
+async def get_bulk_operation_job(job_id: UUID, db: AsyncSession = Depends(get_db)):
+    """Progression d'un job (compteurs traités / succès / erreurs)"""
+    job = await BulkOperationRepository(db).get_job(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Bulk operation job not found")
+    return _job_response(job)
+
+
+@router.get("/{job_id}/items", response_model=BulkItemsPage)
+async def list_bulk_operation_items(
+    job_id: UUID,
+    status: Optional[OperationStatus] = None,
+    after: int = Query(0, ge=0, description="Position de la dernière opération de la page précédente"),
+    limit: int = Query(100, ge=1, le=1000),
+    db: AsyncSession = Depends(get_db)
+):
+    """Résultats par carte, dans l'ordre de la liste reçue"""
+    repo = BulkOperationRepository(db)
+    if await repo.get_job(job_id) is None:
+        raise HTTPException(status_code=404, detail="Bulk operation job not found")
+    
+    items = await repo.list_items(job_id, status.value if status else None, after, limit)
+    return BulkItemsPage(
+        items=[
+            BulkItemResult(
+                position=item.position,
+                cardId=item.skaleet_card_id,
+                panAlias=item.pan_alias,
+                operation=item.operation_type,
+                status=item.status,
+                niResultCode=item.ni_result_code,
+                error=item.error,
+                operationId=item.card_operation_id,
+                processedAt=item.processed_at
+            )
+            for item in items
+        ],
+        nextAfter=items[-1].position if len(items) == limit else None
+    )
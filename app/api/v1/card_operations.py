@@ -0,0 +1,125 @@
+from fastapi import APIRouter, Depends, HTTPException, Query
+from fastapi.responses import StreamingResponse
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker
+from datetime import datetime
+from typing import List, Optional
+from app.domain.enums import ExportFormat, OperationStatus, OperationType
+from app.domain.exports import MEDIA_TYPES, export_filename, export_query, iter_export
+from app.domain.models import CardOperation
+from app.infra.card_cache import card_cache
+from app.infra.db import get_read_db, read_session_factory
+from app.infra.repositories import CardOperationRepository, CardRepository
+from app.schemas.operation import CardOperationResult, CardOperationsPage
+from app.utils.pagination import InvalidCursor, decode_cursor, encode_cursor
+
+router = APIRouter()
+
+
+def _after(cursor: Optional[str]):
+    if cursor is None:
+        return None
+    try:
+        return decode_cursor(cursor)
+    except InvalidCursor:
+        raise HTTPException(status_code=422, detail="Invalid cursor")
+
+
+def _page(operations: List[CardOperation], limit: int, skaleet_card_id: Optional[int] = None) -> CardOperationsPage:
+    last = operations[-1] if len(operations) == limit else None
+    return CardOperationsPage(
+        items=[
+            CardOperationResult(
+                operationId=operation.id,
+                cardId=skaleet_card_id if skaleet_card_id is not None else operation.card.skaleet_card_id,
+                operation=operation.operation_type,
+                source=operation.source,
+                status=operation.status,
+                skaleetEvent=operation.skaleet_event,
+                skaleetEventId=operation.skaleet_event_id,
+                webhookId=operation.skaleet_webhook_id,
+                niResultCode=operation.ni_result_code,
+                correlationId=operation.correlation_id,
+                createdAt=operation.created_at,
+                rawWebhook=operation.raw_webhook
+            )
+            for operation in operations
+        ],
+        nextCursor=encode_cursor(last.created_at, last.id) if last is not None else None
+    )
+
+
+@router.get("/cards/{skaleet_card_id}/operations", response_model=CardOperationsPage)
+async def list_card_operations(
+    skaleet_card_id: int,
+    cursor: Optional[str] = Query(None, description="nextCursor de la page précédente"),
+    limit: int = Query(50, ge=1, le=500),
+    db: AsyncSession = Depends(get_read_db)
+):
+    """Historique des opérations d'une carte (cardId Skaleet), les plus récentes d'abord"""
+    after = _after(cursor)
+    # Lecture de support : hors des statistiques du cache (chemin des webhooks)
+    identity = card_cache.get(skaleet_card_id, record_stats=False)
+    card_id = identity.id if identity is not None else None
+    if card_id is None:
+        card = await CardRepository(db).get_by_skaleet_id(skaleet_card_id)
+        if card is None:
+            raise HTTPException(status_code=404, detail="Card not found")
+        card_id = card.id
+    
+    operations = await CardOperationRepository(db).list_by_card(card_id, after, limit)
+    return _page(operations, limit, skaleet_card_id)
+
+
+@router.get("/operations/export")
+async def export_operations(
+    export_format: ExportFormat = Query(ExportFormat.NDJSON, alias="format"),
+    gzip: bool = False,
+    date_from: Optional[datetime] = Query(None, alias="from", description="Inclus"),
+    date_to: Optional[datetime] = Query(None, alias="to", description="Exclu"),
+    operation: Optional[OperationType] = None,
+    status: Optional[OperationStatus] = None,
+    session_factory: async_sessionmaker = Depends(read_session_factory)
+):
+    """
+    Export des opérations (réconciliation NI) en NDJSON ou CSV, gzip en option,
+    dans l'ordre chronologique. Les lignes sont lues et envoyées au fil de l'eau.
+    """
+    query = export_query(
+        date_from,
+        date_to,
+        operation.value if operation else None,
+        status.value if status else None
+    )
+    
+    async def content():
+        # Session propre à l'export : elle vit le temps de la réponse en streaming
+        async with session_factory() as session:
+            async for chunk in iter_export(session, query, export_format, gzip):
+                yield chunk
+    
+    filename = export_filename(export_format, gzip, date_from)
+    return StreamingResponse(
+        content(),
+        media_type="application/gzip" if gzip else MEDIA_TYPES[export_format],
+        headers={"Content-Disposition": f'attachment; filename="{filename}"'}
+    )
+
+
+@router.get("/operations", response_model=CardOperationsPage)
+async def find_operations(
+    correlation_id: Optional[str] = Query(None, alias="correlationId"),
+    webhook_id: Optional[str] = Query(None, alias="webhookId"),
+    cursor: Optional[str] = Query(None, description="nextCursor de la page précédente"),
+    limit: int = Query(50, ge=1, le=500),
+    db: AsyncSession = Depends(get_read_db)
+):
+    """Opérations liées à un correlationId ou à un webhookId Skaleet (un seul des deux)"""
+    if (correlation_id is None) == (webhook_id is None):
+        raise HTTPException(status_code=422, detail="Exactly one of correlationId or webhookId is required")
+    after = _after(cursor)
+    repo = CardOperationRepository(db)
+    if correlation_id is not None:
+        operations = await repo.list_by_correlation_id(correlation_id, after, limit)
+    else:
+        operations = await repo.list_by_webhook_id(webhook_id, after, limit)
+    return _page(operations, limit)
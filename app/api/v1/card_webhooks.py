@@ -1,7 +1,10 @@
 from fastapi import APIRouter, Depends, Request
+from fastapi.responses import JSONResponse
 from sqlalchemy.ext.asyncio import AsyncSession
+from app.core.config import settings
 from app.schemas.webhook import SkaleetWebhook
 from app.domain.services import CardWebhookService
+from app.domain.webhook_jobs import enqueue_webhook, notify_webhook_jobs
 from app.infra.db import get_db
 from app.utils.correlation import get_correlation_id_from_context
 import logging
@@ -30,6 +33,10 @@ async def handle_skaleet_card_webhook(
     - card.status.block_requested
     - card.status.unblock_requested
     - card.status.opposed_requested
+    
+    Avec WEBHOOK_ACK_MODE=async, le webhook est mis en file (webhookId réservé
+    dans webhook_jobs) et l'endpoint répond 202 sans attendre NI ; les workers
+    de app/domain/webhook_jobs.py le traitent ensuite.
     """
     # Récupérer le correlation_id depuis le contexte ou request.state
     correlation_id = get_correlation_id_from_context() or getattr(request.state, "correlation_id", "unknown")
@@ -45,6 +52,23 @@ async def handle_skaleet_card_webhook(
         }
     )
     
+    # Mode asynchrone : réserver le webhookId, mettre en file et acquitter tout de suite
+    if settings.webhook_ack_mode == "async" and webhook.event in CardWebhookService.SUPPORTED_EVENTS:
+        queued = await enqueue_webhook(db, webhook, correlation_id)
+        await db.commit()
+        if queued:
+            notify_webhook_jobs()
+        return JSONResponse(
+            status_code=202,
+            content={
+                "ok": True,
+                "event": webhook.event,
+                "webhookId": webhook.webhookId,
+                "accepted": True,
+                "duplicate": not queued
+            }
+        )
+    
     # Appeler le service pour traiter le webhook
     service = CardWebhookService(db)
     await service.process_card_webhook(webhook)
@@ -1,4 +1,5 @@
 from fastapi import APIRouter
+from app.infra.resilience import snapshot_guards
 
 router = APIRouter()
 
@@ -7,3 +8,11 @@ router = APIRouter()
 async def health_check():
     return {"status": "ok"}
 
+
+@router.get("/upstreams")
+async def upstreams_health():
+    """
+    État des appels sortants par endpoint (NI, Skaleet Admin) :
+    état du circuit breaker et limite de concurrence courante
+    """
+    return {"upstreams": snapshot_guards()}
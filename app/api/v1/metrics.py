@@ -0,0 +1,14 @@
+from fastapi import APIRouter
+from fastapi.responses import PlainTextResponse
+from app.core.metrics import render_metrics
+
+router = APIRouter()
+
+
+@router.get("", response_class=PlainTextResponse)
+async def metrics():
+    """
+    Histogrammes par route au format texte Prometheus : durée, nombre de requêtes
+    SQL, temps DB, temps NI / Skaleet et temps CPU par requête
+    """
+    return PlainTextResponse(render_metrics(), media_type="text/plain; version=0.0.4")
@@ -14,16 +14,123 @@ class Settings(BaseSettings):
     
     # Database
     database_url: str
+    db_pool_size: int = 10  # Connexions gardées ouvertes par process
+    db_max_overflow: int = 10  # Connexions supplémentaires temporaires en pointe
+    db_pool_timeout: float = 10.0  # Attente maximale d'une connexion libre
+    db_pool_recycle: int = 1800  # Âge maximal d'une connexion en secondes (-1 = jamais)
+    db_pool_pre_ping: bool = True  # Vérifie la connexion avant usage (coupures réseau, failover)
+    db_statement_cache_size: int = 100  # Cache asyncpg des requêtes préparées (0 derrière pgbouncer en mode transaction)
+    db_prepared_statement_cache_size: int = 100  # Cache SQLAlchemy des requêtes préparées asyncpg (0 = désactivé)
+    db_startup_mode: str = "check"  # check (warning si la base n'est pas à la révision head), strict (échec), create (create_all, dev local)
+    database_replica_url: Optional[str] = None  # Réplica en lecture (historique, exports) ; vide = tout sur le primaire
+    db_replica_max_lag: float = 5.0  # Retard de réplication au-delà duquel les lectures repartent sur le primaire
+    db_replica_lag_check_interval: float = 5.0  # Fréquence maximale de mesure du retard
+    db_replica_lag_check_timeout: float = 1.0
     
     # Skaleet Admin API
     skaleet_admin_base_url: str
     skaleet_admin_client_id: str
     skaleet_admin_client_secret: str
+    skaleet_token_default_ttl: int = 300  # Durée de vie supposée si la réponse OAuth n'a pas d'expires_in
+    skaleet_token_refresh_margin: float = 60.0  # Rafraîchissement anticipé (secondes avant expiration)
     
     # NI Processor
     ni_base_url: str
     ni_api_key: str
     ni_use_mock: bool = False  # Si True, utilise les données mockées au lieu d'appeler l'API réelle
+    ni_timeout: float = 30.0
+    
+    # Deadline de bout en bout des requêtes entrantes
+    request_deadline_seconds: float = 25.0  # 0 = pas de deadline
+    request_deadline_header: str = "X-Request-Timeout-Ms"  # Budget annoncé par l'appelant (ms)
+    request_deadline_margin: float = 0.5  # Temps réservé pour répondre
+    # Préfixes de chemins sans deadline (séparés par des virgules) : endpoints internes
+    # longs par nature (réception NDJSON des opérations en masse, exports en streaming)
+    request_deadline_exempt_paths: str = "/api/v1/internal/cards/bulk-operations,/api/v1/internal/operations/export"
+    
+    # Clients HTTP sortants (partagés, créés dans le lifespan)
+    skaleet_admin_timeout: float = 30.0
+    http_connect_timeout: float = 5.0
+    http_max_connections: int = 100
+    http_max_keepalive_connections: int = 20
+    http_keepalive_expiry: float = 30.0
+    http_http2: bool = False  # Nécessite le paquet optionnel 'h2'
+    http_prewarm_connections: int = 2  # Connexions ouvertes au démarrage par upstream (0 = désactivé)
+    
+    # Résilience des appels sortants : circuit breaker par endpoint
+    breaker_window_size: int = 50
+    breaker_min_calls: int = 10
+    breaker_failure_rate_threshold: float = 0.5
+    breaker_slow_call_threshold: float = 5.0  # Un appel plus long est compté comme lent
+    breaker_slow_call_rate_threshold: float = 0.8
+    breaker_open_duration: float = 30.0
+    breaker_half_open_max_calls: int = 3
+    
+    # Résilience des appels sortants : limite de concurrence adaptative (AIMD)
+    limiter_initial_limit: int = 20
+    limiter_min_limit: int = 2
+    limiter_max_limit: int = 100
+    limiter_latency_target: float = 2.0  # Au-delà, la limite diminue
+    limiter_decrease_factor: float = 0.7
+    limiter_queue_timeout: float = 5.0  # Attente maximale d'une place avant échec immédiat
+    
+    # Outbox des résultats Skaleet (livraison en tâche de fond)
+    outbox_workers: int = 2  # 0 = pas de livraison dans ce process
+    outbox_batch_size: int = 50
+    outbox_poll_interval: float = 1.0
+    outbox_lease_seconds: float = 60.0  # Délai avant qu'un message réservé puisse être repris
+    outbox_max_attempts: int = 10
+    outbox_backoff_base: float = 2.0
+    outbox_backoff_max: float = 600.0
+    
+    # Acquittement des webhooks carte : sync (traitement dans la requête) ou async
+    # (webhookId réservé et webhook mis en file dans webhook_jobs, réponse 202 immédiate)
+    webhook_ack_mode: str = "sync"
+    webhook_job_workers: int = 4  # Workers de la file dans ce process en mode async (0 = process dédiés)
+    webhook_job_batch_size: int = 10  # Jobs réservés par worker et traités en parallèle
+    webhook_job_poll_interval: float = 1.0  # Attente sans notification (SQLite, LISTEN indisponible)
+    webhook_job_lease_seconds: float = 120.0  # Délai avant qu'un job réservé puisse être repris
+    webhook_job_max_attempts: int = 5
+    webhook_job_backoff_base: float = 2.0
+    webhook_job_backoff_max: float = 300.0
+    webhook_job_listen: bool = True  # Réveil des workers par LISTEN/NOTIFY (PostgreSQL)
+    
+    # Opérations carte en masse (incidents : blocage / opposition de milliers de cartes)
+    bulk_max_items: int = 100000  # Nombre maximal d'opérations par job
+    bulk_insert_batch_size: int = 1000  # Lignes insérées par requête à la réception
+    bulk_workers: int = 1  # 0 = pas de traitement des jobs dans ce process
+    bulk_chunk_size: int = 100  # Opérations réservées par lot
+    bulk_ni_concurrency: int = 10  # Appels NI simultanés par worker
+    bulk_poll_interval: float = 2.0
+    bulk_lease_seconds: float = 300.0  # Délai avant qu'un lot réservé puisse être repris
+    
+    # Partitions mensuelles de card_operations (app/jobs/partitions.py)
+    partition_months_ahead: int = 3  # Partitions créées d'avance
+    partition_detach_after_months: int = 0  # Détache les partitions plus anciennes (0 = jamais)
+    partition_maintenance_interval: float = 21600.0  # Secondes entre deux passages (0 = désactivé)
+    
+    # Rétention : archivage NDJSON compressé puis purge des lignes anciennes (app/jobs/retention.py)
+    retention_days: int = 365  # Âge au-delà duquel opérations et webhooks sont archivés
+    retention_archive_dir: str = "archive"  # Stockage partagé si plusieurs instances
+    retention_batch_size: int = 1000  # Lignes lues par paquet du curseur et supprimées par transaction
+    retention_batch_pause: float = 0.2  # Pause entre deux lots de suppression
+    retention_interval: float = 0.0  # Secondes entre deux passages (0 = uniquement via la CLI)
+    
+    # Export des opérations (réconciliation NI) : lignes lues par paquet du curseur serveur
+    export_batch_size: int = 1000
+    
+    # Sérialisation des opérations par carte (app/infra/card_lock.py)
+    card_lock_advisory: bool = True  # Verrou entre workers / nœuds via pg_advisory_xact_lock (PostgreSQL)
+    card_lock_timeout: float = 30.0  # Attente maximale du verrou (bornée aussi par la deadline de la requête)
+    card_lock_slow_wait: float = 1.0  # Attente au-delà de laquelle la carte est loguée (carte "chaude")
+    # Connexions du pool dédié aux verrous consultatifs (distinct du pool principal) :
+    # une par opération en cours sous verrou entre nœuds, dans ce process
+    card_lock_pool_size: int = 50
+    
+    # Cache en mémoire de l'identité des cartes (skaleet_card_id -> id, pan_alias, status_ni)
+    card_cache_size: int = 10000  # 0 = pas de cache
+    card_cache_ttl: float = 300.0
+    card_cache_prewarm: int = 1000  # Cartes récentes chargées au démarrage (0 = désactivé)
     
     # Webhook
     webhook_secret: Optional[str] = None
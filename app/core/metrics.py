@@ -0,0 +1,362 @@
+"""
+Coût par requête et histogrammes (format texte Prometheus)
+
+Pour chaque requête HTTP, un `RequestCost` est placé dans une ContextVar et
+alimenté par :
+- les événements SQLAlchemy (before/after_cursor_execute) : nombre de requêtes
+  SQL et temps passé en base, plus les COMMIT (voir DeadlineAwareSession) ;
+- les event hooks httpx des clients partagés : temps passé à attendre NI et
+  Skaleet Admin (jusqu'à la réception des en-têtes de la réponse) ;
+- le temps CPU du thread pendant la requête. Sous concurrence, il inclut le
+  temps des autres requêtes entrelacées : c'est un majorant.
+
+Le total est ajouté à la ligne de log d'accès (logger "app.access") et
+observé dans les histogrammes exposés par GET /api/v1/metrics, une fois le
+corps de la réponse entièrement envoyé : pour une réponse en streaming
+(exports), la durée, le travail SQL et la taille couvrent toute la production
+du corps.
+"""
+import logging
+import time
+from bisect import bisect_left
+from contextvars import ContextVar
+from typing import AsyncIterator, Callable, Dict, List, Optional, Sequence, Tuple
+
+import httpx
+from fastapi import Request, Response
+from sqlalchemy import event
+from starlette.middleware.base import BaseHTTPMiddleware
+
+access_logger = logging.getLogger("app.access")
+
+
+class RequestCost:
+    """Coût cumulé d'une requête"""
+    
+    def __init__(self):
+        self.db_statements = 0
+        self.db_commits = 0
+        self.db_time = 0.0
+        self.db_pool_wait = 0.0
+        self.ni_calls = 0
+        self.ni_time = 0.0
+        self.skaleet_calls = 0
+        self.skaleet_time = 0.0
+        self.card_lock_wait = 0.0
+    
+    def add_upstream(self, upstream: str, elapsed: float):
+        """upstream: nom du client partagé ("ni" ou "skaleet_admin")"""
+        if upstream == "ni":
+            self.ni_calls += 1
+            self.ni_time += elapsed
+        else:
+            self.skaleet_calls += 1
+            self.skaleet_time += elapsed
+    
+    def as_log_fields(self) -> dict:
+        return {
+            "db_statements": self.db_statements,
+            "db_commits": self.db_commits,
+            "db_ms": round(self.db_time * 1000, 2),
+            "db_pool_wait_ms": round(self.db_pool_wait * 1000, 2),
+            "ni_calls": self.ni_calls,
+            "ni_ms": round(self.ni_time * 1000, 2),
+            "skaleet_calls": self.skaleet_calls,
+            "skaleet_ms": round(self.skaleet_time * 1000, 2),
+            "card_lock_wait_ms": round(self.card_lock_wait * 1000, 2),
+        }
+
+
+request_cost_var: ContextVar[Optional[RequestCost]] = ContextVar("request_cost", default=None)
+
+
+# ============================================================================
+# Histogrammes
+# ============================================================================
+
+class Histogram:
+    """Histogramme cumulatif à buckets fixes, avec un label optionnel"""
+    
+    def __init__(self, name: str, description: str, buckets: Sequence[float], label: str = "route"):
+        self.name = name
+        self.description = description
+        self.buckets = tuple(buckets)
+        self.label = label
+        # valeur du label -> (compteurs par bucket, somme, total)
+        self._series: Dict[str, Tuple[list, float, int]] = {}
+    
+    def observe(self, value: float, label_value: str = ""):
+        counts, total_sum, count = self._series.get(label_value, ([0] * len(self.buckets), 0.0, 0))
+        index = bisect_left(self.buckets, value)
+        if index < len(counts):
+            counts[index] += 1
+        self._series[label_value] = (counts, total_sum + value, count + 1)
+    
+    def snapshot(self, label_value: str = "") -> Optional[dict]:
+        series = self._series.get(label_value)
+        if series is None:
+            return None
+        counts, total_sum, count = series
+        return {"count": count, "sum": total_sum, "buckets": dict(zip(self.buckets, counts))}
+    
+    def render(self) -> str:
+        lines = [f"# HELP {self.name} {self.description}", f"# TYPE {self.name} histogram"]
+        for label_value, (counts, total_sum, count) in sorted(self._series.items()):
+            label = f'{self.label}="{label_value}"'
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets, counts):
+                cumulative += bucket_count
+                lines.append(f'{self.name}_bucket{{{label},le="{bound:g}"}} {cumulative}')
+            lines.append(f'{self.name}_bucket{{{label},le="+Inf"}} {count}')
+            lines.append(f"{self.name}_sum{{{label}}} {total_sum:.6f}")
+            lines.append(f"{self.name}_count{{{label}}} {count}")
+        return "\n".join(lines)
+    
+    def reset(self):
+        self._series.clear()
+
+
+_SECONDS_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+_STATEMENT_BUCKETS = (1, 2, 4, 6, 8, 10, 15, 20, 30, 50, 100)
+
+REQUEST_DURATION = Histogram("http_request_duration_seconds", "Durée des requêtes HTTP", _SECONDS_BUCKETS)
+REQUEST_DB_STATEMENTS = Histogram("http_request_db_statements", "Requêtes SQL par requête HTTP", _STATEMENT_BUCKETS)
+REQUEST_DB_SECONDS = Histogram("http_request_db_seconds", "Temps passé en base par requête HTTP", _SECONDS_BUCKETS)
+REQUEST_NI_SECONDS = Histogram("http_request_ni_seconds", "Temps d'attente de NI par requête HTTP", _SECONDS_BUCKETS)
+REQUEST_SKALEET_SECONDS = Histogram(
+    "http_request_skaleet_seconds",
+    "Temps d'attente de Skaleet Admin par requête HTTP",
+    _SECONDS_BUCKETS
+)
+REQUEST_CPU_SECONDS = Histogram(
+    "http_request_cpu_seconds",
+    "Temps CPU du thread pendant la requête HTTP (majorant)",
+    _SECONDS_BUCKETS
+)
+
+# Pools de connexions DB, par nom de pool (voir app/infra/db.py)
+DB_POOL_CHECKOUT_SECONDS = Histogram(
+    "db_pool_checkout_seconds",
+    "Temps d'obtention d'une connexion du pool (attente + ouverture)",
+    (0.0005, 0.001, 0.005) + _SECONDS_BUCKETS,
+    label="pool"
+)
+
+# Attente du verrou d'une carte (app/infra/card_lock.py) : dans le process, puis entre nœuds
+CARD_LOCK_WAIT_SECONDS = Histogram(
+    "card_lock_wait_seconds",
+    "Attente du verrou d'une carte avant son opération",
+    (0.0005, 0.001, 0.005) + _SECONDS_BUCKETS,
+    label="scope"
+)
+
+# Attente d'un webhook accepté en mode asynchrone avant son traitement (app/domain/webhook_jobs.py)
+WEBHOOK_JOB_QUEUE_SECONDS = Histogram(
+    "webhook_job_queue_seconds",
+    "Attente d'un webhook mis en file avant le début de son traitement",
+    _SECONDS_BUCKETS + (60.0, 300.0),
+    label="event"
+)
+
+HISTOGRAMS = (
+    REQUEST_DURATION,
+    REQUEST_DB_STATEMENTS,
+    REQUEST_DB_SECONDS,
+    REQUEST_NI_SECONDS,
+    REQUEST_SKALEET_SECONDS,
+    REQUEST_CPU_SECONDS,
+    DB_POOL_CHECKOUT_SECONDS,
+    CARD_LOCK_WAIT_SECONDS,
+    WEBHOOK_JOB_QUEUE_SECONDS,
+)
+
+
+# Autres métriques (caches, pools...) : fonctions qui renvoient leur rendu texte
+_COLLECTORS: List[Callable[[], str]] = []
+
+
+def register_collector(render: Callable[[], str]):
+    _COLLECTORS.append(render)
+
+
+def render_metrics() -> str:
+    """Tous les histogrammes et métriques enregistrées au format texte Prometheus"""
+    sections = [histogram.render() for histogram in HISTOGRAMS]
+    sections.extend(render() for render in _COLLECTORS)
+    return "\n".join(section for section in sections if section) + "\n"
+
+
+def reset_metrics():
+    for histogram in HISTOGRAMS:
+        histogram.reset()
+
+
+# ============================================================================
+# Instrumentation DB et HTTP
+# ============================================================================
+
+def instrument_engine(engine):
+    """Compte les requêtes SQL et leur durée dans le coût de la requête courante"""
+    sync_engine = getattr(engine, "sync_engine", engine)
+    
+    @event.listens_for(sync_engine, "before_cursor_execute")
+    def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        context._cost_start = time.perf_counter()
+    
+    @event.listens_for(sync_engine, "after_cursor_execute")
+    def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        start = getattr(context, "_cost_start", None)
+        cost = request_cost_var.get()
+        if cost is not None and start is not None:
+            cost.db_statements += 1
+            cost.db_time += time.perf_counter() - start
+
+
+def record_db_commit(elapsed: float):
+    """Les COMMIT ne passent pas par cursor_execute : ils sont mesurés par la session"""
+    cost = request_cost_var.get()
+    if cost is not None:
+        cost.db_commits += 1
+        cost.db_time += elapsed
+
+
+_pool_timeouts: Dict[str, int] = {}
+
+
+def record_pool_checkout(pool_name: str, elapsed: float, timed_out: bool = False):
+    """Temps d'obtention d'une connexion, ajouté au coût de la requête courante"""
+    DB_POOL_CHECKOUT_SECONDS.observe(elapsed, pool_name)
+    if timed_out:
+        _pool_timeouts[pool_name] = _pool_timeouts.get(pool_name, 0) + 1
+    cost = request_cost_var.get()
+    if cost is not None:
+        cost.db_pool_wait += elapsed
+
+
+def record_card_lock_wait(scope: str, elapsed: float):
+    """Attente d'un verrou de carte ("local" ou "advisory"), ajoutée au coût de la requête courante"""
+    CARD_LOCK_WAIT_SECONDS.observe(elapsed, scope)
+    cost = request_cost_var.get()
+    if cost is not None:
+        cost.card_lock_wait += elapsed
+
+
+def render_pool_gauges(pool_name: str, pool) -> str:
+    """État courant d'un QueuePool (connexions prises, disponibles, en débordement)"""
+    label = f'{{pool="{pool_name}"}}'
+    gauges = (
+        ("db_pool_size", "Taille nominale du pool", pool.size()),
+        ("db_pool_checked_out", "Connexions prises", pool.checkedout()),
+        ("db_pool_checked_in", "Connexions disponibles dans le pool", pool.checkedin()),
+        # overflow() est négatif tant que le pool n'a pas atteint sa taille nominale
+        ("db_pool_overflow", "Connexions ouvertes au-delà de la taille du pool", max(pool.overflow(), 0)),
+    )
+    lines = []
+    for name, description, value in gauges:
+        lines += [f"# HELP {name} {description}", f"# TYPE {name} gauge", f"{name}{label} {value}"]
+    lines += [
+        "# HELP db_pool_timeouts_total Attentes de connexion abandonnées (pool_timeout)",
+        "# TYPE db_pool_timeouts_total counter",
+        f"db_pool_timeouts_total{label} {_pool_timeouts.get(pool_name, 0)}",
+    ]
+    return "\n".join(lines)
+
+
+def http_cost_hooks(upstream: str) -> Dict[str, list]:
+    """Event hooks httpx qui ajoutent le temps d'attente de l'upstream au coût de la requête"""
+    async def on_request(request: httpx.Request):
+        request.extensions["cost_start"] = time.perf_counter()
+    
+    async def on_response(response: httpx.Response):
+        start = response.request.extensions.get("cost_start")
+        cost = request_cost_var.get()
+        if cost is not None and start is not None:
+            cost.add_upstream(upstream, time.perf_counter() - start)
+    
+    return {"request": [on_request], "response": [on_response]}
+
+
+# ============================================================================
+# Middleware : ligne de log d'accès + histogrammes
+# ============================================================================
+
+def _route_template(request: Request) -> str:
+    """
+    Chemin de la route avec ses paramètres (ex: /api/v1/.../{job_id}) pour limiter
+    la cardinalité des histogrammes. Le chemin de la route est relatif au préfixe
+    du router inclus : le préfixe est repris du chemin réel.
+    """
+    route = request.scope.get("route")
+    if route is None:
+        return "unmatched"
+    route_segments = [segment for segment in route.path.split("/") if segment]
+    path_segments = [segment for segment in request.url.path.split("/") if segment]
+    prefix = path_segments[:max(len(path_segments) - len(route_segments), 0)]
+    return "/" + "/".join(prefix + route_segments)
+
+
+class AccessLogMiddleware(BaseHTTPMiddleware):
+    """Écrit une ligne de log par requête avec son coût et alimente les histogrammes"""
+    
+    async def dispatch(self, request: Request, call_next: Callable) -> Response:
+        cost = RequestCost()
+        request_cost_var.set(cost)
+        start = time.perf_counter()
+        cpu_start = time.thread_time()
+        
+        try:
+            response = await call_next(request)
+        except BaseException:
+            # Une exception non gérée sera renvoyée en 500 par ServerErrorMiddleware
+            self._record(request, cost, 500, time.perf_counter() - start, time.thread_time() - cpu_start, 0)
+            raise
+        # Le corps est produit après le retour de call_next (exports en streaming
+        # notamment) : la ligne de log est écrite une fois le dernier octet envoyé
+        response.body_iterator = self._measure_body(request, response, cost, start, cpu_start)
+        return response
+    
+    def _measure_body(self, request: Request, response: Response, cost: RequestCost, start: float, cpu_start: float):
+        body_iterator = response.body_iterator
+        
+        async def measured() -> AsyncIterator[bytes]:
+            sent = 0
+            try:
+                async for chunk in body_iterator:
+                    sent += len(chunk)
+                    yield chunk
+            finally:
+                self._record(
+                    request,
+                    cost,
+                    response.status_code,
+                    time.perf_counter() - start,
+                    time.thread_time() - cpu_start,
+                    sent
+                )
+        
+        return measured()
+    
+    @staticmethod
+    def _record(request: Request, cost: RequestCost, status_code: int, duration: float, cpu_time: float, response_bytes: int):
+        route_path = _route_template(request)
+        
+        REQUEST_DURATION.observe(duration, route_path)
+        REQUEST_DB_STATEMENTS.observe(cost.db_statements + cost.db_commits, route_path)
+        REQUEST_DB_SECONDS.observe(cost.db_time, route_path)
+        REQUEST_NI_SECONDS.observe(cost.ni_time, route_path)
+        REQUEST_SKALEET_SECONDS.observe(cost.skaleet_time, route_path)
+        REQUEST_CPU_SECONDS.observe(cpu_time, route_path)
+        
+        access_logger.info(
+            f"{request.method} {request.url.path} {status_code}",
+            extra={
+                "method": request.method,
+                "path": request.url.path,
+                "route": route_path,
+                "status_code": status_code,
+                "duration_ms": round(duration * 1000, 2),
+                "cpu_ms": round(cpu_time * 1000, 2),
+                "response_bytes": response_bytes,
+                **cost.as_log_fields()
+            }
+        )
@@ -6,6 +6,7 @@ from starlette.middleware.base import BaseHTTPMiddleware
 from app.core.config import settings
 from app.utils.correlation import get_or_create_correlation_id
 from app.core.logging import correlation_id_var
+from app.utils.deadline import deadline_exempt, set_deadline, resolve_request_budget
 
 
 def verify_webhook_signature(payload: bytes, signature: str, secret: Optional[str] = None) -> bool:
@@ -25,7 +26,7 @@ def verify_webhook_signature(payload: bytes, signature: str, secret: Optional[st
 
 
 class CorrelationIdMiddleware(BaseHTTPMiddleware):
-    """Middleware pour gérer le correlation_id dans les requêtes"""
+    """Middleware pour gérer le correlation_id et la deadline des requêtes"""
     
     async def dispatch(self, request: Request, call_next: Callable) -> Response:
         # Extraire ou générer le correlation_id
@@ -37,6 +38,13 @@ class CorrelationIdMiddleware(BaseHTTPMiddleware):
         # Définir dans le contexte pour les logs
         correlation_id_var.set(correlation_id)
         
+        # Fixer la deadline de la requête (configuration ou header de l'appelant),
+        # sauf pour les endpoints internes longs par nature
+        if deadline_exempt(request.url.path):
+            set_deadline(None)
+        else:
+            set_deadline(resolve_request_budget(request.headers.get(settings.request_deadline_header)))
+        
         # Ajouter le correlation_id dans les headers de réponse
         response = await call_next(request)
         response.headers["X-Correlation-ID"] = correlation_id
@@ -0,0 +1,63 @@
+"""
+Rapport de démarrage : durée de chaque étape du lifespan
+
+Le total et le détail par étape sont logués en une ligne à la fin du
+démarrage et exposés sur GET /api/v1/metrics (app_startup_seconds,
+app_startup_stage_seconds), pour suivre le temps de démarrage à froid d'une
+version à l'autre.
+"""
+import logging
+import time
+from contextlib import contextmanager
+from typing import Dict, Optional
+
+logger = logging.getLogger(__name__)
+
+
+class StartupReport:
+    def __init__(self, started: Optional[float] = None):
+        # Début de la mesure (time.perf_counter()), par défaut la création du rapport
+        self.started = time.perf_counter() if started is None else started
+        self.stages: Dict[str, float] = {}
+        self.total: Optional[float] = None
+        self.details: Dict[str, str] = {}
+    
+    @contextmanager
+    def stage(self, name: str):
+        """Mesure une étape ; sa durée est enregistrée même si elle échoue"""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.stages[name] = time.perf_counter() - start
+    
+    def record(self, name: str, seconds: float):
+        self.stages[name] = seconds
+    
+    def finish(self) -> float:
+        self.total = time.perf_counter() - self.started
+        stages = ", ".join(f"{name}={seconds * 1000:.0f}ms" for name, seconds in self.stages.items())
+        details = "".join(f" {key}={value}" for key, value in self.details.items())
+        logger.info(f"Startup completed in {self.total * 1000:.0f}ms ({stages}){details}")
+        return self.total
+    
+    def snapshot(self) -> dict:
+        return {
+            "total_seconds": self.total,
+            "stages": dict(self.stages),
+            **self.details
+        }
+    
+    def render(self) -> str:
+        """Format texte Prometheus (vide tant que le démarrage n'est pas terminé)"""
+        if self.total is None:
+            return ""
+        lines = [
+            "# HELP app_startup_seconds Durée du démarrage (import de l'application et lifespan)",
+            "# TYPE app_startup_seconds gauge",
+            f"app_startup_seconds {self.total:.6f}",
+            "# HELP app_startup_stage_seconds Durée de chaque étape du démarrage",
+            "# TYPE app_startup_stage_seconds gauge",
+        ]
+        lines += [f'app_startup_stage_seconds{{stage="{name}"}} {seconds:.6f}' for name, seconds in self.stages.items()]
+        return "\n".join(lines)
@@ -0,0 +1,134 @@
+"""
+Traitement des opérations carte en masse (blocage / opposition lors d'un incident)
+
+Les opérations reçues par l'API sont stockées dans `bulk_operation_items`.
+Ce pool de workers les réserve par lots et les fait passer par la même logique
+que les webhooks unitaires (`CardWebhookService.process_operation`), avec au
+plus `bulk_ni_concurrency` appels NI simultanés par worker (en plus de la
+limite adaptative de la garde NI). Les résultats et les compteurs du job sont
+écrits en une transaction par lot.
+"""
+import asyncio
+import logging
+from typing import Optional
+
+from sqlalchemy.ext.asyncio import async_sessionmaker
+
+from app.core.config import settings
+from app.domain.enums import OperationSource, OperationStatus
+from app.domain.models import BulkOperationItem
+from app.domain.services import CardWebhookService
+from app.infra.db import AsyncSessionLocal
+from app.infra.repositories import BulkOperationRepository
+from app.infra.workers import PollingWorkerPool
+from app.schemas.webhook import SkaleetWebhook, SkaleetWebhookData
+
+logger = logging.getLogger(__name__)
+
+
+def bulk_webhook_id(job_id, position: int) -> str:
+    """webhookId synthétique d'une opération en masse (clé d'idempotence)"""
+    return f"bulk:{job_id}:{position}"
+
+
+class BulkOperationRunner(PollingWorkerPool):
+    name = "bulk-operations"
+    
+    def __init__(
+        self,
+        session_factory: async_sessionmaker = AsyncSessionLocal,
+        workers: Optional[int] = None,
+        chunk_size: Optional[int] = None,
+        concurrency: Optional[int] = None,
+        poll_interval: Optional[float] = None
+    ):
+        super().__init__(
+            workers if workers is not None else settings.bulk_workers,
+            poll_interval if poll_interval is not None else settings.bulk_poll_interval
+        )
+        self.session_factory = session_factory
+        self.chunk_size = chunk_size or settings.bulk_chunk_size
+        self.concurrency = concurrency or settings.bulk_ni_concurrency
+    
+    async def run_once(self) -> int:
+        """Réserve un lot d'opérations, les traite puis enregistre leurs résultats"""
+        async with self.session_factory() as session:
+            items = await BulkOperationRepository(session).claim_pending_items(
+                self.chunk_size,
+                settings.bulk_lease_seconds
+            )
+        if not items:
+            return 0
+        
+        semaphore = asyncio.Semaphore(self.concurrency)
+        errors = await asyncio.gather(
+            *(self._process(item, semaphore) for item in items),
+            return_exceptions=True
+        )
+        
+        async with self.session_factory() as session:
+            repo = BulkOperationRepository(session)
+            operations = await repo.get_operations_by_webhook_ids(
+                [bulk_webhook_id(item.job_id, item.position) for item in items]
+            )
+            results = [
+                self._result(item, operations.get(bulk_webhook_id(item.job_id, item.position)), error)
+                for item, error in zip(items, errors)
+            ]
+            await repo.record_results(results)
+            await session.commit()
+        
+        logger.info(f"Bulk operations: {len(items)} processed")
+        return len(items)
+    
+    async def _process(self, item: BulkOperationItem, semaphore: asyncio.Semaphore):
+        """Traite une opération dans sa propre session (les opérations s'exécutent en parallèle)"""
+        event = CardWebhookService.OPERATIONS[item.operation_type][0]
+        webhook_id = bulk_webhook_id(item.job_id, item.position)
+        webhook = SkaleetWebhook(
+            id=webhook_id,
+            webhookId=webhook_id,
+            type="card",
+            event=event,
+            data=SkaleetWebhookData(cardId=item.skaleet_card_id, panAlias=item.pan_alias)
+        )
+        async with semaphore:
+            async with self.session_factory() as session:
+                await CardWebhookService(session).process_operation(
+                    webhook,
+                    item.operation_type,
+                    source=OperationSource.INTERNAL.value
+                )
+    
+    @staticmethod
+    def _result(item: BulkOperationItem, operation, error: Optional[BaseException]) -> dict:
+        """
+        Résultat d'une opération, lu depuis la CardOperation : le cas d'une
+        opération déjà traitée (lot repris après un crash) est ainsi couvert
+        """
+        result = {"id": item.id, "job_id": item.job_id}
+        if operation is not None and operation.status != OperationStatus.PENDING.value:
+            result.update(
+                status=operation.status,
+                card_operation_id=operation.id,
+                ni_result_code=operation.ni_result_code
+            )
+        elif error is not None:
+            result.update(status=OperationStatus.ERROR.value, error=str(error) or type(error).__name__)
+        else:
+            # Opération interrompue avant la réponse NI : état réel de la carte inconnu
+            result.update(
+                status=OperationStatus.ERROR.value,
+                card_operation_id=operation.id if operation is not None else None,
+                error="operation interrupted before NI result"
+            )
+        return result
+
+
+# Instance partagée, démarrée dans le lifespan de l'application
+bulk_runner = BulkOperationRunner()
+
+
+def notify_bulk_runner():
+    """Réveille les workers après la création d'un job"""
+    bulk_runner.wake()
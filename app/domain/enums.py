@@ -39,3 +39,29 @@ class OperationStatus(str, Enum):
     SUCCESS = "SUCCESS"
     ERROR = "ERROR"
 
+
+
+class OutboxStatus(str, Enum):
+    """Statuts de livraison des résultats vers Skaleet Admin"""
+    PENDING = "PENDING"
+    DELIVERED = "DELIVERED"
+    DEAD = "DEAD"
+
+
+class WebhookJobStatus(str, Enum):
+    """Statuts d'un webhook carte mis en file (WEBHOOK_ACK_MODE=async)"""
+    PENDING = "PENDING"
+    DONE = "DONE"
+    DEAD = "DEAD"
+
+
+class BulkJobStatus(str, Enum):
+    """Statuts d'un job d'opérations carte en masse"""
+    RUNNING = "RUNNING"
+    COMPLETED = "COMPLETED"
+
+
+class ExportFormat(str, Enum):
+    """Formats d'export des opérations (app/domain/exports.py)"""
+    NDJSON = "ndjson"
+    CSV = "csv"
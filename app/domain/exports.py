@@ -0,0 +1,124 @@
+"""
+Export des opérations carte (réconciliation NI) en NDJSON ou CSV, gzip en option
+
+Les lignes sont lues via un curseur serveur (yield_per) par paquets de
+`export_batch_size`, encodées puis émises paquet par paquet : la mémoire
+utilisée ne dépend pas du nombre de lignes exportées. Utilisé par
+GET /api/v1/internal/operations/export et par app/jobs/export_operations.py.
+"""
+import csv
+import io
+import json
+import uuid
+import zlib
+from datetime import datetime
+from typing import AsyncIterator, Optional
+
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.core.config import settings
+from app.domain.enums import ExportFormat
+from app.domain.models import Card, CardOperation
+from app.utils.deadline import detached_deadline
+
+# Colonnes exportées, dans l'ordre du CSV. Pas de numéro de carte NI (ni_card_ref)
+# ni de webhook brut : l'extrait ne contient que de quoi rapprocher les opérations
+EXPORT_COLUMNS = (
+    CardOperation.id.label("operation_id"),
+    Card.skaleet_card_id,
+    Card.pan_alias,
+    CardOperation.operation_type,
+    CardOperation.source,
+    CardOperation.status,
+    CardOperation.ni_result_code,
+    CardOperation.skaleet_event,
+    CardOperation.skaleet_event_id,
+    CardOperation.skaleet_webhook_id,
+    CardOperation.correlation_id,
+    CardOperation.created_at,
+)
+EXPORT_FIELDS = tuple(column.key for column in EXPORT_COLUMNS)
+
+MEDIA_TYPES = {
+    ExportFormat.NDJSON: "application/x-ndjson",
+    ExportFormat.CSV: "text/csv",
+}
+
+
+def export_query(
+    date_from: Optional[datetime] = None,
+    date_to: Optional[datetime] = None,
+    operation_type: Optional[str] = None,
+    status: Optional[str] = None
+):
+    """Opérations créées dans [date_from, date_to[, dans l'ordre chronologique"""
+    query = select(*EXPORT_COLUMNS).join(Card, Card.id == CardOperation.card_id)
+    if date_from is not None:
+        query = query.where(CardOperation.created_at >= date_from)
+    if date_to is not None:
+        query = query.where(CardOperation.created_at < date_to)
+    if operation_type is not None:
+        query = query.where(CardOperation.operation_type == operation_type)
+    if status is not None:
+        query = query.where(CardOperation.status == status)
+    return query.order_by(CardOperation.created_at, CardOperation.id)
+
+
+def _value(value):
+    if isinstance(value, datetime):
+        return value.isoformat()
+    if isinstance(value, uuid.UUID):
+        return str(value)
+    return value
+
+
+def _encode_ndjson(rows) -> bytes:
+    return "".join(
+        json.dumps({field: _value(row[field]) for field in EXPORT_FIELDS}, ensure_ascii=False) + "\n"
+        for row in rows
+    ).encode()
+
+
+def _encode_csv(rows, header: bool = False) -> bytes:
+    buffer = io.StringIO()
+    writer = csv.writer(buffer, lineterminator="\n")
+    if header:
+        writer.writerow(EXPORT_FIELDS)
+    writer.writerows([_value(row[field]) for field in EXPORT_FIELDS] for row in rows)
+    return buffer.getvalue().encode()
+
+
+async def iter_export(
+    session: AsyncSession,
+    query,
+    export_format: ExportFormat = ExportFormat.NDJSON,
+    compress: bool = False,
+    batch_size: Optional[int] = None
+) -> AsyncIterator[bytes]:
+    """Contenu de l'export, par morceaux (un paquet de lignes du curseur par morceau)"""
+    # Format gzip (wbits=31) : le flux obtenu est un fichier .gz valide
+    compressor = zlib.compressobj(wbits=31) if compress else None
+    
+    def emit(data: bytes) -> bytes:
+        return compressor.compress(data) if compressor else data
+    
+    if export_format == ExportFormat.CSV:
+        yield emit(_encode_csv([], header=True))
+    
+    # Un export dure plus longtemps que le budget d'une requête : seul
+    # l'ouverture du curseur passe par la session, sans deadline
+    with detached_deadline():
+        result = await session.stream(query.execution_options(yield_per=batch_size or settings.export_batch_size))
+    async for rows in result.mappings().partitions():
+        chunk = emit(_encode_ndjson(rows) if export_format == ExportFormat.NDJSON else _encode_csv(rows))
+        if chunk:
+            yield chunk
+    
+    if compressor:
+        yield compressor.flush()
+
+
+def export_filename(export_format: ExportFormat, compress: bool, date_from: Optional[datetime] = None) -> str:
+    suffix = f"_{date_from:%Y%m%d}" if date_from else ""
+    return f"card_operations{suffix}.{export_format.value}{'.gz' if compress else ''}"
@@ -1,17 +1,20 @@
-from sqlalchemy import Column, String, DateTime, JSON, Boolean, Integer, ForeignKey, Text, Index
+from sqlalchemy import Column, String, DateTime, JSON, Boolean, Integer, ForeignKey, Text, Index, text
 from sqlalchemy.orm import relationship
-from sqlalchemy.dialects.postgresql import UUID
-from app.infra.db import Base
+from sqlalchemy.dialects.postgresql import UUID, JSONB
+from app.infra.db import Base, json_path_text
 from datetime import datetime
 import uuid
 
+# JSONB sous PostgreSQL (stockage binaire, indexable), JSON ailleurs (tests SQLite)
+JSONDocument = JSON().with_variant(JSONB(), "postgresql")
+
 
 class Card(Base):
     """Modèle représentant une carte dans le système"""
     __tablename__ = "cards"
     
     id = Column(UUID(as_uuid=True), primary_key=True, default=uuid.uuid4)
-    skaleet_card_id = Column(Integer, nullable=False, index=True)
+    skaleet_card_id = Column(Integer, nullable=False)
     pan_alias = Column(String, unique=True, nullable=True)
     ni_card_ref = Column(String, nullable=True)
     status_skaleet = Column(String, nullable=False)
@@ -24,7 +27,8 @@ class Card(Base):
     operations = relationship("CardOperation", back_populates="card", cascade="all, delete-orphan")
     
     __table_args__ = (
-        Index('idx_skaleet_card_id', 'skaleet_card_id'),
+        # Une seule carte par cardId Skaleet (voir CardRepository.get_or_create)
+        Index('idx_skaleet_card_id', 'skaleet_card_id', unique=True),
     )
 
 
@@ -33,7 +37,7 @@ class CardOperation(Base):
     __tablename__ = "card_operations"
     
     id = Column(UUID(as_uuid=True), primary_key=True, default=uuid.uuid4)
-    card_id = Column(UUID(as_uuid=True), ForeignKey("cards.id", ondelete="CASCADE"), nullable=False, index=True)
+    card_id = Column(UUID(as_uuid=True), ForeignKey("cards.id", ondelete="CASCADE"), nullable=False)
     operation_type = Column(String, nullable=False)
     source = Column(String, nullable=False)  # SKA, NI, INTERNAL
     status = Column(String, nullable=False)  # PENDING, SUCCESS, ERROR
@@ -42,16 +46,42 @@ class CardOperation(Base):
     skaleet_webhook_id = Column(String, nullable=True)
     ni_result_code = Column(String, nullable=True)
     correlation_id = Column(String, nullable=True, index=True)
-    raw_webhook = Column(JSON, nullable=True)  # PostgreSQL supporte JSON nativement
-    created_at = Column(DateTime, default=datetime.utcnow, nullable=False)
+    raw_webhook = Column(JSONDocument, nullable=True)
+    # Clé de partition (partitions mensuelles sous PostgreSQL) : fait partie de la clé primaire
+    created_at = Column(DateTime, primary_key=True, default=datetime.utcnow, nullable=False)
     
     # Relation avec la carte
     card = relationship("Card", back_populates="operations")
     
     __table_args__ = (
-        Index('idx_card_id', 'card_id'),
+        # Historique par carte, pagination par (created_at, id) : CardOperationRepository.list_by_card
+        Index('idx_card_operations_card_created', 'card_id', 'created_at', 'id'),
         Index('idx_correlation_id', 'correlation_id'),
         Index('idx_created_at', 'created_at'),
+        # Unicité du webhookId portée par webhook_claims (voir WebhookClaim)
+        Index('idx_card_operations_webhook_id', 'skaleet_webhook_id'),
+        # Recherches support dans les webhooks reçus (CardOperationRepository.find_by_webhook_field)
+        Index('idx_card_operations_webhook_pan_alias', json_path_text(raw_webhook, 'data', 'panAlias')),
+        Index('idx_card_operations_webhook_account_id', json_path_text(raw_webhook, 'data', 'accountId')),
+        # Partitions mensuelles créées par app/jobs/partitions.py
+        {'postgresql_partition_by': 'RANGE (created_at)'},
+    )
+
+
+class WebhookClaim(Base):
+    """
+    Réservation d'un webhookId Skaleet (voir mark_webhook_started).
+    card_operations étant partitionnée par created_at, un index unique sur le
+    seul webhookId y est impossible : l'unicité est portée par cette table.
+    """
+    __tablename__ = "webhook_claims"
+    
+    skaleet_webhook_id = Column(String, primary_key=True)
+    card_operation_id = Column(UUID(as_uuid=True), nullable=False)
+    created_at = Column(DateTime, default=datetime.utcnow, nullable=False)
+    
+    __table_args__ = (
+        Index('idx_webhook_claims_created_at', 'created_at'),
     )
 
 
@@ -65,6 +95,140 @@ class WebhookEvent(Base):
     processed = Column(Boolean, default=False)
     created_at = Column(DateTime, default=datetime.utcnow)
     processed_at = Column(DateTime, nullable=True)
-    payload = Column(JSON, nullable=True)
-    response = Column(JSON, nullable=True)
+    payload = Column(JSONDocument, nullable=True)
+    response = Column(JSONDocument, nullable=True)
+    
+    __table_args__ = (
+        # Recherche par inclusion (payload @> {...}) : WebhookRepository.find_events_by_payload
+        Index(
+            'idx_webhook_events_payload',
+            payload,
+            postgresql_using='gin',
+            postgresql_ops={'payload': 'jsonb_path_ops'}
+        ),
+    )
+
 
+class SkaleetResultOutbox(Base):
+    """
+    Outbox des résultats d'opérations à transmettre à Skaleet Admin.
+    Écrite dans la même transaction que le statut de la CardOperation,
+    puis livrée hors du chemin de la requête par app/domain/outbox.py
+    """
+    __tablename__ = "skaleet_result_outbox"
+    
+    id = Column(UUID(as_uuid=True), primary_key=True, default=uuid.uuid4)
+    # Pas de clé étrangère : la livraison ne dépend pas de la rétention des opérations
+    card_operation_id = Column(UUID(as_uuid=True), nullable=True)
+    skaleet_card_id = Column(Integer, nullable=False)
+    operation_type = Column(String, nullable=False)
+    result = Column(String, nullable=False)  # accept, error
+    payload = Column(JSONDocument, nullable=True)  # visa_card_number, ni_details
+    status = Column(String, nullable=False)  # PENDING, DELIVERED, DEAD
+    attempts = Column(Integer, nullable=False, default=0)
+    next_attempt_at = Column(DateTime, default=datetime.utcnow, nullable=False)
+    last_error = Column(Text, nullable=True)
+    created_at = Column(DateTime, default=datetime.utcnow, nullable=False)
+    delivered_at = Column(DateTime, nullable=True)
+    
+    __table_args__ = (
+        Index(
+            'idx_outbox_pending_next_attempt',
+            'next_attempt_at',
+            postgresql_where=text("status = 'PENDING'"),
+            sqlite_where=text("status = 'PENDING'")
+        ),
+        # Recherche support par niCardId (CardOperationRepository.find_by_ni_card_id)
+        Index('idx_outbox_ni_card_id', json_path_text(payload, 'ni_details', 'niCardId')),
+    )
+
+
+class WebhookJob(Base):
+    """
+    Webhook carte accepté en mode asynchrone (WEBHOOK_ACK_MODE=async), traité
+    ensuite par app/domain/webhook_jobs.py. L'index unique sur le webhookId
+    réserve celui-ci dès la réception : un retry Skaleet n'ajoute pas de travail.
+    """
+    __tablename__ = "webhook_jobs"
+    
+    id = Column(UUID(as_uuid=True), primary_key=True, default=uuid.uuid4)
+    skaleet_webhook_id = Column(String, nullable=False)
+    skaleet_card_id = Column(Integer, nullable=False)
+    event = Column(String, nullable=False)
+    payload = Column(JSONDocument, nullable=False)  # Corps du webhook validé
+    correlation_id = Column(String, nullable=True)
+    status = Column(String, nullable=False)  # PENDING, DONE, DEAD
+    attempts = Column(Integer, nullable=False, default=0)
+    next_attempt_at = Column(DateTime, default=datetime.utcnow, nullable=False)
+    last_error = Column(Text, nullable=True)
+    created_at = Column(DateTime, default=datetime.utcnow, nullable=False)
+    finished_at = Column(DateTime, nullable=True)
+    
+    __table_args__ = (
+        Index('idx_webhook_jobs_webhook_id', 'skaleet_webhook_id', unique=True),
+        # Jobs à traiter, dans l'ordre d'arrivée (WebhookJobRepository.claim_due_batch)
+        Index(
+            'idx_webhook_jobs_pending_next_attempt',
+            'next_attempt_at',
+            postgresql_where=text("status = 'PENDING'"),
+            sqlite_where=text("status = 'PENDING'")
+        ),
+        # Purge des jobs terminés (app/jobs/retention.py)
+        Index('idx_webhook_jobs_created_at', 'created_at'),
+    )
+
+
+class BulkOperationJob(Base):
+    """Job d'opérations carte en masse (ex: blocage de milliers de cartes lors d'un incident)"""
+    __tablename__ = "bulk_operation_jobs"
+    
+    id = Column(UUID(as_uuid=True), primary_key=True, default=uuid.uuid4)
+    status = Column(String, nullable=False)  # RUNNING, COMPLETED
+    total_items = Column(Integer, nullable=False, default=0)
+    processed_items = Column(Integer, nullable=False, default=0)
+    succeeded_items = Column(Integer, nullable=False, default=0)
+    failed_items = Column(Integer, nullable=False, default=0)
+    correlation_id = Column(String, nullable=True)
+    created_at = Column(DateTime, default=datetime.utcnow, nullable=False)
+    finished_at = Column(DateTime, nullable=True)
+    
+    __table_args__ = (
+        # Ordre de traitement des jobs (claim_pending_items)
+        Index('idx_bulk_jobs_created_at', 'created_at', 'id'),
+    )
+
+
+class BulkOperationItem(Base):
+    """
+    Opération d'un job en masse. Chaque ligne est traitée comme un webhook
+    Skaleet dont le webhookId est `bulk:{job_id}:{position}` : l'idempotence
+    repose sur les mêmes tables que les webhooks unitaires.
+    """
+    __tablename__ = "bulk_operation_items"
+    
+    id = Column(UUID(as_uuid=True), primary_key=True, default=uuid.uuid4)
+    job_id = Column(UUID(as_uuid=True), ForeignKey("bulk_operation_jobs.id", ondelete="CASCADE"), nullable=False)
+    position = Column(Integer, nullable=False)  # Rang dans la liste reçue (à partir de 1)
+    skaleet_card_id = Column(Integer, nullable=False)
+    pan_alias = Column(String, nullable=True)
+    operation_type = Column(String, nullable=False)
+    status = Column(String, nullable=False)  # PENDING, SUCCESS, ERROR
+    leased_until = Column(DateTime, nullable=True)
+    # Pas de clé étrangère : le résultat reste lisible même après purge des opérations
+    card_operation_id = Column(UUID(as_uuid=True), nullable=True)
+    ni_result_code = Column(String, nullable=True)
+    error = Column(Text, nullable=True)
+    processed_at = Column(DateTime, nullable=True)
+    
+    __table_args__ = (
+        Index('idx_bulk_items_job_position', 'job_id', 'position', unique=True),
+        # Opérations à traiter, dans l'ordre de réservation (claim_pending_items) :
+        # le parcours se limite aux lignes PENDING, le bail est filtré au passage
+        Index(
+            'idx_bulk_items_pending_position',
+            'job_id',
+            'position',
+            postgresql_where=text("status = 'PENDING'"),
+            sqlite_where=text("status = 'PENDING'")
+        ),
+    )
@@ -0,0 +1,126 @@
+"""
+Livraison des résultats d'opérations à Skaleet Admin depuis l'outbox
+
+Les résultats (accept / error) sont écrits dans `skaleet_result_outbox` dans la
+même transaction que le statut de la CardOperation. Ce pool de workers les
+livre hors du chemin de la requête : par lots, avec backoff exponentiel
+"jittered" en cas d'échec et passage en DEAD après `outbox_max_attempts`.
+"""
+import asyncio
+import logging
+import random
+from datetime import datetime, timedelta
+from typing import Optional
+
+import httpx
+from sqlalchemy.ext.asyncio import async_sessionmaker
+
+from app.core.config import settings
+from app.domain.models import SkaleetResultOutbox
+from app.infra.db import AsyncSessionLocal
+from app.infra.repositories import OutboxRepository
+from app.infra.skaleet_client import send_card_operation_result
+from app.infra.workers import PollingWorkerPool
+
+logger = logging.getLogger(__name__)
+
+# Erreurs HTTP 4xx qui méritent malgré tout un nouvel essai
+_RETRYABLE_CLIENT_ERRORS = {408, 425, 429}
+
+
+def compute_backoff(attempts: int, base: Optional[float] = None, maximum: Optional[float] = None) -> float:
+    """Délai avant le prochain essai : exponentiel plafonné, avec jitter (réglages de l'outbox par défaut)"""
+    base = settings.outbox_backoff_base if base is None else base
+    maximum = settings.outbox_backoff_max if maximum is None else maximum
+    delay = min(maximum, base * (2 ** max(attempts - 1, 0)))
+    return random.uniform(delay / 2, delay)
+
+
+def is_retryable(error: Exception) -> bool:
+    """Une erreur 4xx (hors 408/425/429) ne se corrigera pas en réessayant"""
+    if isinstance(error, httpx.HTTPStatusError):
+        status_code = error.response.status_code
+        return status_code >= 500 or status_code in _RETRYABLE_CLIENT_ERRORS
+    return True
+
+
+class OutboxDispatcher(PollingWorkerPool):
+    name = "skaleet-outbox"
+    
+    def __init__(
+        self,
+        session_factory: async_sessionmaker = AsyncSessionLocal,
+        sender=send_card_operation_result,
+        workers: Optional[int] = None,
+        batch_size: Optional[int] = None,
+        poll_interval: Optional[float] = None
+    ):
+        super().__init__(
+            workers if workers is not None else settings.outbox_workers,
+            poll_interval if poll_interval is not None else settings.outbox_poll_interval
+        )
+        self.session_factory = session_factory
+        self.sender = sender
+        self.batch_size = batch_size or settings.outbox_batch_size
+    
+    async def run_once(self) -> int:
+        """Réserve un lot de messages dus et les livre en parallèle"""
+        async with self.session_factory() as session:
+            messages = await OutboxRepository(session).claim_due_batch(
+                self.batch_size,
+                settings.outbox_lease_seconds
+            )
+        if not messages:
+            return 0
+        
+        results = await asyncio.gather(
+            *(self._deliver(message) for message in messages),
+            return_exceptions=True
+        )
+        
+        async with self.session_factory() as session:
+            repo = OutboxRepository(session)
+            delivered = []
+            for message, result in zip(messages, results):
+                if not isinstance(result, Exception):
+                    delivered.append(message.id)
+                    continue
+                await repo.mark_failed(message.id, str(result), self._next_attempt_at(message, result))
+            await repo.mark_delivered(delivered)
+            await session.commit()
+        
+        return len(messages)
+    
+    async def _deliver(self, message: SkaleetResultOutbox):
+        payload = message.payload or {}
+        await self.sender(
+            message.skaleet_card_id,
+            message.operation_type,
+            message.result,
+            visa_card_number=payload.get("visa_card_number"),
+            ni_details=payload.get("ni_details")
+        )
+    
+    def _next_attempt_at(self, message: SkaleetResultOutbox, error: Exception) -> Optional[datetime]:
+        if not is_retryable(error) or message.attempts >= settings.outbox_max_attempts:
+            logger.error(
+                f"Skaleet result moved to dead letter: outbox_id={message.id}, "
+                f"card_id={message.skaleet_card_id}, operation={message.operation_type}, "
+                f"attempts={message.attempts}, error={error}"
+            )
+            return None
+        delay = compute_backoff(message.attempts)
+        logger.warning(
+            f"Skaleet result delivery failed (attempt {message.attempts}), retry in {delay:.1f}s: "
+            f"outbox_id={message.id}, error={error}"
+        )
+        return datetime.utcnow() + timedelta(seconds=delay)
+
+
+# Instance partagée, démarrée dans le lifespan de l'application
+outbox_dispatcher = OutboxDispatcher()
+
+
+def notify_outbox():
+    """Réveille les workers de l'outbox après l'écriture d'un nouveau résultat"""
+    outbox_dispatcher.wake()
@@ -1,33 +1,69 @@
 from sqlalchemy.ext.asyncio import AsyncSession
 from app.schemas.webhook import WebhookRequest, SkaleetWebhook, SkaleetCardEvent
-from app.infra.repositories import WebhookRepository, CardRepository, CardOperationRepository
-from app.infra.skaleet_client import SkaleetClient, send_card_operation_result
+from app.infra.repositories import WebhookRepository, CardRepository, CardOperationRepository, OutboxRepository
+from app.infra.skaleet_client import SkaleetClient
+from app.domain.outbox import notify_outbox
+from app.core.logging import correlation_id_var
+from app.utils.deadline import detached_deadline
 from app.infra.ni_client import NIClient
+from app.infra.card_cache import card_cache
+from app.infra.card_lock import card_locks
 from app.domain.enums import WebhookEventType, OperationType, OperationSource, OperationStatus
 from app.utils.idempotency import (
     check_card_operation_idempotency,
-    is_webhook_processed,
+    find_claimed_operation,
     mark_webhook_started,
     mark_webhook_finished
 )
+from typing import Optional
 import logging
 
 logger = logging.getLogger(__name__)
 
 
+class OperationNotResumable(Exception):
+    """Le webhookId est réservé mais son opération est introuvable : rien à reprendre"""
+    
+    def __init__(self, webhook_id: str):
+        super().__init__(f"Webhook {webhook_id} is claimed but its operation cannot be found")
+        self.webhook_id = webhook_id
+
+
 class CardWebhookService:
-    def __init__(self, db: AsyncSession):
+    # Par type d'opération : événement Skaleet, méthode NIClient et statut NI en cas de succès
+    OPERATIONS = {
+        OperationType.CARD_ACTIVATION.value: (SkaleetCardEvent.ACTIVATION_REQUESTED.value, "activate_card_in_ni", "ACTIVE"),
+        OperationType.CARD_BLOCKING.value: (SkaleetCardEvent.BLOCK_REQUESTED.value, "block_card_in_ni", "BLOCKED"),
+        OperationType.CARD_UNBLOCKING.value: (SkaleetCardEvent.UNBLOCK_REQUESTED.value, "unblock_card_in_ni", "ACTIVE"),
+        OperationType.CARD_OPPOSITION.value: (SkaleetCardEvent.OPPOSED_REQUESTED.value, "oppose_card_in_ni", "OPPOSED"),
+    }
+    # Événements traités par _handle_operation (les autres sont acquittés sans traitement)
+    SUPPORTED_EVENTS = frozenset(event for event, _, _ in OPERATIONS.values())
+    
+    def __init__(
+        self,
+        db: AsyncSession,
+        ni_client: Optional[NIClient] = None,
+        skaleet_client: Optional[SkaleetClient] = None,
+        resume_pending: bool = False
+    ):
         self.db = db
+        # Retries des jobs (mode async) : une opération déjà réservée mais restée
+        # PENDING est reprise au lieu d'être considérée comme traitée
+        self.resume_pending = resume_pending
         self.webhook_repo = WebhookRepository(db)
         self.card_repo = CardRepository(db)
         self.card_operation_repo = CardOperationRepository(db)
-        self.skaleet_client = SkaleetClient()
-        self.ni_client = NIClient()
+        self.outbox_repo = OutboxRepository(db)
+        # Les clients reposent sur les clients HTTP partagés (voir app/infra/http_clients.py)
+        self.skaleet_client = skaleet_client or SkaleetClient()
+        self.ni_client = ni_client or NIClient()
     
     async def process_webhook(self, webhook_data: WebhookRequest, correlation_id: str):
         try:
             # Enregistrer l'événement
             await self.webhook_repo.create_event(webhook_data, correlation_id)
+            await self.db.commit()
             
             # Traiter selon le type d'événement
             if webhook_data.event_type == WebhookEventType.CARD_CREATED:
@@ -43,6 +79,7 @@ class CardWebhookService:
             
             # Marquer comme traité
             await self.webhook_repo.mark_as_processed(webhook_data.id, result)
+            await self.db.commit()
             
             return result
         except Exception as e:
@@ -125,7 +162,7 @@ class CardWebhookService:
                 return await self._handle_block(webhook, card_id, pan_alias, webhook_id, event)
             elif event == SkaleetCardEvent.UNBLOCK_REQUESTED.value:
                 return await self._handle_unblock(webhook, card_id, pan_alias, webhook_id, event)
-            elif event == "card.status.opposed_requested":
+            elif event == SkaleetCardEvent.OPPOSED_REQUESTED.value:
                 return await self._handle_oppose(webhook, card_id, pan_alias, webhook_id, event)
             else:
                 logger.warning(f"Event type {event} not yet implemented")
@@ -139,6 +176,29 @@ class CardWebhookService:
             logger.error(f"Error processing card webhook: {e}", exc_info=True)
             raise
     
+    async def process_operation(
+        self,
+        webhook: SkaleetWebhook,
+        operation_type: str,
+        source: str = OperationSource.SKA.value
+    ) -> dict:
+        """
+        Traite une opération carte hors webhook Skaleet (ex: opérations en masse),
+        avec la même logique et la même idempotence que les webhooks unitaires
+        """
+        _, ni_method_name, success_status = self.OPERATIONS[operation_type]
+        return await self._handle_operation(
+            webhook,
+            webhook.data.cardId,
+            webhook.data.panAlias,
+            webhook.webhookId,
+            webhook.event,
+            operation_type,
+            getattr(self.ni_client, ni_method_name),
+            success_status,
+            source=source
+        )
+    
     async def _handle_operation(
         self,
         webhook: SkaleetWebhook,
@@ -148,107 +208,163 @@ class CardWebhookService:
         event: str,
         operation_type: str,
         ni_method,
-        success_status: str
+        success_status: str,
+        source: str = OperationSource.SKA.value
     ) -> dict:
         """
         Handler générique pour traiter une opération carte
         """
-        # 1. Vérifier l'idempotence basée sur webhookId
-        if await is_webhook_processed(self.db, webhook_id):
-            logger.info(f"Webhook {webhook_id} already processed (idempotent)")
+        # Opérations d'une même carte exécutées l'une après l'autre (ordre d'arrivée
+        # vers NI), y compris entre workers ; les autres cartes restent parallèles
+        async with card_locks.hold(card_id, self.db.bind):
+            # 1. Transaction 1 (avant NI) : carte + réservation du webhook, un seul commit.
+            # Les valeurs générées (id, dates) sont des défauts côté client : elles
+            # sont connues sans refresh() après le commit
+            try:
+                # Identité de la carte depuis le cache, sinon upsert en une seule requête
+                # (pan_alias complété s'il manquait)
+                card = await self.card_repo.resolve(card_id, pan_alias)
+                
+                # 2. Réserver le webhook (webhook_claims) et créer la CardOperation PENDING ;
+                # la clé primaire des réservations garantit l'idempotence, y compris
+                # entre retries concurrents
+                operation = await mark_webhook_started(
+                    self.db,
+                    webhook_id,
+                    card.id,
+                    operation_type,
+                    event,
+                    webhook.id,
+                    source=source,
+                    raw_webhook=webhook.model_dump(),
+                    correlation_id=correlation_id_var.get() or None
+                )
+                if operation is None and self.resume_pending:
+                    operation = await self._resumable_operation(webhook_id)
+                await self.db.commit()
+            except Exception:
+                # Une carte créée dans la transaction annulée ne doit pas rester en cache
+                card_cache.invalidate(card_id)
+                raise
+            
+            if operation is None:
+                logger.info(f"Webhook {webhook_id} already processed (idempotent)")
+                return {
+                    "cardId": card_id,
+                    "event": event,
+                    "ni_success": False,
+                    "idempotent": True,
+                    "message": "Webhook already processed"
+                }
+            
+            # 3. Appeler NI
+            ni_response = await ni_method(card_id, pan_alias)
+            ni_success = ni_response.success
+            
+            # Extraire le numéro VISA de la réponse NI (si disponible)
+            visa_card_number = None
+            ni_details = None
+            if ni_response.details:
+                visa_card_number = ni_response.details.get("visaCardNumber") or ni_response.details.get("panNumber")
+                ni_details = ni_response.details
+            
+            # 4. Traiter la réponse NI
+            # Le résultat NI est déjà obtenu : il est enregistré même si le budget
+            # de la requête est épuisé, pour ne pas perdre l'état réel de la carte
+            with detached_deadline():
+                try:
+                    await self._record_ni_result(
+                        card,
+                        operation,
+                        card_id,
+                        operation_type,
+                        ni_response,
+                        success_status,
+                        visa_card_number,
+                        ni_details
+                    )
+                except Exception:
+                    card_cache.invalidate(card_id)
+                    raise
+            
+            # La livraison à Skaleet se fait hors du chemin de la requête
+            notify_outbox()
+            
+            logger.info(f"{operation_type} processed for card {card_id}: NI success={ni_success}")
+            
             return {
                 "cardId": card_id,
                 "event": event,
-                "ni_success": False,
-                "idempotent": True,
-                "message": "Webhook already processed"
+                "ni_success": ni_success
             }
-        
-        # 2. Créer ou récupérer la carte
-        card = await self.card_repo.get_or_create(card_id, pan_alias)
-        if pan_alias and not card.pan_alias:
-            card.pan_alias = pan_alias
-            await self.db.commit()
-            await self.db.refresh(card)
-        
-        # 3. Marquer le webhook comme démarré (créer CardOperation avec PENDING)
-        operation = await mark_webhook_started(
-            self.db,
-            webhook_id,
-            card_id,
-            operation_type,
-            event,
-            webhook.id
-        )
-        
-        # Ajouter le raw_webhook à l'opération
-        operation.raw_webhook = webhook.dict()
-        await self.db.commit()
-        await self.db.refresh(operation)
-        
-        # 4. Appeler NI
-        ni_response = await ni_method(card_id, pan_alias)
-        ni_success = ni_response.success
-        
-        # Extraire le numéro VISA de la réponse NI (si disponible)
-        visa_card_number = None
-        ni_details = None
-        if ni_response.details:
-            visa_card_number = ni_response.details.get("visaCardNumber") or ni_response.details.get("panNumber")
-            ni_details = ni_response.details
-        
-        # 5. Traiter la réponse NI
-        if ni_success:
-            # Mettre à jour Card.status_ni
-            await self.card_repo.update_status_ni(card.id, success_status)
+    
+    async def _resumable_operation(self, webhook_id: str):
+        """
+        Opération d'un webhook déjà réservé, à reprendre si elle est restée PENDING.
+        Sous le verrou de la carte, une opération PENDING n'est plus en cours :
+        la tentative précédente a échoué ou s'est arrêtée entre la réservation et
+        l'enregistrement du résultat NI. None si l'opération est déjà terminée
+        """
+        operation = await find_claimed_operation(self.db, webhook_id)
+        if operation is None:
+            raise OperationNotResumable(webhook_id)
+        if operation.status != OperationStatus.PENDING.value:
+            return None
+        logger.warning(f"Resuming pending operation {operation.id} for webhook {webhook_id}")
+        return operation
+    
+    async def _record_ni_result(
+        self,
+        card,
+        operation,
+        card_id: int,
+        operation_type: str,
+        ni_response,
+        success_status: str,
+        visa_card_number: str | None,
+        ni_details: dict | None
+    ):
+        """
+        Enregistre le résultat NI (carte, opération, outbox Skaleet) dans la
+        transaction 2, validée par un seul commit
+        """
+        if ni_response.success:
+            # Mettre à jour Card.status_ni (et le numéro VISA s'il est connu)
+            await self.card_repo.update_status_ni(card.id, success_status, ni_card_ref=visa_card_number)
             
-            # Si on a un numéro VISA, le sauvegarder dans la base
-            if visa_card_number and hasattr(card, 'ni_card_ref'):
-                card.ni_card_ref = visa_card_number
-                await self.db.commit()
-                await self.db.refresh(card)
+            # Résultat à transmettre à Skaleet Admin (avec le numéro VISA),
+            # validé dans la même transaction que le statut de l'opération
+            self.outbox_repo.enqueue(
+                operation.id,
+                card_id,
+                operation_type,
+                "accept",
+                visa_card_number=visa_card_number,
+                ni_details=ni_details
+            )
             
             # Marquer le webhook comme terminé avec SUCCESS
             await mark_webhook_finished(
                 self.db,
                 operation.id,
                 OperationStatus.SUCCESS.value,
-                ni_result_code=ni_response.status
+                ni_result_code=ni_response.status,
+                created_at=operation.created_at
             )
-            
-            # Appeler Skaleet Admin avec le numéro VISA
-            try:
-                await send_card_operation_result(
-                    card_id, 
-                    operation_type, 
-                    "accept",
-                    visa_card_number=visa_card_number,
-                    ni_details=ni_details
-                )
-            except Exception as e:
-                logger.error(f"Error sending result to Skaleet: {e}", exc_info=True)
         else:
+            # Résultat en erreur à transmettre à Skaleet Admin
+            self.outbox_repo.enqueue(operation.id, card_id, operation_type, "error")
+            
             # Marquer le webhook comme terminé avec ERROR
             await mark_webhook_finished(
                 self.db,
                 operation.id,
                 OperationStatus.ERROR.value,
-                ni_result_code=ni_response.status
+                ni_result_code=ni_response.status,
+                created_at=operation.created_at
             )
-            
-            # Appeler Skaleet Admin avec erreur
-            try:
-                await send_card_operation_result(card_id, operation_type, "error")
-            except Exception as e:
-                logger.error(f"Error sending error result to Skaleet: {e}", exc_info=True)
         
-        logger.info(f"{operation_type} processed for card {card_id}: NI success={ni_success}")
-        
-        return {
-            "cardId": card_id,
-            "event": event,
-            "ni_success": ni_success
-        }
+        await self.db.commit()
     
     async def _handle_activation(
         self,
@@ -0,0 +1,186 @@
+"""
+Traitement asynchrone des webhooks carte (WEBHOOK_ACK_MODE=async)
+
+L'endpoint valide le webhook, réserve son webhookId en l'insérant dans
+`webhook_jobs` (ON CONFLICT DO NOTHING) et répond 202 sans attendre NI : les
+timeouts Skaleet ne se transforment plus en retries. Ce pool de workers réserve
+les jobs par lots (SELECT ... FOR UPDATE SKIP LOCKED, bail sur next_attempt_at)
+et les traite avec la même logique que le mode synchrone
+(`CardWebhookService.process_card_webhook`, puis `_handle_operation`).
+Un job repris après un échec survenu une fois le webhook réservé (timeout NI,
+arrêt avant l'enregistrement du résultat) reprend l'opération restée PENDING ;
+si l'opération réservée est introuvable, le job passe directement en DEAD.
+
+Les workers tournent dans l'API (`webhook_job_workers`) ou dans des process
+dédiés (app/jobs/webhook_worker.py), sur un ou plusieurs nœuds. Sous
+PostgreSQL, l'insertion d'un job notifie le canal `webhook_jobs`
+(LISTEN/NOTIFY) : les workers en attente sont réveillés sans attendre
+`webhook_job_poll_interval`, qui reste le filet de sécurité.
+"""
+import asyncio
+import logging
+from datetime import datetime, timedelta
+from typing import Dict, Optional
+
+from sqlalchemy import text
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker
+
+from app.core.config import settings
+from app.core.logging import correlation_id_var
+from app.core.metrics import WEBHOOK_JOB_QUEUE_SECONDS, register_collector
+from app.domain.models import WebhookJob
+from app.domain.outbox import compute_backoff
+from app.domain.services import CardWebhookService, OperationNotResumable
+from app.infra.db import AsyncSessionLocal
+from app.infra.repositories import WebhookJobRepository
+from app.infra.workers import PollingWorkerPool
+from app.schemas.webhook import SkaleetWebhook
+
+logger = logging.getLogger(__name__)
+
+NOTIFY_CHANNEL = "webhook_jobs"
+
+
+async def enqueue_webhook(session: AsyncSession, webhook: SkaleetWebhook, correlation_id: Optional[str] = None) -> bool:
+    """
+    Met le webhook en file dans la transaction en cours (pas de commit) ;
+    False si son webhookId a déjà été reçu. La notification PostgreSQL n'est
+    délivrée qu'au commit, donc jamais avant que le job soit visible
+    """
+    queued = await WebhookJobRepository(session).enqueue(webhook, correlation_id)
+    if queued and session.bind.dialect.name == "postgresql":
+        await session.execute(text("SELECT pg_notify(:channel, '')"), {"channel": NOTIFY_CHANNEL})
+    return queued
+
+
+class WebhookJobRunner(PollingWorkerPool):
+    name = "webhook-jobs"
+    
+    def __init__(
+        self,
+        session_factory: async_sessionmaker = AsyncSessionLocal,
+        workers: Optional[int] = None,
+        batch_size: Optional[int] = None,
+        poll_interval: Optional[float] = None,
+        listen: Optional[bool] = None
+    ):
+        if workers is None:
+            workers = settings.webhook_job_workers if settings.webhook_ack_mode == "async" else 0
+        super().__init__(
+            workers,
+            poll_interval if poll_interval is not None else settings.webhook_job_poll_interval
+        )
+        self.session_factory = session_factory
+        self.batch_size = batch_size or settings.webhook_job_batch_size
+        self.listen = settings.webhook_job_listen if listen is None else listen
+        self.results: Dict[str, int] = {"done": 0, "retry": 0, "dead": 0}
+        self._listen_connection = None
+    
+    async def start(self):
+        await super().start()
+        if self.running and self.listen:
+            await self._start_listening()
+    
+    async def stop(self):
+        await self._stop_listening()
+        await super().stop()
+    
+    async def _start_listening(self):
+        """LISTEN sur une connexion dédiée (asyncpg) ; sans elle, les workers interrogent la file"""
+        engine = self.session_factory.kw.get("bind")
+        if engine is None or engine.dialect.name != "postgresql":
+            return
+        try:
+            self._listen_connection = await engine.connect()
+            raw = await self._listen_connection.get_raw_connection()
+            await raw.driver_connection.add_listener(NOTIFY_CHANNEL, self._on_notify)
+            logger.info(f"{self.name}: listening on channel {NOTIFY_CHANNEL}")
+        except Exception as e:
+            logger.warning(f"⚠️ {self.name}: LISTEN {NOTIFY_CHANNEL} impossible, polling only: {e}")
+            await self._stop_listening()
+    
+    async def _stop_listening(self):
+        connection, self._listen_connection = self._listen_connection, None
+        if connection is None:
+            return
+        try:
+            raw = await connection.get_raw_connection()
+            await raw.driver_connection.remove_listener(NOTIFY_CHANNEL, self._on_notify)
+        except Exception:
+            pass
+        await connection.close()
+    
+    def _on_notify(self, connection, pid, channel, payload):
+        self.wake()
+    
+    async def run_once(self) -> int:
+        """Réserve un lot de jobs, les traite en parallèle puis enregistre leur issue"""
+        async with self.session_factory() as session:
+            jobs = await WebhookJobRepository(session).claim_due_batch(
+                self.batch_size,
+                settings.webhook_job_lease_seconds
+            )
+        if not jobs:
+            return 0
+        
+        results = await asyncio.gather(*(self._process(job) for job in jobs), return_exceptions=True)
+        
+        async with self.session_factory() as session:
+            repo = WebhookJobRepository(session)
+            done = []
+            for job, result in zip(jobs, results):
+                if not isinstance(result, Exception):
+                    done.append(job.id)
+                    continue
+                await repo.mark_failed(job.id, str(result) or type(result).__name__, self._next_attempt_at(job, result))
+            await repo.mark_done(done)
+            await session.commit()
+        self.results["done"] += len(done)
+        
+        return len(jobs)
+    
+    async def _process(self, job: WebhookJob):
+        """Traite un job dans sa propre session, sous le correlation_id de la requête d'origine"""
+        if job.attempts == 1:
+            WEBHOOK_JOB_QUEUE_SECONDS.observe((datetime.utcnow() - job.created_at).total_seconds(), job.event)
+        token = correlation_id_var.set(job.correlation_id or "")
+        try:
+            async with self.session_factory() as session:
+                service = CardWebhookService(session, resume_pending=True)
+                await service.process_card_webhook(SkaleetWebhook.model_validate(job.payload))
+        finally:
+            correlation_id_var.reset(token)
+    
+    def _next_attempt_at(self, job: WebhookJob, error: Exception) -> Optional[datetime]:
+        if job.attempts >= settings.webhook_job_max_attempts or isinstance(error, OperationNotResumable):
+            self.results["dead"] += 1
+            logger.error(
+                f"Webhook job moved to dead letter: webhookId={job.skaleet_webhook_id}, "
+                f"card_id={job.skaleet_card_id}, event={job.event}, attempts={job.attempts}, error={error}"
+            )
+            return None
+        self.results["retry"] += 1
+        delay = compute_backoff(job.attempts, settings.webhook_job_backoff_base, settings.webhook_job_backoff_max)
+        logger.warning(
+            f"Webhook job failed (attempt {job.attempts}), retry in {delay:.1f}s: "
+            f"webhookId={job.skaleet_webhook_id}, error={error}"
+        )
+        return datetime.utcnow() + timedelta(seconds=delay)
+    
+    def render(self) -> str:
+        lines = [
+            "# HELP webhook_jobs_processed_total Jobs de webhook traités par ce process, par issue",
+            "# TYPE webhook_jobs_processed_total counter",
+        ]
+        lines.extend(f'webhook_jobs_processed_total{{result="{result}"}} {count}' for result, count in self.results.items())
+        return "\n".join(lines)
+
+
+# Instance partagée, démarrée dans le lifespan de l'application (ou par app/jobs/webhook_worker.py)
+webhook_job_runner = WebhookJobRunner()
+register_collector(webhook_job_runner.render)
+
+
+def notify_webhook_jobs():
+    """Réveille les workers de ce process après la mise en file d'un webhook"""
+    webhook_job_runner.wake()
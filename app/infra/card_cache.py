@@ -0,0 +1,140 @@
+"""
+Cache en mémoire de l'identité des cartes : skaleet_card_id -> id, pan_alias, status_ni
+
+Chaque webhook commence par résoudre la carte ; le trafic se concentre sur les
+cartes actives récemment. Ce cache LRU borné (avec TTL) évite l'aller-retour DB
+correspondant. Il est :
+- alimenté par l'upsert des cartes et par la mise à jour du statut NI ;
+- invalidé par les autres écritures et par l'annulation d'une transaction ;
+- optionnellement préchauffé au démarrage avec les cartes modifiées le plus récemment.
+
+L'id et le pan_alias d'une carte ne changent plus une fois renseignés : seul
+status_ni peut être en retard sur la base (écrit par un autre process), dans
+la limite du TTL.
+"""
+import time
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Callable, Optional
+import uuid
+
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.core.config import settings
+from app.core.metrics import register_collector
+from app.domain.models import Card
+
+@dataclass(frozen=True)
+class CardIdentity:
+    id: uuid.UUID
+    skaleet_card_id: int
+    pan_alias: Optional[str] = None
+    status_ni: Optional[str] = None
+    
+    @classmethod
+    def from_card(cls, card: Card) -> "CardIdentity":
+        return cls(card.id, card.skaleet_card_id, card.pan_alias, card.status_ni)
+
+
+class CardIdentityCache:
+    """Cache LRU + TTL, non partagé entre process (un par worker)"""
+    
+    def __init__(self, max_size: int, ttl: float, clock: Callable[[], float] = time.monotonic):
+        self.max_size = max_size
+        self.ttl = ttl
+        self.clock = clock
+        # skaleet_card_id -> (identité, date d'expiration)
+        self._entries: "OrderedDict[int, tuple]" = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+    
+    @property
+    def enabled(self) -> bool:
+        return self.max_size > 0
+    
+    @property
+    def hit_ratio(self) -> float:
+        lookups = self.hits + self.misses
+        return self.hits / lookups if lookups else 0.0
+    
+    def get(self, skaleet_card_id: int, record_stats: bool = True) -> Optional[CardIdentity]:
+        """
+        Identité en cache, None si absente ou expirée. record_stats=False pour
+        les lectures hors du chemin des webhooks (endpoints de support) : elles
+        ne faussent ni les hits / misses ni le taux de hit
+        """
+        if not self.enabled:
+            return None
+        entry = self._entries.get(skaleet_card_id)
+        if entry is None or entry[1] <= self.clock():
+            if entry is not None:
+                del self._entries[skaleet_card_id]
+            if record_stats:
+                self.misses += 1
+            return None
+        self._entries.move_to_end(skaleet_card_id)
+        if record_stats:
+            self.hits += 1
+        return entry[0]
+    
+    def put(self, identity: CardIdentity):
+        if not self.enabled:
+            return
+        self._entries[identity.skaleet_card_id] = (identity, self.clock() + self.ttl)
+        self._entries.move_to_end(identity.skaleet_card_id)
+        while len(self._entries) > self.max_size:
+            self._entries.popitem(last=False)
+    
+    def invalidate(self, skaleet_card_id: int):
+        self._entries.pop(skaleet_card_id, None)
+    
+    def clear(self):
+        self._entries.clear()
+        self.hits = 0
+        self.misses = 0
+    
+    async def prewarm(self, session: AsyncSession, limit: int) -> int:
+        """Charge les `limit` cartes modifiées le plus récemment"""
+        if not self.enabled or limit <= 0:
+            return 0
+        result = await session.execute(
+            select(Card.id, Card.skaleet_card_id, Card.pan_alias, Card.status_ni)
+            .order_by(Card.updated_at.desc())
+            .limit(min(limit, self.max_size))
+        )
+        # Ordre inverse : les cartes les plus récentes sont les dernières évincées
+        rows = list(result.all())
+        for row in reversed(rows):
+            self.put(CardIdentity(*row))
+        return len(rows)
+    
+    def snapshot(self) -> dict:
+        return {
+            "size": len(self._entries),
+            "max_size": self.max_size,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_ratio": round(self.hit_ratio, 4),
+        }
+    
+    def render(self) -> str:
+        """Compteurs au format texte Prometheus (voir app/core/metrics.py)"""
+        return "\n".join([
+            "# HELP card_cache_hits_total Résolutions de carte servies par le cache",
+            "# TYPE card_cache_hits_total counter",
+            f"card_cache_hits_total {self.hits}",
+            "# HELP card_cache_misses_total Résolutions de carte envoyées à la base",
+            "# TYPE card_cache_misses_total counter",
+            f"card_cache_misses_total {self.misses}",
+            "# HELP card_cache_entries Cartes présentes dans le cache",
+            "# TYPE card_cache_entries gauge",
+            f"card_cache_entries {len(self._entries)}",
+            "# HELP card_cache_hit_ratio Part des résolutions de carte servies par le cache",
+            "# TYPE card_cache_hit_ratio gauge",
+            f"card_cache_hit_ratio {self.hit_ratio:.4f}",
+        ])
+
+
+card_cache = CardIdentityCache(settings.card_cache_size, settings.card_cache_ttl)
+register_collector(card_cache.render)
@@ -0,0 +1,202 @@
+"""
+Sérialisation des opérations par carte (skaleet_card_id)
+
+Deux webhooks concurrents pour la même carte (ex: blocage et déblocage) ne
+doivent pas atteindre NI dans un ordre quelconque : une opération de carte
+(réservation du webhook, appel NI, enregistrement du résultat) s'exécute sous
+le verrou de sa carte.
+- Dans le process : un verrou asyncio par carte, créé à la demande et supprimé
+  dès qu'il n'est plus utilisé (cas courant, sans aller-retour DB).
+- Entre workers et nœuds (PostgreSQL) : pg_advisory_xact_lock(namespace, cardId)
+  pris dans une transaction ouverte pendant toute l'opération. Il est libéré à
+  la fin de la transaction, y compris si la connexion est perdue.
+
+La session de l'opération valide plusieurs transactions (avant et après NI) et
+rend sa connexion au pool entre les deux : le verrou ne peut pas vivre sur
+elle. Il est pris sur une connexion d'un petit pool dédié (card_lock_pool_size
+connexions, sans débordement), jamais sur le pool principal : une opération
+qui attend le verrou ne retient aucune connexion dont un détenteur aurait
+besoin. Seul ce chemin est plafonné (une connexion dédiée par opération en
+cours) ; sans verrou consultatif, rien ne limite les opérations simultanées.
+
+Les opérations sur des cartes différentes restent parallèles. Le temps
+d'attente est mesuré (card_lock_wait_seconds, card_lock_wait_ms dans le log
+d'accès) ; une attente supérieure à card_lock_slow_wait est loguée avec le
+cardId pour repérer les cartes "chaudes".
+"""
+import asyncio
+import logging
+import time
+from contextlib import asynccontextmanager
+from typing import Dict, Optional
+
+from sqlalchemy import exc, text
+from sqlalchemy.ext.asyncio import AsyncEngine, create_async_engine
+
+from app.core.config import settings
+from app.core.metrics import record_card_lock_wait, register_collector
+from app.infra.db import engine_options, instrument_pool
+from app.utils.deadline import bounded_timeout
+
+logger = logging.getLogger(__name__)
+
+# Espace de clés des verrous consultatifs à deux entiers : (namespace, skaleet_card_id).
+# Il ne recoupe pas celui des verrous à une clé bigint (partitions, rétention)
+ADVISORY_NAMESPACE = 0x43415244  # "CARD"
+
+# lock_not_available : lock_timeout atteint
+_LOCK_NOT_AVAILABLE = "55P03"
+
+
+class CardLockTimeout(Exception):
+    """Le verrou de la carte n'a pas été obtenu dans card_lock_timeout"""
+    status = "card_lock_timeout"
+    
+    def __init__(self, skaleet_card_id: int):
+        super().__init__(f"Timed out waiting for the lock of card {skaleet_card_id}")
+        self.skaleet_card_id = skaleet_card_id
+
+
+class _KeyedLock:
+    __slots__ = ("lock", "users")
+    
+    def __init__(self):
+        self.lock = asyncio.Lock()
+        # Détenteur + coroutines en attente : le verrou est supprimé à 0
+        self.users = 0
+
+
+class CardLockManager:
+    def __init__(
+        self,
+        advisory: Optional[bool] = None,
+        timeout: Optional[float] = None,
+        slow_wait: Optional[float] = None,
+        pool_size: Optional[int] = None
+    ):
+        self.advisory = settings.card_lock_advisory if advisory is None else advisory
+        self.timeout = settings.card_lock_timeout if timeout is None else timeout
+        self.slow_wait = settings.card_lock_slow_wait if slow_wait is None else slow_wait
+        self.pool_size = max(1, settings.card_lock_pool_size if pool_size is None else pool_size)
+        # Une connexion du pool dédié par verrou consultatif tenu : attente bornée par le timeout du verrou
+        self._connections = asyncio.Semaphore(self.pool_size)
+        self._in_flight = 0
+        self._locks: Dict[int, _KeyedLock] = {}
+        self._lock_engines: Dict[AsyncEngine, AsyncEngine] = {}
+    
+    @property
+    def active_cards(self) -> int:
+        """Cartes dont le verrou est pris ou attendu dans ce process"""
+        return len(self._locks)
+    
+    @property
+    def in_flight(self) -> int:
+        """Opérations de carte en cours sous verrou dans ce process"""
+        return self._in_flight
+    
+    def _uses_advisory(self, engine: Optional[AsyncEngine]) -> bool:
+        return self.advisory and engine is not None and engine.dialect.name == "postgresql"
+    
+    def _lock_engine(self, engine: AsyncEngine) -> AsyncEngine:
+        """Engine dédié aux verrous consultatifs, sur la même base que `engine`"""
+        lock_engine = self._lock_engines.get(engine)
+        if lock_engine is None:
+            url = engine.url.render_as_string(hide_password=False)
+            lock_engine = create_async_engine(
+                url,
+                **engine_options(url, pool_name="card_lock", pool_size=self.pool_size, max_overflow=0)
+            )
+            instrument_pool(lock_engine, "card_lock")
+            self._lock_engines[engine] = lock_engine
+        return lock_engine
+    
+    async def close(self):
+        """Ferme les connexions dédiées aux verrous (arrêt du process)"""
+        lock_engines, self._lock_engines = list(self._lock_engines.values()), {}
+        for lock_engine in lock_engines:
+            await lock_engine.dispose()
+    
+    @asynccontextmanager
+    async def hold(self, skaleet_card_id: int, engine: Optional[AsyncEngine] = None):
+        """
+        Exécute le bloc sous le verrou de la carte : dans le process, puis entre
+        nœuds sur la base de `engine` (celle de la session qui traite l'opération)
+        """
+        start = time.perf_counter()
+        entry = self._locks.get(skaleet_card_id)
+        if entry is None:
+            entry = self._locks[skaleet_card_id] = _KeyedLock()
+        entry.users += 1
+        try:
+            timeout = bounded_timeout(self.timeout, "card_lock")
+            try:
+                await asyncio.wait_for(entry.lock.acquire(), timeout)
+            except asyncio.TimeoutError:
+                raise CardLockTimeout(skaleet_card_id)
+            try:
+                self._in_flight += 1
+                try:
+                    record_card_lock_wait("local", time.perf_counter() - start)
+                    if not self._uses_advisory(engine):
+                        self._check_slow_wait(skaleet_card_id, start)
+                        yield
+                        return
+                    
+                    # Une connexion libre du pool dédié, dans le même délai
+                    remaining = max(timeout - (time.perf_counter() - start), 0.0)
+                    try:
+                        await asyncio.wait_for(self._connections.acquire(), remaining)
+                    except asyncio.TimeoutError:
+                        raise CardLockTimeout(skaleet_card_id)
+                    try:
+                        async with self._lock_engine(engine).connect() as connection:
+                            async with connection.begin():
+                                await self._advisory_lock(connection, skaleet_card_id)
+                                self._check_slow_wait(skaleet_card_id, start)
+                                yield
+                    finally:
+                        self._connections.release()
+                finally:
+                    self._in_flight -= 1
+            finally:
+                entry.lock.release()
+        finally:
+            entry.users -= 1
+            if entry.users == 0:
+                self._locks.pop(skaleet_card_id, None)
+    
+    async def _advisory_lock(self, connection, skaleet_card_id: int):
+        start = time.perf_counter()
+        timeout_ms = max(int(bounded_timeout(self.timeout, "card_lock") * 1000), 1)
+        # Attente bornée côté serveur : échec propre plutôt qu'une annulation de requête
+        await connection.execute(text(f"SET LOCAL lock_timeout = {timeout_ms}"))
+        try:
+            await connection.execute(
+                text("SELECT pg_advisory_xact_lock(:namespace, :card_id)"),
+                {"namespace": ADVISORY_NAMESPACE, "card_id": skaleet_card_id}
+            )
+        except exc.DBAPIError as e:
+            if getattr(e.orig, "sqlstate", None) == _LOCK_NOT_AVAILABLE or "lock timeout" in str(e):
+                raise CardLockTimeout(skaleet_card_id) from e
+            raise
+        finally:
+            record_card_lock_wait("advisory", time.perf_counter() - start)
+    
+    def _check_slow_wait(self, skaleet_card_id: int, start: float):
+        waited = time.perf_counter() - start
+        if waited >= self.slow_wait:
+            logger.warning(f"Card {skaleet_card_id} lock acquired after {waited * 1000:.0f}ms (hot card)")
+    
+    def render(self) -> str:
+        return "\n".join([
+            "# HELP card_locks_active Cartes dont le verrou est pris ou attendu dans ce process",
+            "# TYPE card_locks_active gauge",
+            f"card_locks_active {self.active_cards}",
+            "# HELP card_locks_in_flight Opérations de carte en cours sous verrou dans ce process",
+            "# TYPE card_locks_in_flight gauge",
+            f"card_locks_in_flight {self.in_flight}",
+        ])
+
+
+card_locks = CardLockManager()
+register_collector(card_locks.render)
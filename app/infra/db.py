@@ -1,36 +1,413 @@
-from sqlalchemy.ext.asyncio import create_async_engine, AsyncSession, async_sessionmaker
+from sqlalchemy.ext.asyncio import create_async_engine, AsyncEngine, AsyncSession, async_sessionmaker
 from sqlalchemy.orm import declarative_base
+import re
+from sqlalchemy import String, exc, literal_column, text
+from sqlalchemy.ext.compiler import compiles
+from sqlalchemy.sql.functions import FunctionElement
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy.pool import AsyncAdaptedQueuePool, QueuePool
 from app.core.config import settings
-from typing import AsyncGenerator
+from app.core.metrics import (
+    instrument_engine,
+    record_db_commit,
+    record_pool_checkout,
+    register_collector,
+    render_pool_gauges,
+)
+from app.utils.deadline import DeadlineExceeded, check_deadline, detached_deadline, remaining
+from alembic.config import Config
+from alembic.script import ScriptDirectory
+from pathlib import Path
+from typing import AsyncGenerator, Optional, Set
+import asyncio
+import logging
+import time
+
+logger = logging.getLogger(__name__)
+
+# query_canceled : requête interrompue par statement_timeout
+_QUERY_CANCELED = "57014"
+
+
+def async_url(url: str) -> str:
+    """Convertir postgresql:// en postgresql+asyncpg:// pour SQLAlchemy async"""
+    if url.startswith("postgresql://"):
+        return url.replace("postgresql://", "postgresql+asyncpg://", 1)
+    return url
+
+
+database_url = async_url(settings.database_url)
+
+class InstrumentedQueuePool(AsyncAdaptedQueuePool):
+    """
+    Pool de connexions qui mesure le temps d'obtention de chaque connexion
+    (attente d'une connexion libre, ouverture, pre-ping) : voir app/core/metrics.py
+    """
+    
+    def connect(self):
+        start = time.perf_counter()
+        timed_out = False
+        try:
+            return super().connect()
+        except exc.TimeoutError:
+            timed_out = True
+            raise
+        finally:
+            record_pool_checkout(self._orig_logging_name or "primary", time.perf_counter() - start, timed_out)
+
+
+def engine_options(
+    url: str,
+    pool_name: str = "primary",
+    pool_size: Optional[int] = None,
+    max_overflow: Optional[int] = None
+) -> dict:
+    """Options de l'engine : pool de connexions et caches de requêtes préparées asyncpg"""
+    options = {"echo": settings.debug, "future": True}
+    if url.startswith("sqlite") and ":memory:" in url:
+        # Base en mémoire : une seule connexion possible, pas de pool à régler
+        return options
+    options.update(
+        poolclass=InstrumentedQueuePool,
+        pool_logging_name=pool_name,
+        pool_size=settings.db_pool_size if pool_size is None else pool_size,
+        max_overflow=settings.db_max_overflow if max_overflow is None else max_overflow,
+        pool_timeout=settings.db_pool_timeout,
+        pool_recycle=settings.db_pool_recycle,
+        pool_pre_ping=settings.db_pool_pre_ping
+    )
+    if url.startswith("postgresql+asyncpg://"):
+        options["connect_args"] = {
+            "statement_cache_size": settings.db_statement_cache_size,
+            "prepared_statement_cache_size": settings.db_prepared_statement_cache_size
+        }
+    return options
+
+
+def instrument_pool(engine, pool_name: str = "primary"):
+    """Expose l'état du pool de l'engine sur /api/v1/metrics"""
+    def render() -> str:
+        if not isinstance(engine.pool, QueuePool):
+            return ""
+        return render_pool_gauges(pool_name, engine.pool)
+    
+    register_collector(render)
 
-# Convertir postgresql:// en postgresql+asyncpg:// pour SQLAlchemy async
-database_url = settings.database_url
-if database_url.startswith("postgresql://"):
-    database_url = database_url.replace("postgresql://", "postgresql+asyncpg://", 1)
 
 # Créer l'engine async
-engine = create_async_engine(
-    database_url,
-    echo=settings.debug,
-    future=True
-)
+engine = create_async_engine(database_url, **engine_options(database_url))
+instrument_pool(engine)
+
+# Nombre de requêtes SQL et temps DB par requête HTTP (voir app/core/metrics.py)
+instrument_engine(engine)
+
+# Réplica en lecture (optionnel) : historique, exports, recherches support.
+# Le chemin d'écriture des webhooks reste sur le primaire
+replica_url = async_url(settings.database_replica_url) if settings.database_replica_url else None
+replica_engine = create_async_engine(replica_url, **engine_options(replica_url, pool_name="replica")) if replica_url else None
+if replica_engine is not None:
+    instrument_pool(replica_engine, "replica")
+    instrument_engine(replica_engine)
+
+
+class DeadlineAwareSession(AsyncSession):
+    """
+    Session qui respecte la deadline de la requête (voir app/utils/deadline.py)
+    sans jamais annuler un aller-retour DB en cours : le budget est vérifié
+    avant chaque étape et, sous PostgreSQL, imposé par le serveur avec
+    SET LOCAL statement_timeout (remis à jour quand le budget restant est
+    nettement plus court que la valeur en vigueur). Un COMMIT commencé va
+    toujours à son terme. Sans deadline dans le contexte, rien ne change.
+    """
+    
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        # statement_timeout (ms) fixé dans la transaction en cours, None = aucun
+        self._statement_timeout_ms: Optional[int] = None
+    
+    async def _apply_deadline(self, stage: str) -> bool:
+        """Vérifie le budget avant une étape ; retourne True si une deadline s'applique"""
+        budget = remaining()
+        if budget is not None and budget <= 0:
+            raise DeadlineExceeded(stage)
+        if self.bind is None or self.bind.dialect.name != "postgresql":
+            return budget is not None
+        if not self.in_transaction():
+            # Nouvelle transaction : les SET LOCAL de la précédente ne s'appliquent plus
+            self._statement_timeout_ms = None
+        if budget is None:
+            # Bloc détaché (detached_deadline) dans une transaction bornée plus tôt
+            if self._statement_timeout_ms:
+                await super().execute(text("SET LOCAL statement_timeout = 0"))
+                self._statement_timeout_ms = 0
+            return False
+        timeout_ms = max(int(budget * 1000), 1)
+        current = self._statement_timeout_ms
+        if not current or current > timeout_ms + settings.request_deadline_margin * 1000:
+            await super().execute(text(f"SET LOCAL statement_timeout = {timeout_ms}"))
+            self._statement_timeout_ms = timeout_ms
+        return True
+    
+    async def _within_deadline(self, call, stage: str, *args, **kwargs):
+        bounded = await self._apply_deadline(stage)
+        try:
+            return await call(*args, **kwargs)
+        except exc.DBAPIError as e:
+            # query_canceled : statement_timeout atteint
+            if bounded and getattr(e.orig, "sqlstate", None) == _QUERY_CANCELED:
+                raise DeadlineExceeded(stage) from e
+            raise
+    
+    async def execute(self, *args, **kwargs):
+        return await self._within_deadline(super().execute, "db.execute", *args, **kwargs)
+    
+    async def scalar(self, *args, **kwargs):
+        return await self._within_deadline(super().scalar, "db.execute", *args, **kwargs)
+    
+    async def scalars(self, *args, **kwargs):
+        return await self._within_deadline(super().scalars, "db.execute", *args, **kwargs)
+    
+    async def get(self, *args, **kwargs):
+        return await self._within_deadline(super().get, "db.get", *args, **kwargs)
+    
+    async def flush(self, *args, **kwargs):
+        return await self._within_deadline(super().flush, "db.flush", *args, **kwargs)
+    
+    async def refresh(self, *args, **kwargs):
+        return await self._within_deadline(super().refresh, "db.refresh", *args, **kwargs)
+    
+    async def commit(self):
+        # Vérifié avant, jamais pendant : un COMMIT annulé côté client peut aboutir
+        # côté serveur alors que l'appelant reçoit une erreur
+        check_deadline("db.commit")
+        start = time.perf_counter()
+        try:
+            return await super().commit()
+        finally:
+            self._statement_timeout_ms = None
+            record_db_commit(time.perf_counter() - start)
+
+
+def dialect_insert(session: AsyncSession, table):
+    """
+    INSERT propre au dialecte de la session (PostgreSQL en production, SQLite en
+    test), pour disposer de on_conflict_do_nothing / on_conflict_do_update
+    """
+    if session.bind.dialect.name == "sqlite":
+        return sqlite.insert(table)
+    return postgresql.insert(table)
+
+
+_JSON_KEY = re.compile(r"^[A-Za-z_][A-Za-z0-9_]*$")
+
+
+class json_path_text(FunctionElement):
+    """
+    Valeur texte d'un champ JSON : json_path_text(Model.payload, "data", "panAlias").
+    Les clés sont des littéraux (jamais des paramètres) pour que la requête et
+    l'index d'expression correspondant produisent exactement la même expression
+    PostgreSQL, condition pour que le planner utilise l'index.
+    """
+    type = String()
+    name = "json_path_text"
+    inherit_cache = True
+    
+    def __init__(self, column, *path: str):
+        for key in path:
+            if not _JSON_KEY.match(key):
+                raise ValueError(f"Invalid JSON key: {key!r}")
+        super().__init__(column, *(literal_column(f"'{key}'") for key in path))
+
+
+@compiles(json_path_text, "postgresql")
+def _json_path_text_postgresql(element, compiler, **kw):
+    column, *keys = [compiler.process(clause, **kw) for clause in element.clauses]
+    expression = column
+    for key in keys[:-1]:
+        expression = f"({expression} -> {key})"
+    return f"({expression} ->> {keys[-1]})"
+
+
+@compiles(json_path_text, "sqlite")
+def _json_path_text_sqlite(element, compiler, **kw):
+    column, *keys = list(element.clauses)
+    path = ".".join(key.name.strip("'") for key in keys)
+    return f"json_extract({compiler.process(column, **kw)}, '$.{path}')"
+
 
 # Créer la session factory async
 AsyncSessionLocal = async_sessionmaker(
     engine,
-    class_=AsyncSession,
+    class_=DeadlineAwareSession,
     expire_on_commit=False,
     autocommit=False,
     autoflush=False
 )
 
+ReplicaSessionLocal = async_sessionmaker(
+    replica_engine,
+    class_=DeadlineAwareSession,
+    expire_on_commit=False,
+    autocommit=False,
+    autoflush=False
+) if replica_engine is not None else None
+
 Base = declarative_base()
 
 
-async def init_db():
-    """Initialise la base de données (création des tables)"""
-    async with engine.begin() as conn:
-        await conn.run_sync(Base.metadata.create_all)
+# Retard du réplica : nul s'il a rejoué tout le WAL reçu (un primaire inactif
+# ne fait pas vieillir pg_last_xact_replay_timestamp), NULL sur un primaire
+_REPLICA_LAG_QUERY = text("""
+    SELECT CASE
+        WHEN pg_last_wal_receive_lsn() = pg_last_wal_replay_lsn() THEN 0
+        ELSE EXTRACT(EPOCH FROM now() - pg_last_xact_replay_timestamp())
+    END
+""")
+
+
+class ReplicaLagGuard:
+    """
+    Autorise les lectures sur le réplica tant que son retard de réplication
+    reste sous `max_lag` secondes. Le retard est mesuré au plus toutes les
+    `check_interval` secondes ; un réplica en retard, injoignable ou trop lent
+    à répondre renvoie les lectures vers le primaire.
+    """
+    
+    def __init__(
+        self,
+        replica: Optional[AsyncEngine],
+        max_lag: Optional[float] = None,
+        check_interval: Optional[float] = None,
+        check_timeout: Optional[float] = None
+    ):
+        self.replica = replica
+        self.max_lag = settings.db_replica_max_lag if max_lag is None else max_lag
+        self.check_interval = settings.db_replica_lag_check_interval if check_interval is None else check_interval
+        self.check_timeout = settings.db_replica_lag_check_timeout if check_timeout is None else check_timeout
+        self.lag: Optional[float] = None
+        self.fallbacks = 0
+        self._checked_at: Optional[float] = None
+        self._lock = asyncio.Lock()
+    
+    async def _query_lag(self) -> float:
+        async with self.replica.connect() as conn:
+            if conn.dialect.name != "postgresql":
+                return 0.0
+            return float(await conn.scalar(_REPLICA_LAG_QUERY) or 0.0)
+    
+    async def measure_lag(self) -> Optional[float]:
+        """Retard en secondes (None si le réplica ne répond pas dans check_timeout)"""
+        try:
+            return await asyncio.wait_for(self._query_lag(), self.check_timeout)
+        except Exception as e:
+            logger.warning(f"⚠️ Replica lag check failed, reads go to the primary: {e!r}")
+            return None
+    
+    async def available(self) -> bool:
+        if self.replica is None:
+            return False
+        if self._checked_at is None or time.monotonic() - self._checked_at >= self.check_interval:
+            async with self._lock:
+                if self._checked_at is None or time.monotonic() - self._checked_at >= self.check_interval:
+                    self.lag = await self.measure_lag()
+                    self._checked_at = time.monotonic()
+        if self.lag is not None and self.lag <= self.max_lag:
+            return True
+        self.fallbacks += 1
+        return False
+    
+    def render(self) -> str:
+        lag = self.lag if self.lag is not None else -1
+        return "\n".join([
+            "# HELP db_replica_lag_seconds Dernier retard mesuré du réplica (-1 = injoignable)",
+            "# TYPE db_replica_lag_seconds gauge",
+            f"db_replica_lag_seconds {lag:.3f}",
+            "# HELP db_replica_fallbacks_total Lectures renvoyées au primaire (réplica en retard ou injoignable)",
+            "# TYPE db_replica_fallbacks_total counter",
+            f"db_replica_fallbacks_total {self.fallbacks}",
+        ])
+
+
+replica_guard = ReplicaLagGuard(replica_engine)
+if replica_engine is not None:
+    register_collector(replica_guard.render)
+
+
+MIGRATIONS_DIR = Path(__file__).resolve().parents[2] / "migrations"
+
+
+class SchemaVersionMismatch(RuntimeError):
+    """La base n'est pas à la révision Alembic attendue par le code (DB_STARTUP_MODE=strict)"""
+
+
+def migration_heads() -> Set[str]:
+    """Révision(s) head des migrations livrées avec le code (lecture des fichiers, sans base)"""
+    config = Config()
+    config.set_main_option("script_location", str(MIGRATIONS_DIR))
+    return set(ScriptDirectory.from_config(config).get_heads())
+
+
+async def current_revisions(db_engine: AsyncEngine) -> Set[str]:
+    """Révision(s) appliquée(s) à la base (vide si Alembic n'y a jamais été exécuté)"""
+    async with db_engine.connect() as conn:
+        try:
+            result = await conn.execute(text("SELECT version_num FROM alembic_version"))
+        except (exc.ProgrammingError, exc.OperationalError):
+            return set()
+        return set(result.scalars())
+
+
+async def init_db(db_engine: Optional[AsyncEngine] = None, mode: Optional[str] = None) -> str:
+    """
+    Préparation de la base au démarrage, selon DB_STARTUP_MODE :
+    - check : une requête sur alembic_version, warning si la base n'est pas à la révision head ;
+    - strict : idem, mais le démarrage échoue (SchemaVersionMismatch) ;
+    - create : create_all (développement local uniquement : réflexion du schéma
+      et DDL à chaque démarrage de chaque worker, en concurrence avec Alembic).
+    Retourne la révision de la base (ou "create_all").
+    """
+    db_engine = db_engine or engine
+    mode = mode or settings.db_startup_mode
+    if mode == "create":
+        async with db_engine.begin() as conn:
+            await conn.run_sync(Base.metadata.create_all)
+        return "create_all"
+    
+    expected = migration_heads()
+    current = await current_revisions(db_engine)
+    revision = ",".join(sorted(current)) or "none"
+    if current != expected:
+        message = (
+            f"Database schema at revision {revision}, code expects {','.join(sorted(expected))}: "
+            f"run 'alembic upgrade head'"
+        )
+        if mode == "strict":
+            raise SchemaVersionMismatch(message)
+        logger.warning(f"⚠️ {message}")
+    return revision
+
+
+async def read_session_factory() -> async_sessionmaker:
+    """
+    Fabrique de sessions pour les lectures qui tolèrent le retard de
+    réplication : le réplica s'il est configuré et à jour, sinon le primaire.
+    Dépendance FastAPI pour le travail qui se poursuit après le handler (ex:
+    export en streaming), qui ouvre et ferme sa propre session.
+    """
+    if ReplicaSessionLocal is not None and await replica_guard.available():
+        return ReplicaSessionLocal
+    return AsyncSessionLocal
+
+
+async def get_read_db() -> AsyncGenerator[AsyncSession, None]:
+    """
+    Dépendance FastAPI des endpoints en lecture seule (historique, recherches) :
+    session sur le réplica si possible (voir read_session_factory), jamais de commit
+    Usage: async def endpoint(db: AsyncSession = Depends(get_read_db))
+    """
+    factory = await read_session_factory()
+    async with factory() as session:
+        yield session
 
 
 async def get_db() -> AsyncGenerator[AsyncSession, None]:
@@ -41,7 +418,9 @@ async def get_db() -> AsyncGenerator[AsyncSession, None]:
     async with AsyncSessionLocal() as session:
         try:
             yield session
-            await session.commit()
+            # Le travail de la requête est terminé : ne pas échouer sur la deadline ici
+            with detached_deadline():
+                await session.commit()
         except Exception:
             await session.rollback()
             raise
@@ -0,0 +1,110 @@
+"""
+Clients HTTP partagés vers les APIs externes (NI, Skaleet Admin)
+
+Un seul httpx.AsyncClient par upstream pour tout le process : les connexions
+keep-alive sont réutilisées d'un webhook à l'autre au lieu de repayer un
+handshake TCP + TLS à chaque appel. Les clients sont créés (et préchauffés)
+dans le lifespan de l'application et fermés proprement à l'arrêt.
+"""
+import asyncio
+import logging
+from typing import Dict, Optional, Tuple
+
+import httpx
+
+from app.core.config import settings
+from app.core.metrics import http_cost_hooks
+
+logger = logging.getLogger(__name__)
+
+NI = "ni"
+SKALEET_ADMIN = "skaleet_admin"
+
+_clients: Dict[str, httpx.AsyncClient] = {}
+
+
+def _upstreams() -> Dict[str, Tuple[str, float]]:
+    """Retourne (base_url, timeout) pour chaque upstream connu"""
+    return {
+        NI: (settings.ni_base_url, settings.ni_timeout),
+        SKALEET_ADMIN: (settings.skaleet_admin_base_url, settings.skaleet_admin_timeout),
+    }
+
+
+def _http2_enabled() -> bool:
+    if not settings.http_http2:
+        return False
+    try:
+        import h2  # noqa: F401
+    except ImportError:
+        logger.warning("HTTP_HTTP2=true mais le paquet 'h2' n'est pas installé - repli sur HTTP/1.1")
+        return False
+    return True
+
+
+def build_http_client(timeout: float, upstream: Optional[str] = None) -> httpx.AsyncClient:
+    """
+    Construit un client httpx avec le pool de connexions configuré.
+    Si `upstream` est fourni, le temps d'attente est ajouté au coût de la requête en cours.
+    """
+    return httpx.AsyncClient(
+        event_hooks=http_cost_hooks(upstream) if upstream else None,
+        http2=_http2_enabled(),
+        timeout=httpx.Timeout(timeout, connect=settings.http_connect_timeout),
+        limits=httpx.Limits(
+            max_connections=settings.http_max_connections,
+            max_keepalive_connections=settings.http_max_keepalive_connections,
+            keepalive_expiry=settings.http_keepalive_expiry,
+        ),
+    )
+
+
+def get_http_client(name: str) -> httpx.AsyncClient:
+    """
+    Retourne le client partagé pour un upstream.
+    Si le lifespan ne l'a pas encore créé (scripts, tests), il est créé à la demande.
+    """
+    client = _clients.get(name)
+    if client is None or client.is_closed:
+        _, timeout = _upstreams()[name]
+        client = build_http_client(timeout, name)
+        _clients[name] = client
+    return client
+
+
+async def _prewarm(name: str, client: httpx.AsyncClient, base_url: str):
+    """Ouvre quelques connexions keep-alive vers l'upstream (le statut HTTP importe peu)"""
+    count = settings.http_prewarm_connections
+    results = await asyncio.gather(
+        *(client.head(base_url, timeout=settings.http_connect_timeout) for _ in range(count)),
+        return_exceptions=True
+    )
+    errors = [r for r in results if isinstance(r, Exception)]
+    if errors:
+        logger.warning(f"Préchauffage {name} incomplet ({len(errors)}/{count} échecs): {errors[0]}")
+    else:
+        logger.info(f"Préchauffage {name}: {count} connexion(s) ouverte(s)")
+
+
+async def start_http_clients() -> Dict[str, httpx.AsyncClient]:
+    """Crée les clients partagés et préchauffe les connexions (appelé au démarrage)"""
+    for name in _upstreams():
+        get_http_client(name)
+    
+    if settings.http_prewarm_connections > 0:
+        prewarm = []
+        for name, (base_url, _) in _upstreams().items():
+            if name == NI and settings.ni_use_mock:
+                continue
+            prewarm.append(_prewarm(name, _clients[name], base_url))
+        await asyncio.gather(*prewarm)
+    
+    return dict(_clients)
+
+
+async def close_http_clients():
+    """Ferme tous les clients partagés (appelé à l'arrêt)"""
+    clients = list(_clients.values())
+    _clients.clear()
+    for client in clients:
+        await client.aclose()
@@ -1,14 +1,20 @@
 import httpx
 from app.core.config import settings
 from app.schemas.ni import NIRequest, NIResponse
+from app.infra.http_clients import get_http_client, NI
+from app.infra.resilience import get_guard, UpstreamUnavailableError
+from app.utils.deadline import bounded_timeout, deadline_expired, DeadlineExceeded
 from app.utils.mock_data import get_mock_ni_response
+from typing import Optional
 import logging
 
 logger = logging.getLogger(__name__)
 
 
 class NIClient:
-    def __init__(self):
+    def __init__(self, http_client: Optional[httpx.AsyncClient] = None):
+        # Client HTTP injecté (partagé, créé dans le lifespan) pour réutiliser les connexions
+        self.http_client = http_client or get_http_client(NI)
         self.base_url = settings.ni_base_url
         self.api_key = settings.ni_api_key
         self.use_mock = settings.ni_use_mock
@@ -53,157 +59,39 @@ class NIClient:
         """
         Active une carte dans NI
         """
-        # Mode mock : retourner des données mockées
-        if self.use_mock:
-            return get_mock_ni_response("activate", card_id, pan_alias)
-        
-        # Utiliser panAlias si disponible, sinon cardId en string
-        card_reference = pan_alias if pan_alias else str(card_id)
-        
-        payload = {
-            "cardReference": card_reference
-        }
-        
-        url = f"{self.base_url}/cards/activate"
-        
-        async with httpx.AsyncClient() as client:
-            try:
-                response = await client.post(
-                    url,
-                    json=payload,
-                    headers=self.headers,
-                    timeout=30.0
-                )
-                response.raise_for_status()
-                response_data = response.json()
-                
-                # Adapter la réponse pour correspondre au schéma NIResponse
-                return NIResponse(
-                    success=response_data.get("success", True),
-                    status=response_data.get("status", "success"),
-                    details=response_data.get("details")
-                )
-            except httpx.HTTPError as e:
-                logger.error(f"NI API error when activating card {card_id}: {e}")
-                # Retourner une réponse d'erreur
-                return NIResponse(
-                    success=False,
-                    status="error",
-                    details={"error": str(e)}
-                )
-            except Exception as e:
-                logger.error(f"Unexpected error when activating card {card_id}: {e}", exc_info=True)
-                return NIResponse(
-                    success=False,
-                    status="error",
-                    details={"error": str(e)}
-                )
+        return await self._send_card_operation("activate", "activating", card_id, pan_alias)
     
     async def block_card_in_ni(self, card_id: int, pan_alias: str | None) -> NIResponse:
         """
         Bloque une carte dans NI
         """
-        # Mode mock : retourner des données mockées
-        if self.use_mock:
-            return get_mock_ni_response("block", card_id, pan_alias)
-        
-        # Utiliser panAlias si disponible, sinon cardId en string
-        card_reference = pan_alias if pan_alias else str(card_id)
-        
-        payload = {
-            "cardReference": card_reference
-        }
-        
-        url = f"{self.base_url}/cards/block"
-        
-        async with httpx.AsyncClient() as client:
-            try:
-                response = await client.post(
-                    url,
-                    json=payload,
-                    headers=self.headers,
-                    timeout=30.0
-                )
-                response.raise_for_status()
-                response_data = response.json()
-                
-                # Adapter la réponse pour correspondre au schéma NIResponse
-                return NIResponse(
-                    success=response_data.get("success", True),
-                    status=response_data.get("status", "success"),
-                    details=response_data.get("details")
-                )
-            except httpx.HTTPError as e:
-                logger.error(f"NI API error when blocking card {card_id}: {e}")
-                return NIResponse(
-                    success=False,
-                    status="error",
-                    details={"error": str(e)}
-                )
-            except Exception as e:
-                logger.error(f"Unexpected error when blocking card {card_id}: {e}", exc_info=True)
-                return NIResponse(
-                    success=False,
-                    status="error",
-                    details={"error": str(e)}
-                )
+        return await self._send_card_operation("block", "blocking", card_id, pan_alias)
     
     async def unblock_card_in_ni(self, card_id: int, pan_alias: str | None) -> NIResponse:
         """
         Débloque une carte dans NI
         """
-        # Mode mock : retourner des données mockées
-        if self.use_mock:
-            return get_mock_ni_response("unblock", card_id, pan_alias)
-        
-        # Utiliser panAlias si disponible, sinon cardId en string
-        card_reference = pan_alias if pan_alias else str(card_id)
-        
-        payload = {
-            "cardReference": card_reference
-        }
-        
-        url = f"{self.base_url}/cards/unblock"
-        
-        async with httpx.AsyncClient() as client:
-            try:
-                response = await client.post(
-                    url,
-                    json=payload,
-                    headers=self.headers,
-                    timeout=30.0
-                )
-                response.raise_for_status()
-                response_data = response.json()
-                
-                # Adapter la réponse pour correspondre au schéma NIResponse
-                return NIResponse(
-                    success=response_data.get("success", True),
-                    status=response_data.get("status", "success"),
-                    details=response_data.get("details")
-                )
-            except httpx.HTTPError as e:
-                logger.error(f"NI API error when unblocking card {card_id}: {e}")
-                return NIResponse(
-                    success=False,
-                    status="error",
-                    details={"error": str(e)}
-                )
-            except Exception as e:
-                logger.error(f"Unexpected error when unblocking card {card_id}: {e}", exc_info=True)
-                return NIResponse(
-                    success=False,
-                    status="error",
-                    details={"error": str(e)}
-                )
+        return await self._send_card_operation("unblock", "unblocking", card_id, pan_alias)
     
     async def oppose_card_in_ni(self, card_id: int, pan_alias: str | None) -> NIResponse:
         """
         Oppose une carte dans NI
         """
+        return await self._send_card_operation("oppose", "opposing", card_id, pan_alias)
+    
+    async def _send_card_operation(
+        self,
+        operation: str,
+        verb: str,
+        card_id: int,
+        pan_alias: str | None
+    ) -> NIResponse:
+        """
+        Appelle POST {ni_base_url}/cards/{operation} via le client HTTP partagé
+        """
         # Mode mock : retourner des données mockées
         if self.use_mock:
-            return get_mock_ni_response("oppose", card_id, pan_alias)
+            return get_mock_ni_response(operation, card_id, pan_alias)
         
         # Utiliser panAlias si disponible, sinon cardId en string
         card_reference = pan_alias if pan_alias else str(card_id)
@@ -212,57 +100,70 @@ class NIClient:
             "cardReference": card_reference
         }
         
-        url = f"{self.base_url}/cards/oppose"
+        url = f"{self.base_url}/cards/{operation}"
         
-        async with httpx.AsyncClient() as client:
-            try:
-                response = await client.post(
+        try:
+            # Circuit breaker + limite de concurrence adaptative par endpoint NI
+            async with get_guard(f"ni.{operation}").protect():
+                response = await self.http_client.post(
                     url,
                     json=payload,
                     headers=self.headers,
-                    timeout=30.0
+                    # N'utiliser que le budget restant de la requête
+                    timeout=bounded_timeout(settings.ni_timeout, f"ni.{operation}")
                 )
                 response.raise_for_status()
                 response_data = response.json()
-                
-                # Adapter la réponse pour correspondre au schéma NIResponse
-                return NIResponse(
-                    success=response_data.get("success", True),
-                    status=response_data.get("status", "success"),
-                    details=response_data.get("details")
-                )
-            except httpx.HTTPError as e:
-                logger.error(f"NI API error when opposing card {card_id}: {e}")
-                return NIResponse(
-                    success=False,
-                    status="error",
-                    details={"error": str(e)}
-                )
-            except Exception as e:
-                logger.error(f"Unexpected error when opposing card {card_id}: {e}", exc_info=True)
-                return NIResponse(
-                    success=False,
-                    status="error",
-                    details={"error": str(e)}
-                )
+            
+            # Adapter la réponse pour correspondre au schéma NIResponse
+            return NIResponse(
+                success=response_data.get("success", True),
+                status=response_data.get("status", "success"),
+                details=response_data.get("details")
+            )
+        except (UpstreamUnavailableError, DeadlineExceeded) as e:
+            # Échec immédiat : NI n'est pas appelé
+            logger.warning(f"NI call skipped when {verb} card {card_id}: {e}")
+            return NIResponse(
+                success=False,
+                status=e.status,
+                details={"error": str(e)}
+            )
+        except httpx.HTTPError as e:
+            logger.error(f"NI API error when {verb} card {card_id}: {e}")
+            # Un timeout dû à l'épuisement du budget de la requête est signalé comme tel
+            status = DeadlineExceeded.status if isinstance(e, httpx.TimeoutException) and deadline_expired() else "error"
+            # Retourner une réponse d'erreur
+            return NIResponse(
+                success=False,
+                status=status,
+                details={"error": str(e)}
+            )
+        except Exception as e:
+            logger.error(f"Unexpected error when {verb} card {card_id}: {e}", exc_info=True)
+            return NIResponse(
+                success=False,
+                status="error",
+                details={"error": str(e)}
+            )
     
     async def _make_request(self, request: NIRequest) -> NIResponse:
-        async with httpx.AsyncClient() as client:
-            try:
-                response = await client.post(
+        try:
+            async with get_guard("ni.cards").protect():
+                response = await self.http_client.post(
                     f"{self.base_url}/cards",
                     json=request.dict(),
                     headers=self.headers,
-                    timeout=30.0
+                    timeout=bounded_timeout(settings.ni_timeout, "ni.cards")
                 )
                 response.raise_for_status()
                 response_data = response.json()
-                return NIResponse(
-                    success=response_data.get("success", True),
-                    status=response_data.get("status", "success"),
-                    details=response_data.get("details")
-                )
-            except httpx.HTTPError as e:
-                logger.error(f"NI API error: {e}")
-                raise
+            return NIResponse(
+                success=response_data.get("success", True),
+                status=response_data.get("status", "success"),
+                details=response_data.get("details")
+            )
+        except httpx.HTTPError as e:
+            logger.error(f"NI API error: {e}")
+            raise
 
@@ -1,9 +1,28 @@
 from sqlalchemy.ext.asyncio import AsyncSession
-from sqlalchemy import select
-from app.domain.models import WebhookEvent, Card, CardOperation
-from app.schemas.webhook import WebhookRequest
-from datetime import datetime
-from typing import Optional
+from sqlalchemy import select, update, insert, func, and_, literal, tuple_
+from sqlalchemy.dialects.postgresql import JSONB
+from sqlalchemy.orm import joinedload
+from app.domain.models import (
+    WebhookEvent,
+    Card,
+    CardOperation,
+    SkaleetResultOutbox,
+    BulkOperationJob,
+    BulkOperationItem,
+    WebhookJob
+)
+from app.domain.enums import OutboxStatus, OperationStatus, BulkJobStatus, WebhookJobStatus
+from app.schemas.webhook import SkaleetWebhook, WebhookRequest
+from app.infra.db import dialect_insert, json_path_text
+from app.infra.card_cache import CardIdentity, card_cache
+from datetime import datetime, timedelta
+import uuid
+from typing import Optional, List, Dict, Tuple
+
+
+# Les repositories ne valident pas les transactions : l'appelant (service,
+# worker) définit l'unité de travail et fait le commit. Seules les réservations
+# de lots (claim_*) valident elles-mêmes, pour poser leur bail.
 
 
 class WebhookRepository:
@@ -19,8 +38,7 @@ class WebhookRepository:
             processed=False
         )
         self.db.add(event)
-        await self.db.commit()
-        await self.db.refresh(event)
+        await self.db.flush()
         return event
     
     async def get_event(self, event_id: str) -> Optional[WebhookEvent]:
@@ -35,7 +53,23 @@ class WebhookRepository:
             event.processed = True
             event.processed_at = datetime.utcnow()
             event.response = response
-            await self.db.commit()
+    
+    async def find_events_by_payload(self, criteria: dict, limit: int = 100) -> List[WebhookEvent]:
+        """
+        Événements dont le payload contient `criteria` (ex: {"accountId": "ACC-001"}).
+        Sous PostgreSQL : inclusion JSONB (payload @> criteria) servie par l'index GIN.
+        """
+        if self.db.bind.dialect.name == "postgresql":
+            condition = WebhookEvent.payload.op("@>")(literal(criteria, JSONB))
+        else:
+            condition = and_(*(
+                json_path_text(WebhookEvent.payload, key) == str(value)
+                for key, value in criteria.items()
+            ))
+        result = await self.db.execute(
+            select(WebhookEvent).where(condition).order_by(WebhookEvent.created_at.desc()).limit(limit)
+        )
+        return list(result.scalars().all())
 
 
 class CardRepository:
@@ -58,28 +92,86 @@ class CardRepository:
             status_ni=None
         )
         self.db.add(card)
-        await self.db.commit()
-        await self.db.refresh(card)
+        await self.db.flush()
+        card_cache.invalidate(skaleet_card_id)
         return card
     
     async def get_or_create(self, skaleet_card_id: int, pan_alias: Optional[str] = None) -> Card:
-        """Récupère une carte ou la crée si elle n'existe pas"""
-        card = await self.get_by_skaleet_id(skaleet_card_id)
-        if not card:
-            card = await self.create(skaleet_card_id, pan_alias)
-        return card
-    
-    async def update_status_ni(self, card_id, status_ni: str):
-        """Met à jour le statut NI d'une carte"""
+        """
+        Récupère une carte ou la crée si elle n'existe pas :
+        INSERT ... ON CONFLICT (skaleet_card_id) DO NOTHING RETURNING, puis un
+        SELECT si la carte existait. Une carte existante n'est écrite que pour
+        renseigner un pan_alias manquant (jamais écrasé) : pas de verrou de ligne
+        ni de version morte par appel, et les webhooks concurrents d'une même
+        carte ne se sérialisent pas sur sa ligne. Sans course possible : deux
+        premiers webhooks concurrents obtiennent la même carte.
+        """
         result = await self.db.execute(
-            select(Card).where(Card.id == card_id)
+            dialect_insert(self.db, Card)
+            .values(
+                skaleet_card_id=skaleet_card_id,
+                pan_alias=pan_alias,
+                status_skaleet="PENDING",
+                status_ni=None
+            )
+            .on_conflict_do_nothing(index_elements=[Card.skaleet_card_id])
+            .returning(Card)
+            .execution_options(populate_existing=True)
         )
         card = result.scalar_one_or_none()
-        if card:
-            card.status_ni = status_ni
-            await self.db.commit()
-            await self.db.refresh(card)
+        if card is None:
+            card = await self._load(skaleet_card_id)
+            if card.pan_alias is None and pan_alias:
+                result = await self.db.execute(
+                    update(Card)
+                    .where(Card.id == card.id, Card.pan_alias.is_(None))
+                    .values(pan_alias=pan_alias)
+                    .returning(Card)
+                    .execution_options(populate_existing=True)
+                )
+                # Renseigné entre-temps par une requête concurrente : valeur en base
+                card = result.scalar_one_or_none() or await self._load(skaleet_card_id)
+        card_cache.put(CardIdentity.from_card(card))
         return card
+    
+    async def _load(self, skaleet_card_id: int) -> Card:
+        """Carte existante, relue en base même si la session en détient une copie"""
+        result = await self.db.execute(
+            select(Card)
+            .where(Card.skaleet_card_id == skaleet_card_id)
+            .execution_options(populate_existing=True)
+        )
+        return result.scalar_one()
+    
+    async def resolve(self, skaleet_card_id: int, pan_alias: Optional[str] = None) -> CardIdentity:
+        """
+        Identité de la carte (id, pan_alias, status_ni) depuis le cache si possible,
+        sinon via get_or_create. Un pan_alias absent du cache passe par la base
+        pour y être enregistré.
+        """
+        identity = card_cache.get(skaleet_card_id)
+        if identity is not None and (not pan_alias or identity.pan_alias):
+            return identity
+        return CardIdentity.from_card(await self.get_or_create(skaleet_card_id, pan_alias))
+    
+    async def update_status_ni(self, card_id, status_ni: str, ni_card_ref: Optional[str] = None):
+        """
+        Met à jour le statut NI d'une carte (et son numéro VISA s'il est fourni)
+        en une seule requête UPDATE ; la carte chargée dans la session et le cache
+        d'identité sont mis à jour
+        """
+        values = {"status_ni": status_ni}
+        if ni_card_ref:
+            values["ni_card_ref"] = ni_card_ref
+        result = await self.db.execute(
+            update(Card)
+            .where(Card.id == card_id)
+            .values(**values)
+            .returning(Card.skaleet_card_id, Card.pan_alias)
+        )
+        row = result.one_or_none()
+        if row is not None:
+            card_cache.put(CardIdentity(card_id, row.skaleet_card_id, row.pan_alias, status_ni))
 
 
 class CardOperationRepository:
@@ -107,23 +199,87 @@ class CardOperationRepository:
             raw_webhook=raw_webhook
         )
         self.db.add(operation)
-        await self.db.commit()
-        await self.db.refresh(operation)
+        await self.db.flush()
         return operation
     
     async def update_status(self, operation_id, status: str, ni_result_code: Optional[str] = None):
-        """Met à jour le statut d'une opération"""
+        """Met à jour le statut d'une opération en une seule requête UPDATE"""
+        values = {"status": status}
+        if ni_result_code:
+            values["ni_result_code"] = ni_result_code
+        await self.db.execute(update(CardOperation).where(CardOperation.id == operation_id).values(**values))
+    
+    # Champs du webhook Skaleet (raw_webhook.data) couverts par un index d'expression
+    INDEXED_WEBHOOK_FIELDS = ("panAlias", "accountId")
+    
+    async def find_by_webhook_field(self, field: str, value: str, limit: int = 100) -> List[CardOperation]:
+        """Opérations dont le webhook reçu porte data.<field> = value (champs indexés uniquement)"""
+        if field not in self.INDEXED_WEBHOOK_FIELDS:
+            raise ValueError(f"Unindexed webhook field: {field}")
         result = await self.db.execute(
-            select(CardOperation).where(CardOperation.id == operation_id)
+            select(CardOperation)
+            .where(json_path_text(CardOperation.raw_webhook, "data", field) == value)
+            .order_by(CardOperation.created_at.desc())
+            .limit(limit)
         )
-        operation = result.scalar_one_or_none()
-        if operation:
-            operation.status = status
-            if ni_result_code:
-                operation.ni_result_code = ni_result_code
-            await self.db.commit()
-            await self.db.refresh(operation)
-        return operation
+        return list(result.scalars().all())
+    
+    async def find_by_ni_card_id(self, ni_card_id: str, limit: int = 100) -> List[CardOperation]:
+        """Opérations dont la réponse NI porte ce niCardId (conservée dans l'outbox Skaleet)"""
+        result = await self.db.execute(
+            select(CardOperation)
+            .join(SkaleetResultOutbox, SkaleetResultOutbox.card_operation_id == CardOperation.id)
+            .where(json_path_text(SkaleetResultOutbox.payload, "ni_details", "niCardId") == ni_card_id)
+            .order_by(CardOperation.created_at.desc())
+            .limit(limit)
+        )
+        return list(result.scalars().all())
+    
+    async def _page(
+        self,
+        condition,
+        after: Optional[Tuple[datetime, uuid.UUID]],
+        limit: int,
+        with_card: bool = False
+    ) -> List[CardOperation]:
+        """
+        Les plus récentes d'abord, paginées par (created_at, id) : keyset, sans
+        OFFSET ; `after` est la dernière opération de la page précédente
+        """
+        query = select(CardOperation).where(condition)
+        if with_card:
+            query = query.options(joinedload(CardOperation.card))
+        if after is not None:
+            query = query.where(tuple_(CardOperation.created_at, CardOperation.id) < tuple_(*after))
+        result = await self.db.execute(
+            query.order_by(CardOperation.created_at.desc(), CardOperation.id.desc()).limit(limit)
+        )
+        return list(result.scalars().all())
+    
+    async def list_by_card(
+        self,
+        card_id,
+        after: Optional[Tuple[datetime, uuid.UUID]] = None,
+        limit: int = 100
+    ) -> List[CardOperation]:
+        """Historique d'une carte (index idx_card_operations_card_created)"""
+        return await self._page(CardOperation.card_id == card_id, after, limit)
+    
+    async def list_by_correlation_id(
+        self,
+        correlation_id: str,
+        after: Optional[Tuple[datetime, uuid.UUID]] = None,
+        limit: int = 100
+    ) -> List[CardOperation]:
+        return await self._page(CardOperation.correlation_id == correlation_id, after, limit, with_card=True)
+    
+    async def list_by_webhook_id(
+        self,
+        webhook_id: str,
+        after: Optional[Tuple[datetime, uuid.UUID]] = None,
+        limit: int = 100
+    ) -> List[CardOperation]:
+        return await self._page(CardOperation.skaleet_webhook_id == webhook_id, after, limit, with_card=True)
     
     async def get_by_webhook_id(self, webhook_id: str, operation_type: str) -> Optional[CardOperation]:
         """Récupère une opération par webhookId et operation_type"""
@@ -135,3 +291,328 @@ class CardOperationRepository:
         )
         return result.scalar_one_or_none()
 
+
+
+class OutboxRepository:
+    def __init__(self, db: AsyncSession):
+        self.db = db
+    
+    def enqueue(
+        self,
+        card_operation_id,
+        skaleet_card_id: int,
+        operation_type: str,
+        result: str,
+        visa_card_number: Optional[str] = None,
+        ni_details: Optional[dict] = None
+    ) -> SkaleetResultOutbox:
+        """
+        Ajoute un résultat à livrer à Skaleet dans la transaction en cours
+        (pas de commit : il est fait avec la mise à jour de la CardOperation)
+        """
+        message = SkaleetResultOutbox(
+            card_operation_id=card_operation_id,
+            skaleet_card_id=skaleet_card_id,
+            operation_type=operation_type,
+            result=result,
+            payload={
+                "visa_card_number": visa_card_number,
+                "ni_details": ni_details
+            },
+            status=OutboxStatus.PENDING.value,
+            attempts=0,
+            next_attempt_at=datetime.utcnow()
+        )
+        self.db.add(message)
+        return message
+    
+    async def claim_due_batch(self, limit: int, lease_seconds: float) -> List[SkaleetResultOutbox]:
+        """
+        Réserve un lot de messages à livrer.
+        Les lignes sont verrouillées (SKIP LOCKED) le temps de repousser leur
+        next_attempt_at d'un bail, puis la transaction est validée : un autre
+        worker ne reprendra un message que si ce bail expire (crash pendant la livraison).
+        """
+        now = datetime.utcnow()
+        result = await self.db.execute(
+            select(SkaleetResultOutbox)
+            .where(
+                SkaleetResultOutbox.status == OutboxStatus.PENDING.value,
+                SkaleetResultOutbox.next_attempt_at <= now
+            )
+            .order_by(SkaleetResultOutbox.next_attempt_at)
+            .limit(limit)
+            .with_for_update(skip_locked=True)
+        )
+        messages = list(result.scalars().all())
+        lease_until = now + timedelta(seconds=lease_seconds)
+        for message in messages:
+            message.attempts += 1
+            message.next_attempt_at = lease_until
+        await self.db.commit()
+        return messages
+    
+    async def mark_delivered(self, message_ids: List):
+        """Marque un lot de messages comme livrés (une seule requête)"""
+        if not message_ids:
+            return
+        await self.db.execute(
+            update(SkaleetResultOutbox)
+            .where(SkaleetResultOutbox.id.in_(message_ids))
+            .values(
+                status=OutboxStatus.DELIVERED.value,
+                delivered_at=datetime.utcnow(),
+                last_error=None
+            )
+        )
+    
+    async def mark_failed(self, message_id, error: str, next_attempt_at: Optional[datetime]):
+        """Reprogramme un message en échec, ou le passe en DEAD si next_attempt_at est None"""
+        values = {"last_error": error[:2000]}
+        if next_attempt_at is None:
+            values["status"] = OutboxStatus.DEAD.value
+        else:
+            values["next_attempt_at"] = next_attempt_at
+        await self.db.execute(
+            update(SkaleetResultOutbox)
+            .where(SkaleetResultOutbox.id == message_id)
+            .values(**values)
+        )
+
+
+
+class WebhookJobRepository:
+    def __init__(self, db: AsyncSession):
+        self.db = db
+    
+    async def enqueue(self, webhook: SkaleetWebhook, correlation_id: Optional[str] = None) -> bool:
+        """
+        Réserve le webhookId et met le webhook en file, en une seule requête
+        INSERT ... ON CONFLICT DO NOTHING RETURNING (pas de commit).
+        Retourne False si ce webhookId a déjà été reçu
+        """
+        now = datetime.utcnow()
+        result = await self.db.execute(
+            dialect_insert(self.db, WebhookJob)
+            .values(
+                id=uuid.uuid4(),
+                skaleet_webhook_id=webhook.webhookId,
+                skaleet_card_id=webhook.data.cardId,
+                event=webhook.event,
+                payload=webhook.model_dump(),
+                correlation_id=correlation_id,
+                status=WebhookJobStatus.PENDING.value,
+                attempts=0,
+                next_attempt_at=now,
+                created_at=now
+            )
+            .on_conflict_do_nothing(index_elements=[WebhookJob.skaleet_webhook_id])
+            .returning(WebhookJob.id)
+        )
+        return result.scalar_one_or_none() is not None
+    
+    async def claim_due_batch(self, limit: int, lease_seconds: float) -> List[WebhookJob]:
+        """
+        Réserve un lot de jobs dans l'ordre d'arrivée (même principe que l'outbox) :
+        verrouillage SKIP LOCKED, bail posé sur next_attempt_at puis commit
+        """
+        now = datetime.utcnow()
+        result = await self.db.execute(
+            select(WebhookJob)
+            .where(
+                WebhookJob.status == WebhookJobStatus.PENDING.value,
+                WebhookJob.next_attempt_at <= now
+            )
+            .order_by(WebhookJob.next_attempt_at)
+            .limit(limit)
+            .with_for_update(skip_locked=True)
+        )
+        jobs = list(result.scalars().all())
+        lease_until = now + timedelta(seconds=lease_seconds)
+        for job in jobs:
+            job.attempts += 1
+            job.next_attempt_at = lease_until
+        await self.db.commit()
+        return jobs
+    
+    async def mark_done(self, job_ids: List):
+        """Marque un lot de jobs comme traités (une seule requête)"""
+        if not job_ids:
+            return
+        await self.db.execute(
+            update(WebhookJob)
+            .where(WebhookJob.id.in_(job_ids))
+            .values(status=WebhookJobStatus.DONE.value, finished_at=datetime.utcnow(), last_error=None)
+        )
+    
+    async def mark_failed(self, job_id, error: str, next_attempt_at: Optional[datetime]):
+        """Reprogramme un job en échec, ou le passe en DEAD si next_attempt_at est None"""
+        values = {"last_error": error[:2000]}
+        if next_attempt_at is None:
+            values.update(status=WebhookJobStatus.DEAD.value, finished_at=datetime.utcnow())
+        else:
+            values["next_attempt_at"] = next_attempt_at
+        await self.db.execute(update(WebhookJob).where(WebhookJob.id == job_id).values(**values))
+
+
+class BulkOperationRepository:
+    def __init__(self, db: AsyncSession):
+        self.db = db
+    
+    def create_job(self, correlation_id: Optional[str] = None) -> BulkOperationJob:
+        """Ajoute un job à la transaction en cours (validé une fois toutes les lignes reçues)"""
+        job = BulkOperationJob(
+            id=uuid.uuid4(),
+            status=BulkJobStatus.RUNNING.value,
+            total_items=0,
+            processed_items=0,
+            succeeded_items=0,
+            failed_items=0,
+            correlation_id=correlation_id
+        )
+        self.db.add(job)
+        return job
+    
+    async def add_items(self, job_id, items: List[dict]):
+        """Insère un lot d'opérations en une seule requête (executemany)"""
+        if not items:
+            return
+        await self.db.execute(
+            insert(BulkOperationItem),
+            [
+                {
+                    "id": uuid.uuid4(),
+                    "job_id": job_id,
+                    "position": item["position"],
+                    "skaleet_card_id": item["skaleet_card_id"],
+                    "pan_alias": item["pan_alias"],
+                    "operation_type": item["operation_type"],
+                    "status": OperationStatus.PENDING.value
+                }
+                for item in items
+            ]
+        )
+    
+    async def get_job(self, job_id) -> Optional[BulkOperationJob]:
+        result = await self.db.execute(
+            select(BulkOperationJob).where(BulkOperationJob.id == job_id)
+        )
+        return result.scalar_one_or_none()
+    
+    async def list_items(
+        self,
+        job_id,
+        status: Optional[str] = None,
+        after_position: int = 0,
+        limit: int = 100
+    ) -> List[BulkOperationItem]:
+        """Résultats par carte, paginés par position (keyset)"""
+        query = select(BulkOperationItem).where(
+            BulkOperationItem.job_id == job_id,
+            BulkOperationItem.position > after_position
+        )
+        if status:
+            query = query.where(BulkOperationItem.status == status)
+        result = await self.db.execute(
+            query.order_by(BulkOperationItem.position).limit(limit)
+        )
+        return list(result.scalars().all())
+    
+    async def claim_pending_items(self, limit: int, lease_seconds: float) -> List[BulkOperationItem]:
+        """
+        Réserve un lot d'opérations à traiter (même principe que l'outbox) :
+        verrouillage SKIP LOCKED, bail posé sur les lignes puis commit. Un lot
+        abandonné (crash) est repris par un autre worker à l'expiration du bail.
+        Les jobs sont servis dans l'ordre de réception (created_at), chacun dans
+        l'ordre de ses lignes.
+        """
+        now = datetime.utcnow()
+        result = await self.db.execute(
+            select(BulkOperationItem)
+            .join(BulkOperationJob, BulkOperationJob.id == BulkOperationItem.job_id)
+            .where(
+                BulkOperationItem.status == OperationStatus.PENDING.value,
+                (BulkOperationItem.leased_until.is_(None)) | (BulkOperationItem.leased_until <= now)
+            )
+            .order_by(BulkOperationJob.created_at, BulkOperationJob.id, BulkOperationItem.position)
+            .limit(limit)
+            # Seules les lignes d'opérations sont verrouillées : les compteurs du job
+            # restent modifiables par les workers qui enregistrent leurs résultats
+            .with_for_update(skip_locked=True, of=BulkOperationItem)
+        )
+        items = list(result.scalars().all())
+        lease_until = now + timedelta(seconds=lease_seconds)
+        for item in items:
+            item.leased_until = lease_until
+        await self.db.commit()
+        return items
+    
+    async def get_operations_by_webhook_ids(self, webhook_ids: List[str]) -> Dict[str, CardOperation]:
+        """Opérations créées pour un lot de webhookIds (une seule requête)"""
+        if not webhook_ids:
+            return {}
+        result = await self.db.execute(
+            select(CardOperation).where(CardOperation.skaleet_webhook_id.in_(webhook_ids))
+        )
+        return {operation.skaleet_webhook_id: operation for operation in result.scalars().all()}
+    
+    async def record_results(self, results: List[dict]):
+        """
+        Enregistre le résultat d'un lot d'opérations et met à jour les compteurs
+        des jobs concernés, puis clôture les jobs qui n'ont plus rien à traiter.
+        Pas de commit : l'appelant valide le tout en une transaction.
+        """
+        if not results:
+            return
+        now = datetime.utcnow()
+        await self.db.execute(
+            update(BulkOperationItem),
+            [
+                {
+                    "id": result["id"],
+                    "status": result["status"],
+                    "card_operation_id": result.get("card_operation_id"),
+                    "ni_result_code": result.get("ni_result_code"),
+                    "error": result.get("error"),
+                    "processed_at": now,
+                    "leased_until": None
+                }
+                for result in results
+            ]
+        )
+        
+        counters: Dict = {}
+        for result in results:
+            succeeded, failed = counters.get(result["job_id"], (0, 0))
+            if result["status"] == OperationStatus.SUCCESS.value:
+                succeeded += 1
+            else:
+                failed += 1
+            counters[result["job_id"]] = (succeeded, failed)
+        
+        for job_id, (succeeded, failed) in counters.items():
+            await self.db.execute(
+                update(BulkOperationJob)
+                .where(BulkOperationJob.id == job_id)
+                .values(
+                    processed_items=BulkOperationJob.processed_items + succeeded + failed,
+                    succeeded_items=BulkOperationJob.succeeded_items + succeeded,
+                    failed_items=BulkOperationJob.failed_items + failed
+                )
+            )
+        
+        pending = await self.db.execute(
+            select(BulkOperationItem.job_id)
+            .where(
+                BulkOperationItem.job_id.in_(list(counters)),
+                BulkOperationItem.status == OperationStatus.PENDING.value
+            )
+            .group_by(BulkOperationItem.job_id)
+        )
+        finished = set(counters) - set(pending.scalars().all())
+        if finished:
+            await self.db.execute(
+                update(BulkOperationJob)
+                .where(BulkOperationJob.id.in_(list(finished)))
+                .values(status=BulkJobStatus.COMPLETED.value, finished_at=now)
+            )
@@ -0,0 +1,323 @@
+"""
+Protection des appels sortants (NI, Skaleet Admin)
+
+Chaque endpoint amont a son propre `UpstreamGuard` qui combine :
+- un circuit breaker : il s'ouvre quand le taux d'erreurs ou d'appels lents
+  dépasse un seuil sur une fenêtre glissante, et les appels échouent alors
+  immédiatement au lieu de bloquer une session DB et une socket ;
+- une limite de concurrence adaptative (AIMD) : elle augmente d'une unité par
+  "fenêtre" d'appels rapides et diminue de façon multiplicative quand la
+  latence observée dépasse la cible ou que l'amont renvoie des erreurs.
+
+L'état de chaque garde est exposé via `snapshot_guards()` pour le monitoring.
+"""
+import asyncio
+import logging
+import time
+from collections import deque
+from contextlib import asynccontextmanager
+from typing import Deque, Dict, Optional, Tuple
+
+import httpx
+
+from app.core.config import settings
+from app.utils.deadline import bounded_timeout
+
+logger = logging.getLogger(__name__)
+
+
+class UpstreamUnavailableError(Exception):
+    """L'appel n'a pas été tenté car l'amont est considéré indisponible"""
+    status = "upstream_unavailable"
+
+
+class CircuitOpenError(UpstreamUnavailableError):
+    status = "circuit_open"
+
+
+class ConcurrencyLimitExceeded(UpstreamUnavailableError):
+    status = "concurrency_limited"
+
+
+def is_upstream_failure(error: BaseException) -> bool:
+    """
+    Indique si une erreur traduit un problème de l'amont.
+    Les 4xx (hors 408/429) sont des erreurs de la requête : l'amont répond normalement.
+    """
+    if isinstance(error, httpx.HTTPStatusError):
+        status_code = error.response.status_code
+        return status_code >= 500 or status_code in (408, 429)
+    return True
+
+
+class CircuitBreaker:
+    CLOSED = "closed"
+    OPEN = "open"
+    HALF_OPEN = "half_open"
+    
+    def __init__(
+        self,
+        window_size: int,
+        min_calls: int,
+        failure_rate_threshold: float,
+        slow_call_threshold: float,
+        slow_call_rate_threshold: float,
+        open_duration: float,
+        half_open_max_calls: int
+    ):
+        self.window_size = window_size
+        self.min_calls = min_calls
+        self.failure_rate_threshold = failure_rate_threshold
+        self.slow_call_threshold = slow_call_threshold
+        self.slow_call_rate_threshold = slow_call_rate_threshold
+        self.open_duration = open_duration
+        self.half_open_max_calls = half_open_max_calls
+        self.state = self.CLOSED
+        self._outcomes: Deque[Tuple[bool, bool]] = deque(maxlen=window_size)
+        self._opened_at = 0.0
+        self._half_open_in_flight = 0
+        self._half_open_successes = 0
+    
+    def before_call(self):
+        """Lève CircuitOpenError si l'appel ne doit pas être tenté"""
+        if self.state == self.OPEN:
+            if time.monotonic() - self._opened_at < self.open_duration:
+                raise CircuitOpenError("circuit open")
+            self.state = self.HALF_OPEN
+            self._half_open_in_flight = 0
+            self._half_open_successes = 0
+        
+        if self.state == self.HALF_OPEN:
+            if self._half_open_in_flight >= self.half_open_max_calls:
+                raise CircuitOpenError("circuit half-open, trial calls in progress")
+            self._half_open_in_flight += 1
+    
+    def cancel_call(self):
+        """Libère un appel autorisé par before_call mais finalement non effectué"""
+        if self.state == self.HALF_OPEN and self._half_open_in_flight > 0:
+            self._half_open_in_flight -= 1
+    
+    def record(self, latency: float, ok: bool):
+        slow = latency >= self.slow_call_threshold
+        
+        if self.state == self.HALF_OPEN:
+            self._half_open_in_flight = max(self._half_open_in_flight - 1, 0)
+            if not ok or slow:
+                self._open()
+                return
+            self._half_open_successes += 1
+            if self._half_open_successes >= self.half_open_max_calls:
+                self.state = self.CLOSED
+                self._outcomes.clear()
+            return
+        
+        if self.state == self.OPEN:
+            return
+        
+        self._outcomes.append((ok, slow))
+        if len(self._outcomes) < self.min_calls:
+            return
+        calls = len(self._outcomes)
+        failure_rate = sum(1 for ok, _ in self._outcomes if not ok) / calls
+        slow_rate = sum(1 for _, slow in self._outcomes if slow) / calls
+        if failure_rate >= self.failure_rate_threshold or slow_rate >= self.slow_call_rate_threshold:
+            self._open()
+    
+    def _open(self):
+        self.state = self.OPEN
+        self._opened_at = time.monotonic()
+        self._outcomes.clear()
+    
+    def snapshot(self) -> dict:
+        calls = len(self._outcomes)
+        return {
+            "state": self.state,
+            "window_calls": calls,
+            "failure_rate": round(sum(1 for ok, _ in self._outcomes if not ok) / calls, 3) if calls else 0.0,
+            "slow_call_rate": round(sum(1 for _, slow in self._outcomes if slow) / calls, 3) if calls else 0.0,
+        }
+
+
+class AdaptiveConcurrencyLimiter:
+    """Limite de concurrence AIMD (additive increase, multiplicative decrease)"""
+    
+    def __init__(
+        self,
+        initial_limit: int,
+        min_limit: int,
+        max_limit: int,
+        latency_target: float,
+        decrease_factor: float
+    ):
+        self.min_limit = min_limit
+        self.max_limit = max_limit
+        self.latency_target = latency_target
+        self.decrease_factor = decrease_factor
+        self.in_flight = 0
+        self._limit = float(initial_limit)
+        self._waiters: Deque[asyncio.Future] = deque()
+    
+    @property
+    def limit(self) -> int:
+        return max(self.min_limit, int(self._limit))
+    
+    async def acquire(self, timeout: float):
+        """Attend une place libre, ou lève ConcurrencyLimitExceeded après `timeout` secondes"""
+        if self.in_flight < self.limit and not self._waiters:
+            self.in_flight += 1
+            return
+        
+        waiter = asyncio.get_running_loop().create_future()
+        self._waiters.append(waiter)
+        try:
+            await asyncio.wait_for(waiter, timeout=timeout)
+        except asyncio.TimeoutError:
+            if waiter.done() and not waiter.cancelled():
+                # La place a été attribuée au moment même de l'expiration
+                return
+            raise ConcurrencyLimitExceeded(f"concurrency limit {self.limit} reached")
+        except BaseException:
+            # Annulation (ex: deadline de la requête) : si la place venait d'être
+            # attribuée, la rendre, sinon in_flight ne redescendrait jamais
+            if waiter.done() and not waiter.cancelled():
+                self.release()
+            raise
+        finally:
+            if waiter in self._waiters:
+                self._waiters.remove(waiter)
+    
+    def release(self):
+        self.in_flight -= 1
+        self._wake_waiters()
+    
+    def record(self, latency: float, ok: bool):
+        if not ok or latency > self.latency_target:
+            self._limit = max(float(self.min_limit), self._limit * self.decrease_factor)
+        else:
+            self._limit = min(float(self.max_limit), self._limit + 1.0 / self._limit)
+        self._wake_waiters()
+    
+    def _wake_waiters(self):
+        while self._waiters and self.in_flight < self.limit:
+            waiter = self._waiters.popleft()
+            if not waiter.done():
+                self.in_flight += 1
+                waiter.set_result(None)
+    
+    def snapshot(self) -> dict:
+        return {
+            "limit": self.limit,
+            "in_flight": self.in_flight,
+            "queued": len(self._waiters),
+        }
+
+
+class GuardedCall:
+    """Permet de signaler un échec sans exception (ex: réponse 5xx non levée)"""
+    
+    def __init__(self):
+        self.failed = False
+    
+    def record_response(self, response: httpx.Response):
+        if response.status_code >= 500 or response.status_code in (408, 429):
+            self.failed = True
+
+
+class UpstreamGuard:
+    def __init__(self, name: str, breaker: CircuitBreaker, limiter: AdaptiveConcurrencyLimiter):
+        self.name = name
+        self.breaker = breaker
+        self.limiter = limiter
+    
+    @asynccontextmanager
+    async def protect(self):
+        """
+        Encadre un appel amont :
+            async with get_guard("ni.activate").protect() as call:
+                response = await client.post(...)
+                call.record_response(response)
+        """
+        queue_timeout = bounded_timeout(settings.limiter_queue_timeout, f"{self.name} queue")
+        self.breaker.before_call()
+        try:
+            await self.limiter.acquire(queue_timeout)
+        except BaseException:
+            self.breaker.cancel_call()
+            raise
+        
+        call = GuardedCall()
+        start = time.perf_counter()
+        try:
+            yield call
+        except asyncio.CancelledError:
+            # Appel abandonné par l'appelant : aucune conclusion sur la santé de l'amont
+            self.limiter.release()
+            self.breaker.cancel_call()
+            raise
+        except Exception as e:
+            self._finish(time.perf_counter() - start, not is_upstream_failure(e))
+            raise
+        else:
+            self._finish(time.perf_counter() - start, not call.failed)
+    
+    def _finish(self, latency: float, ok: bool):
+        previous_state = self.breaker.state
+        self.limiter.release()
+        self.limiter.record(latency, ok)
+        self.breaker.record(latency, ok)
+        if self.breaker.state != previous_state:
+            logger.warning(f"Circuit breaker {self.name}: {previous_state} -> {self.breaker.state}")
+    
+    def snapshot(self) -> dict:
+        return {
+            "breaker": self.breaker.snapshot(),
+            "concurrency": self.limiter.snapshot(),
+        }
+
+
+_guards: Dict[str, UpstreamGuard] = {}
+
+
+def build_guard(name: str) -> UpstreamGuard:
+    """Construit une garde avec les paramètres de configuration"""
+    return UpstreamGuard(
+        name,
+        CircuitBreaker(
+            window_size=settings.breaker_window_size,
+            min_calls=settings.breaker_min_calls,
+            failure_rate_threshold=settings.breaker_failure_rate_threshold,
+            slow_call_threshold=settings.breaker_slow_call_threshold,
+            slow_call_rate_threshold=settings.breaker_slow_call_rate_threshold,
+            open_duration=settings.breaker_open_duration,
+            half_open_max_calls=settings.breaker_half_open_max_calls
+        ),
+        AdaptiveConcurrencyLimiter(
+            initial_limit=settings.limiter_initial_limit,
+            min_limit=settings.limiter_min_limit,
+            max_limit=settings.limiter_max_limit,
+            latency_target=settings.limiter_latency_target,
+            decrease_factor=settings.limiter_decrease_factor
+        )
+    )
+
+
+def get_guard(name: str) -> UpstreamGuard:
+    """Retourne la garde d'un endpoint amont (ex: "ni.activate"), créée à la demande"""
+    guard = _guards.get(name)
+    if guard is None:
+        guard = build_guard(name)
+        _guards[name] = guard
+    return guard
+
+
+def snapshot_guards() -> Dict[str, dict]:
+    """État de toutes les gardes (breaker + limite courante) pour le monitoring"""
+    return {name: guard.snapshot() for name, guard in sorted(_guards.items())}
+
+
+def reset_guards(name: Optional[str] = None):
+    """Réinitialise une garde (ou toutes) - utile pour les tests et les opérations manuelles"""
+    if name is None:
+        _guards.clear()
+    else:
+        _guards.pop(name, None)
@@ -0,0 +1,134 @@
+"""
+Gestion du token OAuth2 (client credentials) de l'API Admin Skaleet
+
+Un seul gestionnaire par process :
+- le token est mis en cache jusqu'à son expiration (`expires_in`)
+- il est rafraîchi en arrière-plan un peu avant d'expirer
+- les appelants concurrents attendent un seul rafraîchissement en cours
+  au lieu de tous appeler /oauth/token
+- un 401 de Skaleet invalide le token (voir `invalidate`)
+"""
+import asyncio
+import logging
+import time
+from typing import Optional
+
+import httpx
+
+from app.core.config import settings
+from app.infra.http_clients import get_http_client, SKALEET_ADMIN
+from app.infra.resilience import get_guard
+from app.utils.deadline import bounded_timeout, detached_deadline
+
+logger = logging.getLogger(__name__)
+
+# Marge de sécurité : un token n'est plus utilisé dans les dernières secondes de sa validité
+# (au plus la moitié de sa durée de vie, pour les tokens très courts)
+_EXPIRY_SKEW = 5.0
+
+
+class SkaleetTokenManager:
+    def __init__(self, http_client: Optional[httpx.AsyncClient] = None):
+        self._http_client = http_client
+        self._token: Optional[str] = None
+        self._expires_at = 0.0
+        self._refresh_at = 0.0
+        self._lock: Optional[asyncio.Lock] = None
+        self._lock_loop: Optional[asyncio.AbstractEventLoop] = None
+        self._refresh_task: Optional[asyncio.Task] = None
+    
+    def _get_lock(self) -> asyncio.Lock:
+        # Un asyncio.Lock est lié à une boucle : on le recrée si la boucle change (tests, scripts)
+        loop = asyncio.get_running_loop()
+        if self._lock is None or self._lock_loop is not loop:
+            self._lock = asyncio.Lock()
+            self._lock_loop = loop
+        return self._lock
+    
+    def _is_valid(self, now: float) -> bool:
+        return self._token is not None and now < self._expires_at
+    
+    async def get_token(self) -> str:
+        """Retourne un token valide, en le rafraîchissant si nécessaire"""
+        now = time.monotonic()
+        if self._is_valid(now):
+            if now >= self._refresh_at:
+                self._schedule_background_refresh()
+            return self._token
+        return await self._refresh(stale_token=self._token)
+    
+    def invalidate(self, token: str):
+        """Invalide le token s'il est toujours celui en cache (ex: 401 renvoyé par Skaleet)"""
+        if self._token == token:
+            logger.info("Skaleet admin token invalidated")
+            self._token = None
+            self._expires_at = 0.0
+    
+    async def close(self):
+        """Annule un éventuel rafraîchissement en arrière-plan (appelé à l'arrêt)"""
+        task = self._refresh_task
+        self._refresh_task = None
+        if task and not task.done():
+            task.cancel()
+            try:
+                await task
+            except asyncio.CancelledError:
+                pass
+    
+    def _schedule_background_refresh(self):
+        if self._refresh_task and not self._refresh_task.done():
+            return
+        # Le rafraîchissement est partagé : il ne dépend pas de la deadline de la requête qui l'a déclenché
+        with detached_deadline():
+            self._refresh_task = asyncio.create_task(self._background_refresh(self._token))
+    
+    async def _background_refresh(self, stale_token: Optional[str]):
+        try:
+            await self._refresh(stale_token)
+        except Exception as e:
+            # Le token courant reste utilisable jusqu'à son expiration
+            logger.warning(f"Background refresh of Skaleet admin token failed: {e}")
+    
+    async def _refresh(self, stale_token: Optional[str]) -> str:
+        async with self._get_lock():
+            # Un autre appelant a peut-être rafraîchi le token pendant l'attente du verrou
+            if self._token != stale_token and self._is_valid(time.monotonic()):
+                return self._token
+            
+            access_token, expires_in = await self._fetch_token()
+            now = time.monotonic()
+            margin = min(settings.skaleet_token_refresh_margin, expires_in / 2)
+            self._token = access_token
+            self._expires_at = now + expires_in - min(_EXPIRY_SKEW, expires_in / 2)
+            self._refresh_at = now + expires_in - margin
+            return access_token
+    
+    async def _fetch_token(self) -> tuple[str, float]:
+        """Appelle /oauth/token et retourne (access_token, expires_in)"""
+        client = self._http_client or get_http_client(SKALEET_ADMIN)
+        try:
+            async with get_guard("skaleet.oauth").protect():
+                response = await client.post(
+                    f"{settings.skaleet_admin_base_url}/oauth/token",
+                    data={
+                        "grant_type": "client_credentials",
+                        "client_id": settings.skaleet_admin_client_id,
+                        "client_secret": settings.skaleet_admin_client_secret
+                    },
+                    timeout=bounded_timeout(settings.skaleet_admin_timeout, "skaleet.oauth")
+                )
+                response.raise_for_status()
+                token_data = response.json()
+        except httpx.HTTPError as e:
+            logger.error(f"Skaleet OAuth error: {e}")
+            raise
+        
+        access_token = token_data.get("access_token")
+        if not access_token:
+            raise ValueError("No access_token in OAuth response")
+        expires_in = float(token_data.get("expires_in") or settings.skaleet_token_default_ttl)
+        return access_token, expires_in
+
+
+# Instance partagée par tout le process
+admin_token_manager = SkaleetTokenManager()
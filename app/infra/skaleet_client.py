@@ -1,6 +1,11 @@
 import httpx
 from app.core.config import settings
+from app.infra.http_clients import get_http_client, SKALEET_ADMIN
+from app.infra.resilience import get_guard
+from app.infra.skaleet_auth import admin_token_manager
+from app.utils.deadline import bounded_timeout
 from app.schemas.skaleet import SkaleetCardRequest, SkaleetCardResponse
+from typing import Optional
 import logging
 
 logger = logging.getLogger(__name__)
@@ -9,38 +14,54 @@ logger = logging.getLogger(__name__)
 async def get_admin_token() -> str:
     """
     Obtient un token d'accès admin Skaleet via OAuth2 client credentials
+    (mis en cache et rafraîchi par le gestionnaire de token partagé)
     """
-    async with httpx.AsyncClient() as client:
-        try:
-            response = await client.post(
-                f"{settings.skaleet_admin_base_url}/oauth/token",
-                data={
-                    "grant_type": "client_credentials",
-                    "client_id": settings.skaleet_admin_client_id,
-                    "client_secret": settings.skaleet_admin_client_secret
-                },
-                timeout=30.0
+    return await admin_token_manager.get_token()
+
+
+async def request_with_admin_token(
+    client: httpx.AsyncClient,
+    method: str,
+    url: str,
+    headers: Optional[dict] = None,
+    guard_name: str = "skaleet.admin",
+    **kwargs
+) -> httpx.Response:
+    """
+    Exécute une requête authentifiée vers Skaleet Admin.
+    Sur 401, le token est invalidé puis la requête est rejouée une seule fois.
+    Chaque tentative passe par la garde `guard_name` (circuit breaker + limite de concurrence).
+    """
+    for attempt in range(2):
+        token = await get_admin_token()
+        request_headers = {
+            **(headers or {}),
+            "Authorization": f"Bearer {token}"
+        }
+        async with get_guard(guard_name).protect() as call:
+            response = await client.request(
+                method,
+                url,
+                headers=request_headers,
+                # N'utiliser que le budget restant de la requête (le cas échéant)
+                timeout=bounded_timeout(settings.skaleet_admin_timeout, guard_name),
+                **kwargs
             )
-            response.raise_for_status()
-            token_data = response.json()
-            access_token = token_data.get("access_token")
-            if not access_token:
-                raise ValueError("No access_token in OAuth response")
-            return access_token
-        except httpx.HTTPError as e:
-            logger.error(f"Skaleet OAuth error: {e}")
-            raise
-        except Exception as e:
-            logger.error(f"Unexpected error getting admin token: {e}", exc_info=True)
-            raise
+            call.record_response(response)
+        if response.status_code != 401 or attempt == 1:
+            return response
+        logger.warning(f"Skaleet returned 401 for {method} {url}, refreshing token and retrying once")
+        admin_token_manager.invalidate(token)
+    return response
 
 
 async def send_card_operation_result(
-    card_id: int, 
-    operation_type: str, 
+    card_id: int,
+    operation_type: str,
     result: str,
     visa_card_number: str | None = None,
-    ni_details: dict | None = None
+    ni_details: dict | None = None,
+    http_client: Optional[httpx.AsyncClient] = None
 ):
     """
     Envoie le résultat d'une opération carte à Skaleet Admin API
@@ -51,11 +72,11 @@ async def send_card_operation_result(
         result: Résultat de l'opération ("accept" ou "error")
         visa_card_number: Numéro de carte VISA généré par NI (optionnel)
         ni_details: Détails supplémentaires de la réponse NI (optionnel)
+        http_client: Client HTTP à utiliser (par défaut le client Skaleet partagé)
     """
-    token = await get_admin_token()
+    client = http_client or get_http_client(SKALEET_ADMIN)
     url = f"{settings.skaleet_admin_base_url}/cards/{card_id}/operation/{operation_type}/{result}"
     headers = {
-        "Authorization": f"Bearer {token}",
         "Content-Type": "application/json"
     }
     
@@ -72,111 +93,60 @@ async def send_card_operation_result(
         if "niCardId" in ni_details:
             body["niCardId"] = ni_details["niCardId"]
     
-    async with httpx.AsyncClient() as client:
-        try:
-            response = await client.post(
-                url,
-                json=body if body else None,
-                headers=headers,
-                timeout=30.0
-            )
-            response.raise_for_status()
-            logger.info(
-                f"Successfully sent operation result to Skaleet: "
-                f"card_id={card_id}, operation={operation_type}, result={result}, "
-                f"visaCardNumber={'***' + visa_card_number[-4:] if visa_card_number else 'N/A'}"
-            )
-        except httpx.HTTPError as e:
-            logger.error(f"Skaleet API error when sending operation result: {e}")
-            raise
-        except Exception as e:
-            logger.error(f"Unexpected error sending operation result: {e}", exc_info=True)
-            raise
+    try:
+        response = await request_with_admin_token(
+            client,
+            "POST",
+            url,
+            json=body if body else None,
+            headers=headers,
+            guard_name="skaleet.operation_result"
+        )
+        response.raise_for_status()
+        logger.info(
+            f"Successfully sent operation result to Skaleet: "
+            f"card_id={card_id}, operation={operation_type}, result={result}, "
+            f"visaCardNumber={'***' + visa_card_number[-4:] if visa_card_number else 'N/A'}"
+        )
+    except httpx.HTTPError as e:
+        logger.error(f"Skaleet API error when sending operation result: {e}")
+        raise
+    except Exception as e:
+        logger.error(f"Unexpected error sending operation result: {e}", exc_info=True)
+        raise
 
 
 class SkaleetClient:
-    def __init__(self):
+    def __init__(self, http_client: Optional[httpx.AsyncClient] = None):
+        # Client HTTP injecté (partagé, créé dans le lifespan) pour réutiliser les connexions
+        self.http_client = http_client or get_http_client(SKALEET_ADMIN)
         self.base_url = settings.skaleet_admin_base_url
-        self.client_id = settings.skaleet_admin_client_id
-        self.client_secret = settings.skaleet_admin_client_secret
-        self._access_token = None
     
     async def _get_access_token(self) -> str:
-        """Obtient un token d'accès via OAuth2 client credentials"""
-        if self._access_token:
-            return self._access_token
-        
-        async with httpx.AsyncClient() as client:
-            try:
-                response = await client.post(
-                    f"{self.base_url}/oauth/token",
-                    data={
-                        "grant_type": "client_credentials",
-                        "client_id": self.client_id,
-                        "client_secret": self.client_secret
-                    },
-                    timeout=30.0
-                )
-                response.raise_for_status()
-                token_data = response.json()
-                self._access_token = token_data.get("access_token")
-                return self._access_token
-            except httpx.HTTPError as e:
-                logger.error(f"Skaleet OAuth error: {e}")
-                raise
+        """Obtient un token d'accès via le gestionnaire de token partagé"""
+        return await get_admin_token()
     
-    async def _get_headers(self) -> dict:
-        """Retourne les headers avec le token d'accès"""
-        token = await self._get_access_token()
-        return {
-            "Authorization": f"Bearer {token}",
-            "Content-Type": "application/json"
-        }
+    async def _request(self, method: str, path: str, **kwargs) -> SkaleetCardResponse:
+        try:
+            response = await request_with_admin_token(
+                self.http_client,
+                method,
+                f"{self.base_url}{path}",
+                headers={"Content-Type": "application/json"},
+                guard_name="skaleet.cards",
+                **kwargs
+            )
+            response.raise_for_status()
+            return SkaleetCardResponse(**response.json())
+        except httpx.HTTPError as e:
+            logger.error(f"Skaleet API error: {e}")
+            raise
     
     async def create_card(self, card_data: dict) -> SkaleetCardResponse:
-        headers = await self._get_headers()
-        async with httpx.AsyncClient() as client:
-            try:
-                response = await client.post(
-                    f"{self.base_url}/cards",
-                    json=card_data,
-                    headers=headers,
-                    timeout=30.0
-                )
-                response.raise_for_status()
-                return SkaleetCardResponse(**response.json())
-            except httpx.HTTPError as e:
-                logger.error(f"Skaleet API error: {e}")
-                raise
+        return await self._request("POST", "/cards", json=card_data)
     
     async def get_card(self, card_id: str) -> SkaleetCardResponse:
-        headers = await self._get_headers()
-        async with httpx.AsyncClient() as client:
-            try:
-                response = await client.get(
-                    f"{self.base_url}/cards/{card_id}",
-                    headers=headers,
-                    timeout=30.0
-                )
-                response.raise_for_status()
-                return SkaleetCardResponse(**response.json())
-            except httpx.HTTPError as e:
-                logger.error(f"Skaleet API error: {e}")
-                raise
+        return await self._request("GET", f"/cards/{card_id}")
     
     async def update_card(self, card_id: str, card_data: dict) -> SkaleetCardResponse:
-        headers = await self._get_headers()
-        async with httpx.AsyncClient() as client:
-            try:
-                response = await client.patch(
-                    f"{self.base_url}/cards/{card_id}",
-                    json=card_data,
-                    headers=headers,
-                    timeout=30.0
-                )
-                response.raise_for_status()
-                return SkaleetCardResponse(**response.json())
-            except httpx.HTTPError as e:
-                logger.error(f"Skaleet API error: {e}")
-                raise
-
+        return await self._request("PATCH", f"/cards/{card_id}", json=card_data)
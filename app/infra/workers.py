@@ -0,0 +1,77 @@
+"""
+Pool de workers asynchrones qui interrogent une table de travail en tâche de fond
+
+Chaque worker appelle `run_once()` en boucle. Quand il n'y a rien à traiter,
+il attend `poll_interval` secondes ou un réveil explicite via `wake()`.
+"""
+import asyncio
+import logging
+from typing import List, Optional
+
+logger = logging.getLogger(__name__)
+
+
+class PollingWorkerPool:
+    name = "worker"
+    
+    def __init__(self, workers: int, poll_interval: float):
+        self.workers = workers
+        self.poll_interval = poll_interval
+        self._tasks: List[asyncio.Task] = []
+        self._wakeup: Optional[asyncio.Event] = None
+        self._stopping = False
+    
+    @property
+    def running(self) -> bool:
+        return bool(self._tasks)
+    
+    async def run_once(self) -> int:
+        """Traite un lot de travail et retourne le nombre d'éléments traités"""
+        raise NotImplementedError
+    
+    async def start(self):
+        """Démarre les workers (aucun si workers <= 0)"""
+        if self.running or self.workers <= 0:
+            return
+        self._stopping = False
+        self._wakeup = asyncio.Event()
+        self._tasks = [
+            asyncio.create_task(self._loop(index), name=f"{self.name}-{index}")
+            for index in range(self.workers)
+        ]
+        logger.info(f"{self.name}: {self.workers} worker(s) démarré(s)")
+    
+    async def stop(self):
+        """Arrête les workers en laissant le lot en cours se terminer"""
+        if not self.running:
+            return
+        self._stopping = True
+        self.wake()
+        tasks, self._tasks = self._tasks, []
+        _, pending = await asyncio.wait(tasks, timeout=self.poll_interval + 5.0)
+        for task in pending:
+            task.cancel()
+        await asyncio.gather(*pending, return_exceptions=True)
+        logger.info(f"{self.name}: workers arrêtés")
+    
+    def wake(self):
+        """Réveille les workers en attente (ex: après l'écriture d'un nouvel élément)"""
+        if self._wakeup is not None:
+            self._wakeup.set()
+    
+    async def _loop(self, index: int):
+        while not self._stopping:
+            try:
+                processed = await self.run_once()
+            except Exception as e:
+                logger.error(f"{self.name}-{index}: erreur pendant le traitement d'un lot: {e}", exc_info=True)
+                processed = 0
+            
+            if processed or self._stopping:
+                continue
+            
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout=self.poll_interval)
+            except asyncio.TimeoutError:
+                pass
+            self._wakeup.clear()
@@ -0,0 +1,62 @@
+"""
+Extrait des opérations carte pour la réconciliation NI
+    
+    python -m app.jobs.export_operations [--from 2026-10-17] [--to 2026-10-18] \
+        [--format ndjson|csv] [--gzip] [--operation card_blocking] [--status SUCCESS] [--output fichier]
+
+Par défaut : les opérations de la veille (UTC), en NDJSON sur la sortie standard.
+Les lignes sont lues via un curseur serveur et écrites au fil de l'eau (app/domain/exports.py).
+"""
+import argparse
+import asyncio
+import sys
+from datetime import datetime, timedelta
+from typing import List, Optional
+
+from app.domain.enums import ExportFormat, OperationStatus, OperationType
+from app.domain.exports import export_query, iter_export
+from app.infra.db import read_session_factory
+
+
+async def export_operations(output, args) -> int:
+    """Écrit l'export dans `output` (fichier binaire) ; retourne le nombre d'octets écrits"""
+    query = export_query(args.date_from, args.date_to, args.operation, args.status)
+    written = 0
+    session_factory = await read_session_factory()
+    async with session_factory() as session:
+        async for chunk in iter_export(session, query, ExportFormat(args.format), args.gzip):
+            output.write(chunk)
+            written += len(chunk)
+    return written
+
+
+def build_parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(description="Export des opérations carte (NDJSON / CSV)")
+    parser.add_argument("--from", dest="date_from", type=datetime.fromisoformat, default=None, help="Inclus (défaut: veille)")
+    parser.add_argument("--to", dest="date_to", type=datetime.fromisoformat, default=None, help="Exclu (défaut: --from + 1 jour)")
+    parser.add_argument("--format", choices=[f.value for f in ExportFormat], default=ExportFormat.NDJSON.value)
+    parser.add_argument("--gzip", action="store_true", help="Compresse la sortie")
+    parser.add_argument("--operation", choices=[o.value for o in OperationType], default=None)
+    parser.add_argument("--status", choices=[s.value for s in OperationStatus], default=None)
+    parser.add_argument("--output", default="-", help="Fichier de sortie ('-' = sortie standard)")
+    return parser
+
+
+def main(argv: Optional[List[str]] = None):
+    args = build_parser().parse_args(argv)
+    if args.date_from is None:
+        today = datetime.utcnow().replace(hour=0, minute=0, second=0, microsecond=0)
+        args.date_from = today - timedelta(days=1)
+    if args.date_to is None:
+        args.date_to = args.date_from + timedelta(days=1)
+    
+    if args.output == "-":
+        asyncio.run(export_operations(sys.stdout.buffer, args))
+        return
+    with open(args.output, "wb") as file:
+        written = asyncio.run(export_operations(file, args))
+    print(f"{args.output}: {written} bytes", file=sys.stderr)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,210 @@
+"""
+Gestion des partitions mensuelles de card_operations (PostgreSQL)
+
+- crée à l'avance les partitions des `partition_months_ahead` prochains mois ;
+- détache les partitions dont tout le contenu est plus ancien que
+  `partition_detach_after_months` mois (0 = jamais). La table détachée reste en
+  base, hors des index et du vacuum de la table chaude, jusqu'à son archivage
+  (app/jobs/retention.py) ou sa suppression. Elle est marquée par un commentaire
+  (DETACHED_COMMENT) : la rétention ne supprime que les tables ainsi marquées.
+
+Lancé au démarrage puis périodiquement par PartitionMaintainer, ou à la main :
+    python -m app.jobs.partitions [--months-ahead 3] [--detach-older-than 12] [--dry-run]
+Sans effet sur une base autre que PostgreSQL (tests SQLite).
+"""
+import argparse
+import asyncio
+import json
+import logging
+import re
+from datetime import datetime
+from typing import List, Optional, Tuple
+
+from sqlalchemy import text
+from sqlalchemy.ext.asyncio import AsyncEngine
+
+from app.core.config import settings
+from app.infra.db import engine as default_engine
+from app.infra.workers import PollingWorkerPool
+
+logger = logging.getLogger(__name__)
+
+PARTITIONED_TABLE = "card_operations"
+
+# Sérialise la maintenance entre les instances du service
+_ADVISORY_LOCK_KEY = "card_operations_partitions"
+
+# Commentaire posé sur une partition avant son détachement, lu par la rétention
+DETACHED_COMMENT = "detached from card_operations by app.jobs.partitions"
+
+_BOUND = re.compile(r"FROM \((.+?)\) TO \((.+?)\)")
+
+
+def month_start(value: datetime) -> datetime:
+    return value.replace(day=1, hour=0, minute=0, second=0, microsecond=0)
+
+
+def add_months(month: datetime, months: int) -> datetime:
+    index = month.month - 1 + months
+    return month.replace(year=month.year + index // 12, month=index % 12 + 1, day=1)
+
+
+def partition_name(month: datetime) -> str:
+    return f"{PARTITIONED_TABLE}_{month:%Y_%m}"
+
+
+def _parse_bound(value: str) -> Optional[datetime]:
+    """Borne d'une partition ("'2026-11-01 00:00:00'", MINVALUE ou MAXVALUE)"""
+    value = value.strip().strip("'")
+    if value in ("MINVALUE", "MAXVALUE"):
+        return None
+    return datetime.fromisoformat(value)
+
+
+async def list_partitions(connection) -> List[Tuple[str, Optional[datetime], Optional[datetime]]]:
+    """Partitions attachées : (nom, borne basse, borne haute), None pour MINVALUE/MAXVALUE"""
+    result = await connection.execute(text("""
+        SELECT child.relname, pg_get_expr(child.relpartbound, child.oid)
+        FROM pg_inherits
+        JOIN pg_class child ON child.oid = pg_inherits.inhrelid
+        WHERE pg_inherits.inhparent = CAST(:table AS regclass)
+        ORDER BY child.relname
+    """), {"table": PARTITIONED_TABLE})
+    partitions = []
+    for name, bound in result.all():
+        match = _BOUND.search(bound or "")
+        if match:
+            partitions.append((name, _parse_bound(match.group(1)), _parse_bound(match.group(2))))
+    return partitions
+
+
+def _covers(partitions, month: datetime) -> bool:
+    return any(
+        (lower is None or lower <= month) and (upper is None or month < upper)
+        for _, lower, upper in partitions
+    )
+
+
+async def ensure_partitions(
+    engine: AsyncEngine,
+    months_ahead: int,
+    now: Optional[datetime] = None,
+    dry_run: bool = False
+) -> List[str]:
+    """Crée les partitions manquantes du mois courant et des `months_ahead` suivants"""
+    current = month_start(now or datetime.utcnow())
+    created = []
+    async with engine.begin() as connection:
+        await connection.execute(text("SELECT pg_advisory_xact_lock(hashtext(:key))"), {"key": _ADVISORY_LOCK_KEY})
+        partitions = await list_partitions(connection)
+        for offset in range(months_ahead + 1):
+            month = add_months(current, offset)
+            if _covers(partitions, month):
+                continue
+            name = partition_name(month)
+            created.append(name)
+            if not dry_run:
+                await connection.execute(text(
+                    f"CREATE TABLE IF NOT EXISTS {name} PARTITION OF {PARTITIONED_TABLE} "
+                    f"FOR VALUES FROM ('{month:%Y-%m-%d}') TO ('{add_months(month, 1):%Y-%m-%d}')"
+                ))
+    return created
+
+
+async def detach_old_partitions(
+    engine: AsyncEngine,
+    older_than_months: int,
+    now: Optional[datetime] = None,
+    dry_run: bool = False
+) -> List[str]:
+    """
+    Détache les partitions dont la borne haute précède le début du mois courant
+    moins `older_than_months` mois. DETACH ... CONCURRENTLY ne bloque pas les
+    écritures mais doit s'exécuter hors transaction.
+    """
+    if older_than_months <= 0:
+        return []
+    cutoff = add_months(month_start(now or datetime.utcnow()), -older_than_months)
+    async with engine.connect() as connection:
+        partitions = await list_partitions(connection)
+    expired = [name for name, _, upper in partitions if upper is not None and upper <= cutoff]
+    if dry_run or not expired:
+        return expired
+    
+    async with engine.connect() as connection:
+        connection = await connection.execution_options(isolation_level="AUTOCOMMIT")
+        for name in expired:
+            # Marquée avant le détachement : une table détachée n'est jamais sans marque
+            await connection.execute(text(f"COMMENT ON TABLE {name} IS '{DETACHED_COMMENT}'"))
+            await connection.execute(text(f"ALTER TABLE {PARTITIONED_TABLE} DETACH PARTITION {name} CONCURRENTLY"))
+            logger.info(f"Partition {name} detached from {PARTITIONED_TABLE}")
+    return expired
+
+
+async def maintain_partitions(
+    engine: AsyncEngine = default_engine,
+    months_ahead: Optional[int] = None,
+    detach_older_than: Optional[int] = None,
+    dry_run: bool = False
+) -> dict:
+    """Crée les partitions à venir puis détache les plus anciennes"""
+    if engine.dialect.name != "postgresql":
+        return {"created": [], "detached": []}
+    created = await ensure_partitions(
+        engine,
+        settings.partition_months_ahead if months_ahead is None else months_ahead,
+        dry_run=dry_run
+    )
+    detached = await detach_old_partitions(
+        engine,
+        settings.partition_detach_after_months if detach_older_than is None else detach_older_than,
+        dry_run=dry_run
+    )
+    if created:
+        logger.info(f"Partitions {'to create' if dry_run else 'created'}: {', '.join(created)}")
+    return {"created": created, "detached": detached}
+
+
+class PartitionMaintainer(PollingWorkerPool):
+    """Maintenance périodique des partitions (un worker, toutes les partition_maintenance_interval secondes)"""
+    name = "partitions"
+    
+    def __init__(self, engine: AsyncEngine = default_engine, interval: Optional[float] = None):
+        interval = settings.partition_maintenance_interval if interval is None else interval
+        super().__init__(workers=1 if interval > 0 else 0, poll_interval=interval)
+        self.engine = engine
+    
+    async def run_once(self) -> int:
+        await maintain_partitions(self.engine)
+        # Rien à enchaîner : le worker attend l'intervalle suivant
+        return 0
+
+
+partition_maintainer = PartitionMaintainer()
+
+
+def build_parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(description="Maintenance des partitions mensuelles de card_operations")
+    parser.add_argument("--months-ahead", type=int, default=None, help="Mois à créer d'avance (défaut: settings)")
+    parser.add_argument(
+        "--detach-older-than",
+        type=int,
+        default=None,
+        help="Détache les partitions plus anciennes que N mois (0 = jamais, défaut: settings)"
+    )
+    parser.add_argument("--dry-run", action="store_true", help="Affiche les changements sans les appliquer")
+    return parser
+
+
+def main(argv: Optional[List[str]] = None):
+    args = build_parser().parse_args(argv)
+    result = asyncio.run(maintain_partitions(
+        months_ahead=args.months_ahead,
+        detach_older_than=args.detach_older_than,
+        dry_run=args.dry_run
+    ))
+    print(json.dumps(result, indent=2))
+
+
+if __name__ == "__main__":
+    main()
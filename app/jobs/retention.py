@@ -0,0 +1,415 @@
+"""
+Rétention des tables chaudes : archivage puis purge des lignes anciennes
+
+Pour card_operations et webhook_events, les lignes plus anciennes que
+`retention_days` jours sont traitées jour par jour, du plus ancien au plus récent :
+1. export du jour via un curseur serveur (lignes lues par paquets, jamais toutes
+   en mémoire) dans un fichier NDJSON compressé, un fichier par jour :
+   {retention_archive_dir}/{table}/{AAAA}/{MM}/{table}_{AAAA-MM-JJ}.ndjson.gz
+   puis une ligne dans {table}/manifest.ndjson (nombre de lignes, sha256 du NDJSON) ;
+2. suppression des lignes du jour par petits lots (une transaction par lot,
+   pause entre deux lots pour la réplication et l'autovacuum).
+
+Un checkpoint par table (_checkpoint_{table}.json) enregistre le jour et le
+fichier en cours d'export avant d'écrire l'archive, puis le jour archivé en
+cours de purge : un run interrompu réécrit le même fichier (jamais de seconde
+partie pour un même jour) ou reprend la purge sans réexporter un jour déjà
+partiellement supprimé. Les jours passés ne reçoivent plus d'écritures
+(created_at est fixé à l'insertion).
+
+Sous PostgreSQL, les partitions détachées de card_operations par
+app/jobs/partitions.py (schéma courant, nom card_operations_AAAA_MM ou
+card_operations_legacy, marquées par DETACHED_COMMENT) sont archivées en
+totalité puis supprimées ; aucune autre table n'est touchée, et les réservations webhook_claims
+plus anciennes que la rétention sont purgées (sans archive : le webhookId figure
+dans l'opération archivée). Les jobs de webhook terminés (webhook_jobs, DONE ou
+DEAD) sont purgés de la même façon ; les jobs encore PENDING sont conservés.
+
+Lancé périodiquement par RetentionRunner (RETENTION_INTERVAL > 0), ou à la main :
+    python -m app.jobs.retention [--older-than-days 365] [--table card_operations] [--dry-run]
+Le répertoire d'archive doit être un stockage partagé si plusieurs instances peuvent l'exécuter.
+"""
+import argparse
+import asyncio
+import gzip
+import hashlib
+import json
+import logging
+import os
+import re
+import uuid
+from datetime import date, datetime, timedelta
+from pathlib import Path
+from typing import List, Optional
+
+from sqlalchemy import MetaData, Table, delete, func, select, text
+from sqlalchemy.ext.asyncio import AsyncEngine
+
+from app.core.config import settings
+from app.domain.enums import WebhookJobStatus
+from app.domain.models import CardOperation, WebhookClaim, WebhookEvent, WebhookJob
+from app.infra.db import engine as default_engine
+from app.infra.workers import PollingWorkerPool
+from app.jobs.partitions import DETACHED_COMMENT
+
+logger = logging.getLogger(__name__)
+
+ARCHIVED_TABLES = {
+    CardOperation.__tablename__: CardOperation.__table__,
+    WebhookEvent.__tablename__: WebhookEvent.__table__,
+}
+
+# Une seule exécution à la fois entre les instances du service
+_ADVISORY_LOCK_KEY = "retention"
+
+# Noms des partitions créées par app/jobs/partitions.py et de la partition historique (migration 007)
+_PARTITION_NAME = re.compile(rf"^{CardOperation.__tablename__}_(\d{{4}}_\d{{2}}|legacy)$")
+
+
+def retention_cutoff(older_than_days: int, now: Optional[datetime] = None) -> datetime:
+    """Début du jour le plus récent à conserver : seuls des jours complets sont archivés"""
+    today = (now or datetime.utcnow()).replace(hour=0, minute=0, second=0, microsecond=0)
+    return today - timedelta(days=older_than_days)
+
+
+def _json_default(value):
+    if isinstance(value, (datetime, date)):
+        return value.isoformat()
+    if isinstance(value, uuid.UUID):
+        return str(value)
+    raise TypeError(f"Type non sérialisable: {type(value).__name__}")
+
+
+def _write_json(path: Path, document: dict):
+    """Écriture atomique (fichier temporaire puis renommage)"""
+    tmp = path.with_name(path.name + ".tmp")
+    tmp.write_text(json.dumps(document, indent=2))
+    os.replace(tmp, path)
+
+
+class _Checkpoint:
+    """Jour archivé dont la purge n'est pas terminée, pour une table source"""
+    
+    def __init__(self, path: Path):
+        self.path = path
+        self.state = json.loads(path.read_text()) if path.exists() else None
+    
+    def _day(self, status: str) -> Optional[datetime]:
+        if self.state and self.state.get("status") == status:
+            return datetime.fromisoformat(self.state["day"])
+        return None
+    
+    @property
+    def exporting_day(self) -> Optional[datetime]:
+        """Jour dont l'export a commencé sans être confirmé (fichier dans state["file"])"""
+        return self._day("exporting")
+    
+    @property
+    def pending_day(self) -> Optional[datetime]:
+        return self._day("archived")
+    
+    def save(self, **state):
+        self.state = state
+        _write_json(self.path, state)
+
+
+class TableArchiver:
+    """Archive puis purge, jour par jour, les lignes d'une table antérieures à `cutoff`"""
+    
+    def __init__(
+        self,
+        engine: AsyncEngine,
+        table: Table,
+        archive_dir: Path,
+        archive_name: Optional[str] = None,
+        batch_size: Optional[int] = None,
+        batch_pause: Optional[float] = None
+    ):
+        self.engine = engine
+        self.table = table
+        # Les partitions détachées sont archivées avec leur table d'origine
+        self.root = Path(archive_dir) / (archive_name or table.name)
+        self.batch_size = batch_size or settings.retention_batch_size
+        self.batch_pause = settings.retention_batch_pause if batch_pause is None else batch_pause
+        self.key = next(iter(table.primary_key.columns))
+        self.created_at = table.c.created_at
+    
+    def _day_filter(self, day: datetime):
+        return (self.created_at >= day) & (self.created_at < day + timedelta(days=1))
+    
+    async def oldest_day(self, cutoff: Optional[datetime]) -> Optional[datetime]:
+        query = select(func.min(self.created_at))
+        if cutoff is not None:
+            query = query.where(self.created_at < cutoff)
+        async with self.engine.connect() as connection:
+            oldest = (await connection.execute(query)).scalar()
+        return oldest.replace(hour=0, minute=0, second=0, microsecond=0) if oldest else None
+    
+    async def count_by_day(self, cutoff: Optional[datetime]) -> dict:
+        """Lignes à archiver par jour (mode dry-run)"""
+        day = func.date(self.created_at)
+        query = select(day, func.count()).group_by(day).order_by(day)
+        if cutoff is not None:
+            query = query.where(self.created_at < cutoff)
+        async with self.engine.connect() as connection:
+            rows = (await connection.execute(query)).all()
+        return {str(day)[:10]: count for day, count in rows}
+    
+    def _archive_path(self, day: datetime) -> Path:
+        directory = self.root / f"{day:%Y}" / f"{day:%m}"
+        directory.mkdir(parents=True, exist_ok=True)
+        path = directory / f"{self.root.name}_{day:%Y-%m-%d}.ndjson.gz"
+        part = 1
+        # Jamais d'écrasement d'une archive existante (ex: même jour dans une partition détachée)
+        while path.exists():
+            part += 1
+            path = directory / f"{self.root.name}_{day:%Y-%m-%d}.{part}.ndjson.gz"
+        return path
+    
+    async def export_day(self, day: datetime, path: Optional[Path] = None) -> dict:
+        """
+        Exporte les lignes du jour via un curseur serveur dans `path` (écrasé s'il
+        existe, nouveau fichier par défaut) ; retourne l'entrée du manifeste
+        """
+        path = path or self._archive_path(day)
+        tmp = path.with_name(path.name + ".tmp")
+        digest = hashlib.sha256()
+        rows = 0
+        query = (
+            select(self.table)
+            .where(self._day_filter(day))
+            .order_by(self.created_at, self.key)
+            .execution_options(yield_per=self.batch_size)
+        )
+        archive = gzip.open(tmp, "wb")
+        try:
+            async with self.engine.connect() as connection:
+                result = await connection.stream(query)
+                async for partition in result.mappings().partitions():
+                    chunk = "".join(
+                        json.dumps(dict(row), default=_json_default, ensure_ascii=False) + "\n"
+                        for row in partition
+                    ).encode()
+                    digest.update(chunk)
+                    await asyncio.to_thread(archive.write, chunk)
+                    rows += len(partition)
+        finally:
+            archive.close()
+        os.replace(tmp, path)
+        
+        entry = {
+            "day": f"{day:%Y-%m-%d}",
+            "table": self.table.name,
+            "file": str(path.relative_to(self.root)),
+            "rows": rows,
+            "sha256": digest.hexdigest(),
+            "archived_at": datetime.utcnow().isoformat()
+        }
+        self._record(entry)
+        return entry
+    
+    def _record(self, entry: dict):
+        """Ajoute l'entrée au manifeste, sauf si son fichier y figure déjà (export repris)"""
+        manifest_path = self.root / "manifest.ndjson"
+        if manifest_path.exists():
+            with open(manifest_path) as manifest:
+                if any(json.loads(line)["file"] == entry["file"] for line in manifest if line.strip()):
+                    return
+        with open(manifest_path, "a") as manifest:
+            manifest.write(json.dumps(entry) + "\n")
+    
+    async def delete_batches(self, condition) -> int:
+        """Supprime les lignes qui vérifient `condition` par lots de batch_size, une transaction par lot"""
+        deleted = 0
+        while True:
+            batch = select(self.key).where(condition).limit(self.batch_size)
+            async with self.engine.begin() as connection:
+                result = await connection.execute(delete(self.table).where(condition, self.key.in_(batch)))
+            deleted += result.rowcount
+            if result.rowcount < self.batch_size:
+                return deleted
+            await asyncio.sleep(self.batch_pause)
+    
+    async def run(self, cutoff: Optional[datetime], dry_run: bool = False) -> dict:
+        """Archive et purge tous les jours antérieurs à `cutoff` (None = toute la table)"""
+        if dry_run:
+            days = await self.count_by_day(cutoff)
+            return {"rows": sum(days.values()), "days": days}
+        
+        self.root.mkdir(parents=True, exist_ok=True)
+        checkpoint = _Checkpoint(self.root / f"_checkpoint_{self.table.name}.json")
+        report = {"rows": 0, "deleted": 0, "files": []}
+        while True:
+            day = checkpoint.pending_day
+            if day is None:
+                day = checkpoint.exporting_day
+                if day is not None:
+                    path = self.root / checkpoint.state["file"]
+                    logger.info(f"Resuming export of {self.table.name} for {day:%Y-%m-%d} to {checkpoint.state['file']}")
+                else:
+                    day = await self.oldest_day(cutoff)
+                    if day is None:
+                        return report
+                    path = self._archive_path(day)
+                    # Fichier réservé avant l'export : une reprise le réécrit au lieu d'en créer un autre
+                    checkpoint.save(status="exporting", day=f"{day:%Y-%m-%d}", file=str(path.relative_to(self.root)))
+                entry = await self.export_day(day, path)
+                checkpoint.save(status="archived", **entry)
+                report["rows"] += entry["rows"]
+                report["files"].append(entry["file"])
+                logger.info(f"Archived {entry['rows']} rows of {self.table.name} for {entry['day']} to {entry['file']}")
+            else:
+                logger.info(f"Resuming purge of {self.table.name} for {day:%Y-%m-%d}")
+            
+            deleted = await self.delete_batches(self._day_filter(day))
+            report["deleted"] += deleted
+            checkpoint.save(**{**checkpoint.state, "status": "purged", "deleted": deleted})
+
+
+def is_detached_partition_name(name: str) -> bool:
+    """Nom d'une partition de card_operations (mensuelle ou historique), à l'exclusion de toute autre table"""
+    return _PARTITION_NAME.match(name) is not None
+
+
+async def _detached_partitions(engine: AsyncEngine) -> List[str]:
+    """
+    Partitions de card_operations détachées par app/jobs/partitions.py (PostgreSQL) :
+    schéma courant, nom de partition et commentaire DETACHED_COMMENT
+    """
+    async with engine.connect() as connection:
+        result = await connection.execute(text("""
+            SELECT c.relname FROM pg_class c
+            JOIN pg_namespace n ON n.oid = c.relnamespace
+            WHERE n.nspname = current_schema()
+              AND c.relkind = 'r' AND NOT c.relispartition
+              AND c.relname LIKE :prefix
+              AND obj_description(c.oid, 'pg_class') = :comment
+            ORDER BY c.relname
+        """), {"prefix": f"{CardOperation.__tablename__}\\_%", "comment": DETACHED_COMMENT})
+        return [name for name in result.scalars() if is_detached_partition_name(name)]
+
+
+def _partition_table(name: str) -> Table:
+    """Table de même structure que card_operations (types JSONB, UUID conservés)"""
+    return Table(name, MetaData(), *(column._copy() for column in CardOperation.__table__.columns))
+
+
+async def run_retention(
+    engine: AsyncEngine = default_engine,
+    older_than_days: Optional[int] = None,
+    tables: Optional[List[str]] = None,
+    archive_dir: Optional[str] = None,
+    dry_run: bool = False,
+    now: Optional[datetime] = None
+) -> dict:
+    """Archive puis purge les tables chaudes ; retourne le compte rendu par table"""
+    older_than_days = settings.retention_days if older_than_days is None else older_than_days
+    if older_than_days <= 0:
+        raise ValueError("older_than_days doit être strictement positif")
+    cutoff = retention_cutoff(older_than_days, now)
+    archive_dir = Path(archive_dir or settings.retention_archive_dir)
+    tables = tables or list(ARCHIVED_TABLES)
+    report = {"cutoff": cutoff.isoformat(), "dry_run": dry_run, "tables": {}}
+    
+    postgresql = engine.dialect.name == "postgresql"
+    async with engine.connect() as lock_connection:
+        if postgresql:
+            locked = (await lock_connection.execute(
+                text("SELECT pg_try_advisory_lock(hashtext(:key))"), {"key": _ADVISORY_LOCK_KEY}
+            )).scalar()
+            await lock_connection.commit()
+            if not locked:
+                logger.info("Retention already running on another instance, skipping")
+                return {**report, "skipped": True}
+        try:
+            for name in tables:
+                archiver = TableArchiver(engine, ARCHIVED_TABLES[name], archive_dir)
+                report["tables"][name] = await archiver.run(cutoff, dry_run=dry_run)
+            
+            claims = TableArchiver(engine, WebhookClaim.__table__, archive_dir)
+            if dry_run:
+                report["tables"][claims.table.name] = {"rows": sum((await claims.count_by_day(cutoff)).values())}
+            else:
+                deleted = await claims.delete_batches(claims.created_at < cutoff)
+                report["tables"][claims.table.name] = {"deleted": deleted}
+            
+            jobs = TableArchiver(engine, WebhookJob.__table__, archive_dir)
+            finished = (jobs.created_at < cutoff) & (jobs.table.c.status != WebhookJobStatus.PENDING.value)
+            if dry_run:
+                async with engine.connect() as connection:
+                    rows = (await connection.execute(select(func.count()).select_from(jobs.table).where(finished))).scalar()
+                report["tables"][jobs.table.name] = {"rows": rows}
+            else:
+                report["tables"][jobs.table.name] = {"deleted": await jobs.delete_batches(finished)}
+            
+            if postgresql and CardOperation.__tablename__ in tables:
+                for partition in await _detached_partitions(engine):
+                    archiver = TableArchiver(
+                        engine,
+                        _partition_table(partition),
+                        archive_dir,
+                        archive_name=CardOperation.__tablename__
+                    )
+                    report["tables"][partition] = await archiver.run(None, dry_run=dry_run)
+                    if not dry_run:
+                        async with engine.begin() as connection:
+                            await connection.execute(text(f'DROP TABLE "{partition}"'))
+                        logger.info(f"Detached partition {partition} archived and dropped")
+        finally:
+            if postgresql:
+                await lock_connection.execute(
+                    text("SELECT pg_advisory_unlock(hashtext(:key))"), {"key": _ADVISORY_LOCK_KEY}
+                )
+                await lock_connection.commit()
+    return report
+
+
+class RetentionRunner(PollingWorkerPool):
+    """
+    Rétention périodique (un worker, toutes les retention_interval secondes).
+    Un arrêt pendant un run est sans risque : le checkpoint permet la reprise.
+    """
+    name = "retention"
+    
+    def __init__(self, engine: AsyncEngine = default_engine, interval: Optional[float] = None):
+        interval = settings.retention_interval if interval is None else interval
+        super().__init__(workers=1 if interval > 0 else 0, poll_interval=interval)
+        self.engine = engine
+    
+    async def run_once(self) -> int:
+        await run_retention(self.engine)
+        # Rien à enchaîner : le worker attend l'intervalle suivant
+        return 0
+
+
+retention_runner = RetentionRunner()
+
+
+def build_parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(description="Archivage puis purge des opérations et webhooks anciens")
+    parser.add_argument("--older-than-days", type=int, default=None, help="Âge minimal en jours (défaut: settings)")
+    parser.add_argument(
+        "--table",
+        action="append",
+        choices=sorted(ARCHIVED_TABLES),
+        dest="tables",
+        help="Table à traiter (répétable, défaut: toutes)"
+    )
+    parser.add_argument("--archive-dir", default=None, help="Répertoire des archives (défaut: settings)")
+    parser.add_argument("--dry-run", action="store_true", help="Compte les lignes par jour sans rien écrire ni supprimer")
+    return parser
+
+
+def main(argv: Optional[List[str]] = None):
+    args = build_parser().parse_args(argv)
+    result = asyncio.run(run_retention(
+        older_than_days=args.older_than_days,
+        tables=args.tables,
+        archive_dir=args.archive_dir,
+        dry_run=args.dry_run
+    ))
+    print(json.dumps(result, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,66 @@
+"""
+Process dédié au traitement des webhooks mis en file (WEBHOOK_ACK_MODE=async)
+
+Permet de dimensionner les workers indépendamment de l'API : autant de process
+que nécessaire, sur un ou plusieurs nœuds (les jobs sont réservés avec SKIP
+LOCKED). Le process livre aussi les résultats Skaleet de l'outbox qu'il produit.
+    python -m app.jobs.webhook_worker [--workers 8] [--batch-size 20]
+Arrêt propre sur SIGINT / SIGTERM : les lots en cours se terminent.
+"""
+import argparse
+import asyncio
+import logging
+import signal
+from typing import List, Optional
+
+from app.core.config import settings
+from app.core.logging import setup_logging
+from app.domain.outbox import outbox_dispatcher
+from app.domain.webhook_jobs import WebhookJobRunner
+from app.infra.card_lock import card_locks
+from app.infra.http_clients import start_http_clients, close_http_clients
+from app.infra.skaleet_auth import admin_token_manager
+
+logger = logging.getLogger(__name__)
+
+
+async def run_worker(workers: int, batch_size: Optional[int] = None):
+    """Démarre les workers puis attend un signal d'arrêt"""
+    runner = WebhookJobRunner(workers=workers, batch_size=batch_size)
+    stopping = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    for signum in (signal.SIGINT, signal.SIGTERM):
+        loop.add_signal_handler(signum, stopping.set)
+    
+    await start_http_clients()
+    await runner.start()
+    await outbox_dispatcher.start()
+    logger.info(f"Webhook worker started: {workers} worker(s), batch size {runner.batch_size}")
+    try:
+        await stopping.wait()
+    finally:
+        await runner.stop()
+        await outbox_dispatcher.stop()
+        await card_locks.close()
+        await admin_token_manager.close()
+        await close_http_clients()
+    logger.info("Webhook worker stopped")
+
+
+def build_parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(description="Workers de traitement des webhooks carte mis en file")
+    parser.add_argument("--workers", type=int, default=settings.webhook_job_workers, help="Workers concurrents (défaut: settings)")
+    parser.add_argument("--batch-size", type=int, default=None, help="Jobs réservés par lot (défaut: settings)")
+    return parser
+
+
+def main(argv: Optional[List[str]] = None):
+    args = build_parser().parse_args(argv)
+    if args.workers <= 0:
+        raise SystemExit("--workers doit être strictement positif")
+    setup_logging()
+    asyncio.run(run_worker(args.workers, args.batch_size))
+
+
+if __name__ == "__main__":
+    main()
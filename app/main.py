@@ -1,28 +1,99 @@
-from fastapi import FastAPI
+import time
+
+# Début du chargement de l'application (étape "import" du rapport de démarrage)
+_import_started = time.perf_counter()
+
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse
 from contextlib import asynccontextmanager
-from app.api.v1 import card_webhooks, health
+from app.api.v1 import card_webhooks, card_operations, health, bulk_operations, metrics
 from app.core.config import settings
 from app.core.logging import setup_logging
 from app.core.security import CorrelationIdMiddleware
-from app.infra.db import init_db
+from app.core.metrics import AccessLogMiddleware, register_collector
+from app.core.startup import StartupReport
+from app.infra.db import init_db, AsyncSessionLocal, SchemaVersionMismatch
+from app.infra.card_cache import card_cache
+from app.infra.card_lock import CardLockTimeout, card_locks
+from app.domain.outbox import outbox_dispatcher
+from app.domain.bulk import bulk_runner
+from app.domain.webhook_jobs import webhook_job_runner
+from app.jobs.partitions import partition_maintainer
+from app.jobs.retention import retention_runner
+from app.infra.http_clients import start_http_clients, close_http_clients
+from app.infra.skaleet_auth import admin_token_manager
+from app.utils.deadline import DeadlineExceeded
+import logging
 
 # Configuration du logging
 setup_logging()
 
+logger = logging.getLogger(__name__)
+
+startup_report = StartupReport(started=_import_started)
+register_collector(startup_report.render)
+
 
 @asynccontextmanager
 async def lifespan(app: FastAPI):
     """Gestion du cycle de vie de l'application"""
-    # Startup: initialiser la base de données
-    try:
-        await init_db()
-    except Exception as e:
-        import logging
-        logger = logging.getLogger(__name__)
-        logger.warning(f"⚠️ Impossible d'initialiser la base de données: {e}")
-        logger.warning("Le service démarre quand même, mais certaines fonctionnalités peuvent ne pas fonctionner")
+    report = startup_report
+    report.record("import", time.perf_counter() - report.started)
+    
+    # Startup: vérifier la révision Alembic de la base (create_all en dev local uniquement)
+    with report.stage("database"):
+        try:
+            report.details["schema_revision"] = await init_db()
+        except SchemaVersionMismatch:
+            raise
+        except Exception as e:
+            logger.warning(f"⚠️ Impossible d'initialiser la base de données: {e}")
+            logger.warning("Le service démarre quand même, mais certaines fonctionnalités peuvent ne pas fonctionner")
+    
+    # Startup: partitions mensuelles de card_operations (puis maintenance périodique)
+    with report.stage("partitions"):
+        await partition_maintainer.start()
+    
+    # Startup: préchauffage du cache d'identité des cartes (cartes récemment modifiées)
+    if settings.card_cache_prewarm > 0:
+        with report.stage("card_cache"):
+            try:
+                async with AsyncSessionLocal() as session:
+                    loaded = await card_cache.prewarm(session, settings.card_cache_prewarm)
+                logger.info(f"Card cache prewarmed with {loaded} cards")
+            except Exception as e:
+                logger.warning(f"⚠️ Préchauffage du cache des cartes impossible: {e}")
+    
+    # Startup: clients HTTP partagés (NI, Skaleet Admin) avec connexions préchauffées
+    with report.stage("http_clients"):
+        app.state.http_clients = await start_http_clients()
+    
+    # Startup: workers de fond
+    with report.stage("workers"):
+        # Livraison des résultats Skaleet depuis l'outbox
+        await outbox_dispatcher.start()
+        # Traitement des webhooks mis en file (WEBHOOK_ACK_MODE=async)
+        await webhook_job_runner.start()
+        # Traitement des opérations en masse (reprend les jobs non terminés)
+        await bulk_runner.start()
+        # Archivage / purge périodique des lignes anciennes (si RETENTION_INTERVAL > 0)
+        await retention_runner.start()
+    
+    report.finish()
+    
     yield
-    # Shutdown: nettoyage si nécessaire
+    
+    # Shutdown: arrêter les workers de fond (le lot en cours se termine)
+    await retention_runner.stop()
+    await bulk_runner.stop()
+    await webhook_job_runner.stop()
+    await outbox_dispatcher.stop()
+    await partition_maintainer.stop()
+    await card_locks.close()
+    
+    # Shutdown: arrêter le rafraîchissement du token puis fermer les connexions sortantes
+    await admin_token_manager.close()
+    await close_http_clients()
 
 
 app = FastAPI(
@@ -32,10 +103,41 @@ app = FastAPI(
     lifespan=lifespan
 )
 
-# Ajouter le middleware pour correlation_id
+# Ligne de log d'accès avec le coût de la requête (SQL, NI, Skaleet, CPU)
+app.add_middleware(AccessLogMiddleware)
+
+# Ajouter le middleware pour correlation_id (ajouté en dernier : il s'exécute en premier)
 app.add_middleware(CorrelationIdMiddleware)
 
+
+@app.exception_handler(DeadlineExceeded)
+async def deadline_exceeded_handler(request: Request, exc: DeadlineExceeded):
+    """Le budget de la requête est épuisé : réponse explicite plutôt que de continuer le travail"""
+    logger.warning(f"Request deadline exceeded during {exc.stage}: {request.method} {request.url.path}")
+    return JSONResponse(
+        status_code=504,
+        content={"ok": False, "error": DeadlineExceeded.status, "stage": exc.stage}
+    )
+
+
+@app.exception_handler(CardLockTimeout)
+async def card_lock_timeout_handler(request: Request, exc: CardLockTimeout):
+    """Une autre opération occupe la carte trop longtemps : l'appelant peut réessayer"""
+    logger.warning(f"Card {exc.skaleet_card_id} busy: {request.method} {request.url.path}")
+    return JSONResponse(
+        status_code=503,
+        content={"ok": False, "error": CardLockTimeout.status, "cardId": exc.skaleet_card_id},
+        headers={"Retry-After": "1"}
+    )
+
+
 # Inclusion des routes
 app.include_router(health.router, prefix="/api/v1/health", tags=["health"])
+app.include_router(metrics.router, prefix="/api/v1/metrics", tags=["metrics"])
 app.include_router(card_webhooks.router, prefix="/api/v1/webhooks", tags=["webhooks"])
-
+app.include_router(card_operations.router, prefix="/api/v1/internal", tags=["operations"])
+app.include_router(
+    bulk_operations.router,
+    prefix="/api/v1/internal/cards/bulk-operations",
+    tags=["bulk-operations"]
+)
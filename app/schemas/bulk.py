@@ -0,0 +1,46 @@
+from pydantic import BaseModel
+from typing import Optional, List
+from datetime import datetime
+from uuid import UUID
+from app.domain.enums import OperationType
+
+
+class BulkOperationLine(BaseModel):
+    """
+    Une opération de la liste envoyée à l'API en masse
+    
+    Exemple (une ligne NDJSON):
+    {"cardId": 12345, "panAlias": "CMSPARTNER-12345", "operation": "card_blocking"}
+    """
+    cardId: int
+    panAlias: Optional[str] = None
+    operation: OperationType
+
+
+class BulkJobResponse(BaseModel):
+    jobId: UUID
+    status: str
+    totalItems: int
+    processedItems: int
+    succeededItems: int
+    failedItems: int
+    createdAt: datetime
+    finishedAt: Optional[datetime] = None
+
+
+class BulkItemResult(BaseModel):
+    position: int
+    cardId: int
+    panAlias: Optional[str] = None
+    operation: str
+    status: str
+    niResultCode: Optional[str] = None
+    error: Optional[str] = None
+    operationId: Optional[UUID] = None
+    processedAt: Optional[datetime] = None
+
+
+class BulkItemsPage(BaseModel):
+    items: List[BulkItemResult]
+    # Position à passer en `after` pour la page suivante (None = dernière page)
+    nextAfter: Optional[int] = None
@@ -0,0 +1,26 @@
+from pydantic import BaseModel
+from typing import Optional, List, Dict, Any
+from datetime import datetime
+from uuid import UUID
+
+
+class CardOperationResult(BaseModel):
+    """Opération carte telle qu'exposée par l'API d'historique"""
+    operationId: UUID
+    cardId: Optional[int] = None  # cardId Skaleet
+    operation: str
+    source: str
+    status: str
+    skaleetEvent: Optional[str] = None
+    skaleetEventId: Optional[str] = None
+    webhookId: Optional[str] = None
+    niResultCode: Optional[str] = None
+    correlationId: Optional[str] = None
+    createdAt: datetime
+    rawWebhook: Optional[Dict[str, Any]] = None
+
+
+class CardOperationsPage(BaseModel):
+    items: List[CardOperationResult]
+    # Curseur à passer en `cursor` pour la page suivante (None = dernière page)
+    nextCursor: Optional[str] = None
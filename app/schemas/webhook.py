@@ -15,6 +15,7 @@ class SkaleetCardEvent(str, Enum):
     ACTIVATION_REQUESTED = "card.status.activation_requested"
     BLOCK_REQUESTED = "card.status.block_requested"
     UNBLOCK_REQUESTED = "card.status.unblock_requested"
+    OPPOSED_REQUESTED = "card.status.opposed_requested"
     CREATED = "card.created"
     ACTIVATED = "card.activated"
     BLOCKED = "card.blocked"
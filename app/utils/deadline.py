@@ -0,0 +1,124 @@
+"""
+Deadline de bout en bout pour une requête
+
+Le middleware fixe une échéance (configuration ou header de l'appelant) dans
+une ContextVar. Les appels NI / Skaleet n'utilisent que le budget restant ;
+une fois le budget épuisé, le travail est interrompu avec DeadlineExceeded au
+lieu de continuer alors que l'appelant est parti.
+
+Les requêtes DB ne sont jamais annulées côté client (un COMMIT annulé peut
+quand même aboutir, et la connexion asyncpg resterait dans un état indéfini) :
+le budget est vérifié entre deux étapes et imposé par le serveur via
+statement_timeout (voir DeadlineAwareSession dans app/infra/db.py).
+"""
+import asyncio
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar, Token
+from typing import Awaitable, Optional, TypeVar
+from app.core.config import settings
+
+T = TypeVar("T")
+
+# Échéance absolue (time.monotonic()), None = pas de deadline
+deadline_var: ContextVar[Optional[float]] = ContextVar("deadline", default=None)
+
+
+class DeadlineExceeded(Exception):
+    """Le budget de temps de la requête est épuisé"""
+    status = "deadline_exceeded"
+    
+    def __init__(self, stage: str):
+        super().__init__(f"Deadline exceeded during {stage}")
+        self.stage = stage
+
+
+def set_deadline(budget_seconds: Optional[float]) -> Token:
+    """Fixe l'échéance à maintenant + budget (None = pas de deadline)"""
+    deadline = time.monotonic() + budget_seconds if budget_seconds is not None else None
+    return deadline_var.set(deadline)
+
+
+def resolve_request_budget(header_value: Optional[str]) -> Optional[float]:
+    """
+    Budget d'une requête entrante : le plus petit entre la configuration et le
+    header de l'appelant (en millisecondes), moins une marge pour répondre
+    """
+    budget = settings.request_deadline_seconds or None
+    if header_value:
+        try:
+            caller_budget = float(header_value) / 1000
+        except ValueError:
+            caller_budget = None
+        if caller_budget is not None and caller_budget > 0:
+            budget = min(budget, caller_budget) if budget else caller_budget
+    if budget is None:
+        return None
+    return max(budget - settings.request_deadline_margin, 0.0)
+
+
+def deadline_exempt(path: str) -> bool:
+    """Chemin sans deadline (request_deadline_exempt_paths)"""
+    prefixes = [prefix.strip() for prefix in settings.request_deadline_exempt_paths.split(",") if prefix.strip()]
+    return any(path.startswith(prefix) for prefix in prefixes)
+
+
+def remaining() -> Optional[float]:
+    """Budget restant en secondes (None si aucune deadline)"""
+    deadline = deadline_var.get()
+    if deadline is None:
+        return None
+    return deadline - time.monotonic()
+
+
+def deadline_expired() -> bool:
+    budget = remaining()
+    return budget is not None and budget <= 0
+
+
+def check_deadline(stage: str):
+    """Lève DeadlineExceeded si le budget est épuisé"""
+    if deadline_expired():
+        raise DeadlineExceeded(stage)
+
+
+def bounded_timeout(default: float, stage: str) -> float:
+    """Timeout à utiliser pour un appel : le plus petit entre `default` et le budget restant"""
+    budget = remaining()
+    if budget is None:
+        return default
+    if budget <= 0:
+        raise DeadlineExceeded(stage)
+    return min(default, budget)
+
+
+async def within_deadline(awaitable: Awaitable[T], stage: str) -> T:
+    """
+    Attend `awaitable` dans la limite du budget restant, en l'annulant au-delà :
+    jamais pour un aller-retour DB (voir le docstring du module)
+    """
+    budget = remaining()
+    if budget is None:
+        return await awaitable
+    if budget <= 0:
+        # Ne pas laisser une coroutine jamais attendue
+        if asyncio.iscoroutine(awaitable):
+            awaitable.close()
+        raise DeadlineExceeded(stage)
+    try:
+        return await asyncio.wait_for(awaitable, timeout=budget)
+    except asyncio.TimeoutError:
+        raise DeadlineExceeded(stage)
+
+
+@contextmanager
+def detached_deadline():
+    """
+    Exécute un bloc sans deadline : écriture d'un résultat déjà obtenu de NI,
+    ou tâche de fond lancée depuis une requête.
+    """
+    token = deadline_var.set(None)
+    try:
+        yield
+    finally:
+        deadline_var.reset(token)
@@ -1,8 +1,10 @@
 from sqlalchemy.ext.asyncio import AsyncSession
-from sqlalchemy import select
-from app.infra.repositories import WebhookRepository, CardOperationRepository, CardRepository
-from app.domain.models import CardOperation, Card
+from sqlalchemy import select, update, insert
+from app.infra.repositories import WebhookRepository, CardOperationRepository
+from app.domain.models import CardOperation, Card, WebhookClaim
+from app.infra.db import dialect_insert
 from app.domain.enums import OperationSource, OperationStatus
+from datetime import datetime
 from typing import Optional
 import uuid
 
@@ -43,76 +45,96 @@ async def check_card_operation_idempotency(
 async def is_webhook_processed(session: AsyncSession, webhook_id: str) -> bool:
     """
     Vérifie si un webhookId a déjà été traité (SUCCESS, ERROR ou PENDING)
-    Retourne True si le webhook a déjà été traité, False sinon
+    Retourne True si le webhook a déjà été traité, False sinon.
+    Lecture seule : pour réserver un webhook, utiliser mark_webhook_started
     """
-    result = await session.execute(
-        select(CardOperation).where(
-            CardOperation.skaleet_webhook_id == webhook_id
-        )
-    )
-    operation = result.scalar_one_or_none()
-    
-    if operation:
-        # Si une opération existe avec ce webhookId, elle a déjà été traitée (ou en cours)
-        return True
-    
-    return False
+    claim = await session.get(WebhookClaim, webhook_id)
+    return claim is not None
+
+
+async def find_claimed_operation(session: AsyncSession, webhook_id: str) -> Optional[CardOperation]:
+    """
+    Opération créée avec la réservation du webhookId (mark_webhook_started),
+    None si la réservation ou l'opération n'existe pas
+    """
+    claim = await session.get(WebhookClaim, webhook_id)
+    if claim is None:
+        return None
+    # La réservation porte l'id et le created_at (clé de partition) de l'opération
+    return await session.get(CardOperation, (claim.card_operation_id, claim.created_at))
 
 
 async def mark_webhook_started(
     session: AsyncSession,
     webhook_id: str,
-    card_id: int,
+    card_id: uuid.UUID,
     operation_type: str,
     skaleet_event: str,
-    skaleet_event_id: str
-) -> CardOperation:
+    skaleet_event_id: str,
+    source: str = OperationSource.SKA.value,
+    raw_webhook: Optional[dict] = None,
+    correlation_id: Optional[str] = None
+) -> Optional[CardOperation]:
     """
-    Crée une entrée CardOperation avec status = PENDING
-    Retourne l'opération créée
+    Réserve le webhook puis crée une entrée CardOperation avec status = PENDING.
+    La réservation est un INSERT ... ON CONFLICT DO NOTHING RETURNING sur la clé
+    primaire de webhook_claims : deux retries concurrents ne peuvent pas être
+    réservés tous les deux.
+    card_id est l'id interne de la carte, déjà obtenu par l'appelant
+    (CardRepository.get_or_create).
+    Pas de commit : l'appelant valide la carte, la réservation et l'opération ensemble.
+    Retourne l'opération créée, ou None si le webhook était déjà réservé
     """
-    # Récupérer ou créer la carte
-    card_repo = CardRepository(session)
-    card = await card_repo.get_or_create(card_id)
+    # id et created_at sont générés ici pour être partagés par la réservation et l'opération
+    operation_id = uuid.uuid4()
+    created_at = datetime.utcnow()
     
-    # Créer l'opération
-    operation = CardOperation(
-        card_id=card.id,
-        operation_type=operation_type,
-        source=OperationSource.SKA.value,
-        status=OperationStatus.PENDING.value,
-        skaleet_event=skaleet_event,
-        skaleet_event_id=skaleet_event_id,
-        skaleet_webhook_id=webhook_id
+    claim = await session.execute(
+        dialect_insert(session, WebhookClaim)
+        .values(skaleet_webhook_id=webhook_id, card_operation_id=operation_id, created_at=created_at)
+        .on_conflict_do_nothing(index_elements=[WebhookClaim.skaleet_webhook_id])
+        .returning(WebhookClaim.skaleet_webhook_id)
     )
+    if claim.scalar_one_or_none() is None:
+        return None
     
-    session.add(operation)
-    await session.commit()
-    await session.refresh(operation)
-    
-    return operation
+    # L'opération revient par RETURNING (pas de refresh)
+    result = await session.execute(
+        insert(CardOperation)
+        .values(
+            id=operation_id,
+            card_id=card_id,
+            operation_type=operation_type,
+            source=source,
+            status=OperationStatus.PENDING.value,
+            skaleet_event=skaleet_event,
+            skaleet_event_id=skaleet_event_id,
+            skaleet_webhook_id=webhook_id,
+            correlation_id=correlation_id,
+            raw_webhook=raw_webhook,
+            created_at=created_at
+        )
+        .returning(CardOperation)
+    )
+    return result.scalar_one()
 
 
 async def mark_webhook_finished(
     session: AsyncSession,
     card_operation_id: uuid.UUID,
     status: str,
-    ni_result_code: str | None = None
+    ni_result_code: str | None = None,
+    created_at: Optional[datetime] = None
 ):
     """
-    Met à jour le statut d'une opération
+    Met à jour le statut d'une opération en une seule requête UPDATE, sans commit
+    (l'opération chargée dans la session est synchronisée par l'UPDATE ORM).
+    created_at (clé de partition) limite l'UPDATE à la partition de l'opération
     """
-    result = await session.execute(
-        select(CardOperation).where(CardOperation.id == card_operation_id)
-    )
-    operation = result.scalar_one_or_none()
-    
-    if operation:
-        operation.status = status
-        if ni_result_code:
-            operation.ni_result_code = ni_result_code
-        await session.commit()
-        await session.refresh(operation)
-    
-    return operation
-
+    values = {"status": status}
+    if ni_result_code:
+        values["ni_result_code"] = ni_result_code
+    statement = update(CardOperation).where(CardOperation.id == card_operation_id)
+    if created_at is not None:
+        statement = statement.where(CardOperation.created_at == created_at)
+    await session.execute(statement.values(**values))
@@ -0,0 +1,49 @@
+"""Skaleet result outbox
+
+Revision ID: 002
+Revises: 001
+Create Date: 2026-10-18 00:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy.dialects import postgresql
+
+# revision identifiers, used by Alembic.
+revision = '002'
+down_revision = '001'
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    # Outbox des résultats à transmettre à Skaleet Admin
+    op.create_table(
+        'skaleet_result_outbox',
+        sa.Column('id', postgresql.UUID(as_uuid=True), nullable=False),
+        sa.Column('card_operation_id', postgresql.UUID(as_uuid=True), nullable=True),
+        sa.Column('skaleet_card_id', sa.Integer(), nullable=False),
+        sa.Column('operation_type', sa.String(), nullable=False),
+        sa.Column('result', sa.String(), nullable=False),
+        sa.Column('payload', postgresql.JSON(astext_type=sa.Text()), nullable=True),
+        sa.Column('status', sa.String(), nullable=False),
+        sa.Column('attempts', sa.Integer(), nullable=False),
+        sa.Column('next_attempt_at', sa.DateTime(), nullable=False),
+        sa.Column('last_error', sa.Text(), nullable=True),
+        sa.Column('created_at', sa.DateTime(), nullable=False),
+        sa.Column('delivered_at', sa.DateTime(), nullable=True),
+        sa.PrimaryKeyConstraint('id')
+    )
+    # Index partiel : seuls les messages à livrer sont parcourus par les workers
+    op.create_index(
+        'idx_outbox_pending_next_attempt',
+        'skaleet_result_outbox',
+        ['next_attempt_at'],
+        unique=False,
+        postgresql_where=sa.text("status = 'PENDING'")
+    )
+
+
+def downgrade() -> None:
+    op.drop_index('idx_outbox_pending_next_attempt', table_name='skaleet_result_outbox')
+    op.drop_table('skaleet_result_outbox')
@@ -0,0 +1,73 @@
+"""Bulk card operations
+
+Revision ID: 003
+Revises: 002
+Create Date: 2026-10-18 00:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy.dialects import postgresql
+
+# revision identifiers, used by Alembic.
+revision = '003'
+down_revision = '002'
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    # Jobs d'opérations carte en masse
+    op.create_table(
+        'bulk_operation_jobs',
+        sa.Column('id', postgresql.UUID(as_uuid=True), nullable=False),
+        sa.Column('status', sa.String(), nullable=False),
+        sa.Column('total_items', sa.Integer(), nullable=False),
+        sa.Column('processed_items', sa.Integer(), nullable=False),
+        sa.Column('succeeded_items', sa.Integer(), nullable=False),
+        sa.Column('failed_items', sa.Integer(), nullable=False),
+        sa.Column('correlation_id', sa.String(), nullable=True),
+        sa.Column('created_at', sa.DateTime(), nullable=False),
+        sa.Column('finished_at', sa.DateTime(), nullable=True),
+        sa.PrimaryKeyConstraint('id')
+    )
+    
+    # Opérations d'un job (une ligne par carte)
+    op.create_table(
+        'bulk_operation_items',
+        sa.Column('id', postgresql.UUID(as_uuid=True), nullable=False),
+        sa.Column('job_id', postgresql.UUID(as_uuid=True), nullable=False),
+        sa.Column('position', sa.Integer(), nullable=False),
+        sa.Column('skaleet_card_id', sa.Integer(), nullable=False),
+        sa.Column('pan_alias', sa.String(), nullable=True),
+        sa.Column('operation_type', sa.String(), nullable=False),
+        sa.Column('status', sa.String(), nullable=False),
+        sa.Column('leased_until', sa.DateTime(), nullable=True),
+        sa.Column('card_operation_id', postgresql.UUID(as_uuid=True), nullable=True),
+        sa.Column('ni_result_code', sa.String(), nullable=True),
+        sa.Column('error', sa.Text(), nullable=True),
+        sa.Column('processed_at', sa.DateTime(), nullable=True),
+        sa.ForeignKeyConstraint(['job_id'], ['bulk_operation_jobs.id'], ondelete='CASCADE'),
+        sa.PrimaryKeyConstraint('id')
+    )
+    op.create_index(
+        'idx_bulk_items_job_position',
+        'bulk_operation_items',
+        ['job_id', 'position'],
+        unique=True
+    )
+    # Index partiel : seules les opérations à traiter sont parcourues par les workers
+    op.create_index(
+        'idx_bulk_items_pending',
+        'bulk_operation_items',
+        ['leased_until'],
+        unique=False,
+        postgresql_where=sa.text("status = 'PENDING'")
+    )
+
+
+def downgrade() -> None:
+    op.drop_index('idx_bulk_items_pending', table_name='bulk_operation_items')
+    op.drop_index('idx_bulk_items_job_position', table_name='bulk_operation_items')
+    op.drop_table('bulk_operation_items')
+    op.drop_table('bulk_operation_jobs')
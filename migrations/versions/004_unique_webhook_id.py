@@ -0,0 +1,51 @@
+"""Unique skaleet_webhook_id on card_operations
+
+Revision ID: 004
+Revises: 003
+Create Date: 2026-10-18 00:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision = '004'
+down_revision = '003'
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    # Les doublons créés avant la contrainte (retries concurrents) gardent leur
+    # historique : seule la plus ancienne opération conserve le webhookId
+    op.execute(sa.text("""
+        UPDATE card_operations SET skaleet_webhook_id = NULL
+        WHERE id IN (
+            SELECT id FROM (
+                SELECT id, row_number() OVER (
+                    PARTITION BY skaleet_webhook_id ORDER BY created_at, id
+                ) AS rank
+                FROM card_operations
+                WHERE skaleet_webhook_id IS NOT NULL
+            ) ranked
+            WHERE rank > 1
+        )
+    """))
+    # Index construit sans bloquer les écritures (hors transaction)
+    with op.get_context().autocommit_block():
+        op.create_index(
+            'idx_card_operations_webhook_id',
+            'card_operations',
+            ['skaleet_webhook_id'],
+            unique=True,
+            postgresql_concurrently=True
+        )
+
+
+def downgrade() -> None:
+    with op.get_context().autocommit_block():
+        op.drop_index(
+            'idx_card_operations_webhook_id',
+            table_name='card_operations',
+            postgresql_concurrently=True
+        )
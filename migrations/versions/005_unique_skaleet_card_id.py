@@ -0,0 +1,57 @@
+"""Unique skaleet_card_id on cards
+
+Revision ID: 005
+Revises: 004
+Create Date: 2026-10-18 00:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision = '005'
+down_revision = '004'
+branch_labels = None
+depends_on = None
+
+# Pour chaque cardId Skaleet, la carte conservée est la plus ancienne
+_DUPLICATE_CARDS = """
+    SELECT id, first_value(id) OVER (
+        PARTITION BY skaleet_card_id ORDER BY created_at, id
+    ) AS keep_id
+    FROM cards
+"""
+
+
+def upgrade() -> None:
+    # Fusion des cartes en double créées par des premiers webhooks concurrents :
+    # les opérations sont rattachées à la carte conservée, puis les doublons supprimés.
+    # Un pan_alias porté uniquement par un doublon sera complété au prochain webhook.
+    op.execute(sa.text(f"""
+        UPDATE card_operations SET card_id = duplicates.keep_id
+        FROM ({_DUPLICATE_CARDS}) duplicates
+        WHERE card_operations.card_id = duplicates.id AND duplicates.id <> duplicates.keep_id
+    """))
+    op.execute(sa.text(f"""
+        DELETE FROM cards USING ({_DUPLICATE_CARDS}) duplicates
+        WHERE cards.id = duplicates.id AND duplicates.id <> duplicates.keep_id
+    """))
+    _replace_index(unique=True)
+
+
+def downgrade() -> None:
+    _replace_index(unique=False)
+
+
+def _replace_index(unique: bool) -> None:
+    # Index construit sans bloquer les écritures (hors transaction, comme en 004) :
+    # nouvel index sous un nom temporaire, puis suppression de l'ancien et renommage.
+    # Un index invalide laissé par une construction interrompue est d'abord supprimé
+    with op.get_context().autocommit_block():
+        op.execute("DROP INDEX CONCURRENTLY IF EXISTS idx_skaleet_card_id_new")
+        op.execute(
+            f"CREATE {'UNIQUE ' if unique else ''}INDEX CONCURRENTLY idx_skaleet_card_id_new "
+            "ON cards (skaleet_card_id)"
+        )
+        op.execute("DROP INDEX CONCURRENTLY IF EXISTS idx_skaleet_card_id")
+        op.execute("ALTER INDEX idx_skaleet_card_id_new RENAME TO idx_skaleet_card_id")
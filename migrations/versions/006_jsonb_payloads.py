@@ -0,0 +1,116 @@
+"""JSONB payload columns with search indexes
+
+Revision ID: 006
+Revises: 005
+Create Date: 2026-10-18 00:00:00.000000
+
+"""
+import time
+
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision = '006'
+down_revision = '005'
+branch_labels = None
+depends_on = None
+
+# Colonnes JSON converties en JSONB : (table, colonne, clé primaire)
+COLUMNS = (
+    ('card_operations', 'raw_webhook', 'id'),
+    ('webhook_events', 'payload', 'id'),
+    ('webhook_events', 'response', 'id'),
+    ('skaleet_result_outbox', 'payload', 'id'),
+)
+BATCH_SIZE = 5000
+BATCH_PAUSE_SECONDS = 0.1  # Laisse respirer la réplication et l'autovacuum entre deux lots
+
+# Index d'expression : mêmes expressions que json_path_text (app/infra/db.py)
+EXPRESSION_INDEXES = (
+    ('idx_card_operations_webhook_pan_alias', 'card_operations', "((raw_webhook -> 'data') ->> 'panAlias')"),
+    ('idx_card_operations_webhook_account_id', 'card_operations', "((raw_webhook -> 'data') ->> 'accountId')"),
+    ('idx_outbox_ni_card_id', 'skaleet_result_outbox', "((payload -> 'ni_details') ->> 'niCardId')"),
+)
+
+
+def _convert_column(table: str, column: str, pk: str) -> None:
+    """
+    Conversion sans réécriture de la table sous verrou exclusif :
+    1. nouvelle colonne jsonb, tenue à jour par un trigger pour les écritures en cours ;
+    2. recopie par lots, chacun dans sa propre transaction ;
+    3. échange des colonnes (opérations de catalogue, verrou de courte durée).
+    """
+    new_column = f"{column}_jsonb"
+    function = f"{table}_{column}_to_jsonb"
+
+    op.execute(f"ALTER TABLE {table} ADD COLUMN {new_column} jsonb")
+    op.execute(f"""
+        CREATE FUNCTION {function}() RETURNS trigger AS $$
+        BEGIN
+            NEW.{new_column} := NEW.{column}::jsonb;
+            RETURN NEW;
+        END
+        $$ LANGUAGE plpgsql
+    """)
+    op.execute(f"""
+        CREATE TRIGGER {function} BEFORE INSERT OR UPDATE OF {column} ON {table}
+        FOR EACH ROW EXECUTE FUNCTION {function}()
+    """)
+
+    # Parcours de la clé primaire par curseur (pk > dernière clé du lot précédent) :
+    # chaque lot lit uniquement ses lignes via l'index de la clé primaire, au lieu
+    # de reparcourir depuis le début les lignes déjà converties
+    batch_from_start = f"SELECT {pk} FROM {table} ORDER BY {pk} LIMIT :batch_size"
+    batch_after_last = f"SELECT {pk} FROM {table} WHERE {pk} > :last_pk ORDER BY {pk} LIMIT :batch_size"
+    with op.get_context().autocommit_block():
+        connection = op.get_bind()
+        last_pk = None
+        while True:
+            batch = batch_from_start if last_pk is None else batch_after_last
+            params = {"batch_size": BATCH_SIZE} if last_pk is None else {"batch_size": BATCH_SIZE, "last_pk": last_pk}
+            row = connection.execute(sa.text(f"""
+                WITH batch AS ({batch}),
+                converted AS (
+                    UPDATE {table} SET {new_column} = {table}.{column}::jsonb
+                    FROM batch
+                    WHERE {table}.{pk} = batch.{pk}
+                      AND {table}.{column} IS NOT NULL
+                      AND {table}.{new_column} IS NULL
+                )
+                SELECT (SELECT {pk} FROM batch ORDER BY {pk} DESC LIMIT 1) AS last_pk,
+                       (SELECT count(*) FROM batch) AS batch_rows
+            """), params).one()
+            if row.batch_rows < BATCH_SIZE:
+                break
+            last_pk = row.last_pk
+            time.sleep(BATCH_PAUSE_SECONDS)
+
+    op.execute(f"DROP TRIGGER {function} ON {table}")
+    op.execute(f"DROP FUNCTION {function}()")
+    op.execute(f"ALTER TABLE {table} DROP COLUMN {column}")
+    op.execute(f"ALTER TABLE {table} RENAME COLUMN {new_column} TO {column}")
+
+
+def upgrade() -> None:
+    for table, column, pk in COLUMNS:
+        _convert_column(table, column, pk)
+
+    # Index construits sans bloquer les écritures (hors transaction)
+    with op.get_context().autocommit_block():
+        for name, table, expression in EXPRESSION_INDEXES:
+            op.execute(f"CREATE INDEX CONCURRENTLY IF NOT EXISTS {name} ON {table} ({expression})")
+        op.execute(
+            "CREATE INDEX CONCURRENTLY IF NOT EXISTS idx_webhook_events_payload "
+            "ON webhook_events USING gin (payload jsonb_path_ops)"
+        )
+
+
+def downgrade() -> None:
+    with op.get_context().autocommit_block():
+        op.execute("DROP INDEX CONCURRENTLY IF EXISTS idx_webhook_events_payload")
+        for name, _, _ in EXPRESSION_INDEXES:
+            op.execute(f"DROP INDEX CONCURRENTLY IF EXISTS {name}")
+
+    for table, column, _ in COLUMNS:
+        op.execute(f"ALTER TABLE {table} ALTER COLUMN {column} TYPE json USING {column}::json")
@@ -0,0 +1,192 @@
+"""Monthly range partitioning of card_operations, webhook_claims table
+
+Revision ID: 007
+Revises: 006
+Create Date: 2026-10-18 00:00:00.000000
+
+"""
+import time
+from datetime import datetime, timedelta
+
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy.dialects import postgresql
+
+# revision identifiers, used by Alembic.
+revision = '007'
+down_revision = '006'
+branch_labels = None
+depends_on = None
+
+# Partitions mensuelles créées d'avance ; la suite est gérée par app/jobs/partitions.py
+MONTHS_AHEAD = 3
+# Réservations reprises depuis card_operations : tous les webhookId, par lots
+CLAIM_BACKFILL_BATCH_SIZE = 5000
+CLAIM_BACKFILL_PAUSE_SECONDS = 0.1  # Laisse respirer la réplication et l'autovacuum entre deux lots
+
+# Index du parent partitionné ; ceux qui existent déjà sur l'ancienne table
+# (même définition) lui sont rattachés au lieu d'être reconstruits
+PARTITIONED_INDEXES = (
+    ('idx_card_id', '(card_id)'),
+    ('idx_correlation_id', '(correlation_id)'),
+    ('idx_created_at', '(created_at)'),
+    ('idx_card_operations_webhook_id', '(skaleet_webhook_id)'),
+    ('idx_card_operations_webhook_pan_alias', "(((raw_webhook -> 'data') ->> 'panAlias'))"),
+    ('idx_card_operations_webhook_account_id', "(((raw_webhook -> 'data') ->> 'accountId'))"),
+)
+
+
+def _add_months(month: datetime, months: int) -> datetime:
+    index = month.month - 1 + months
+    return month.replace(year=month.year + index // 12, month=index % 12 + 1, day=1)
+
+
+def _backfill_claims() -> datetime:
+    """
+    Réserve le webhookId de toutes les opérations existantes : webhook_claims
+    devient le seul garant de l'unicité, un retry ou rejeu d'un webhook ancien ne
+    doit pas créer une seconde opération. Parcours de l'index unique du webhookId
+    par curseur (clé > dernière clé du lot précédent), un lot par transaction.
+    Retourne l'heure (UTC) de début du parcours, pour le rattrapage final
+    """
+    batch_from_start = (
+        "SELECT skaleet_webhook_id, id, created_at FROM card_operations "
+        "WHERE skaleet_webhook_id IS NOT NULL "
+        "ORDER BY skaleet_webhook_id LIMIT :batch_size"
+    )
+    batch_after_last = (
+        "SELECT skaleet_webhook_id, id, created_at FROM card_operations "
+        "WHERE skaleet_webhook_id > :last_key "
+        "ORDER BY skaleet_webhook_id LIMIT :batch_size"
+    )
+    with op.get_context().autocommit_block():
+        connection = op.get_bind()
+        started = connection.execute(sa.text("SELECT timezone('utc', now())")).scalar()
+        last_key = None
+        while True:
+            batch = batch_from_start if last_key is None else batch_after_last
+            params = {"batch_size": CLAIM_BACKFILL_BATCH_SIZE}
+            if last_key is not None:
+                params["last_key"] = last_key
+            row = connection.execute(sa.text(f"""
+                WITH batch AS ({batch}),
+                claimed AS (
+                    INSERT INTO webhook_claims (skaleet_webhook_id, card_operation_id, created_at)
+                    SELECT skaleet_webhook_id, id, created_at FROM batch
+                    ON CONFLICT DO NOTHING
+                )
+                SELECT (SELECT skaleet_webhook_id FROM batch ORDER BY skaleet_webhook_id DESC LIMIT 1) AS last_key,
+                       (SELECT count(*) FROM batch) AS batch_rows
+            """), params).one()
+            if row.batch_rows < CLAIM_BACKFILL_BATCH_SIZE:
+                break
+            last_key = row.last_key
+            time.sleep(CLAIM_BACKFILL_PAUSE_SECONDS)
+    return started
+
+
+def upgrade() -> None:
+    # Réservation des webhooks : un index unique sur un parent partitionné doit
+    # contenir la clé de partition, l'unicité du webhookId passe donc par cette table
+    op.create_table(
+        'webhook_claims',
+        sa.Column('skaleet_webhook_id', sa.String(), nullable=False),
+        sa.Column('card_operation_id', postgresql.UUID(as_uuid=True), nullable=False),
+        sa.Column('created_at', sa.DateTime(), nullable=False),
+        sa.PrimaryKeyConstraint('skaleet_webhook_id')
+    )
+    op.create_index('idx_webhook_claims_created_at', 'webhook_claims', ['created_at'], unique=False)
+    backfill_started = _backfill_claims()
+
+    # L'ancienne table devient la partition des données existantes (jusqu'au
+    # début du mois prochain), sans recopie. Tout ce qui parcourt la table est
+    # fait d'abord, sans bloquer les écritures : clé primaire (id, created_at),
+    # index non unique sur le webhookId et contrainte CHECK qui évite à
+    # ATTACH PARTITION de parcourir la table sous verrou exclusif
+    boundary = _add_months(datetime.utcnow().replace(day=1), 1)
+    with op.get_context().autocommit_block():
+        op.execute(
+            "CREATE UNIQUE INDEX CONCURRENTLY IF NOT EXISTS card_operations_legacy_pkey "
+            "ON card_operations (id, created_at)"
+        )
+        op.execute(
+            "CREATE INDEX CONCURRENTLY IF NOT EXISTS idx_card_operations_webhook_id_legacy "
+            "ON card_operations (skaleet_webhook_id)"
+        )
+        op.execute(
+            "ALTER TABLE card_operations ADD CONSTRAINT card_operations_legacy_range "
+            f"CHECK (created_at < '{boundary:%Y-%m-%d}') NOT VALID"
+        )
+        op.execute("ALTER TABLE card_operations VALIDATE CONSTRAINT card_operations_legacy_range")
+
+    op.execute("ALTER TABLE card_operations RENAME TO card_operations_legacy")
+    op.execute("ALTER TABLE card_operations_legacy DROP CONSTRAINT card_operations_pkey")
+    op.execute(
+        "ALTER TABLE card_operations_legacy ADD CONSTRAINT card_operations_legacy_pkey "
+        "PRIMARY KEY USING INDEX card_operations_legacy_pkey"
+    )
+    # Rattrapage des opérations créées pendant le parcours : la table est
+    # verrouillée par le RENAME, plus aucune ne peut être ajoutée avant le
+    # retrait de l'index unique
+    op.execute(
+        sa.text("""
+            INSERT INTO webhook_claims (skaleet_webhook_id, card_operation_id, created_at)
+            SELECT skaleet_webhook_id, id, created_at FROM card_operations_legacy
+            WHERE skaleet_webhook_id IS NOT NULL AND created_at >= :since
+            ON CONFLICT DO NOTHING
+        """).bindparams(since=backfill_started - timedelta(minutes=1))
+    )
+    # L'unicité du webhookId est désormais portée par webhook_claims
+    op.execute("DROP INDEX idx_card_operations_webhook_id")
+
+    op.execute("""
+        CREATE TABLE card_operations (
+            id uuid NOT NULL,
+            card_id uuid NOT NULL REFERENCES cards (id) ON DELETE CASCADE,
+            operation_type varchar NOT NULL,
+            source varchar NOT NULL,
+            status varchar NOT NULL,
+            skaleet_event varchar,
+            skaleet_event_id varchar,
+            skaleet_webhook_id varchar,
+            ni_result_code varchar,
+            correlation_id varchar,
+            raw_webhook jsonb,
+            created_at timestamp without time zone NOT NULL,
+            PRIMARY KEY (id, created_at)
+        ) PARTITION BY RANGE (created_at)
+    """)
+    op.execute(
+        "ALTER TABLE card_operations ATTACH PARTITION card_operations_legacy "
+        f"FOR VALUES FROM (MINVALUE) TO ('{boundary:%Y-%m-%d}')"
+    )
+    op.execute("ALTER TABLE card_operations_legacy DROP CONSTRAINT card_operations_legacy_range")
+    for name, columns in PARTITIONED_INDEXES:
+        op.execute(f"ALTER INDEX IF EXISTS {name} RENAME TO {name}_legacy")
+        op.execute(f"CREATE INDEX {name} ON card_operations {columns}")
+
+    for months in range(MONTHS_AHEAD + 1):
+        start = _add_months(boundary, months)
+        end = _add_months(start, 1)
+        op.execute(
+            f"CREATE TABLE card_operations_{start:%Y_%m} PARTITION OF card_operations "
+            f"FOR VALUES FROM ('{start:%Y-%m-%d}') TO ('{end:%Y-%m-%d}')"
+        )
+
+
+def downgrade() -> None:
+    # Les données des partitions mensuelles sont recopiées dans une table simple
+    op.execute("CREATE TABLE card_operations_flat (LIKE card_operations INCLUDING DEFAULTS)")
+    op.execute("INSERT INTO card_operations_flat SELECT * FROM card_operations")
+    op.execute("DROP TABLE card_operations CASCADE")
+    op.execute("ALTER TABLE card_operations_flat RENAME TO card_operations")
+    op.execute("ALTER TABLE card_operations ADD PRIMARY KEY (id)")
+    op.execute(
+        "ALTER TABLE card_operations ADD CONSTRAINT card_operations_card_id_fkey "
+        "FOREIGN KEY (card_id) REFERENCES cards (id) ON DELETE CASCADE"
+    )
+    for name, columns in PARTITIONED_INDEXES:
+        unique = "UNIQUE " if name == 'idx_card_operations_webhook_id' else ""
+        op.execute(f"CREATE {unique}INDEX {name} ON card_operations {columns}")
+    op.drop_index('idx_webhook_claims_created_at', table_name='webhook_claims')
+    op.drop_table('webhook_claims')
@@ -0,0 +1,48 @@
+"""Composite (card_id, created_at, id) index for the operations history API
+
+Revision ID: 008
+Revises: 007
+Create Date: 2026-10-18 00:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision = '008'
+down_revision = '007'
+branch_labels = None
+depends_on = None
+
+INDEX = 'idx_card_operations_card_created'
+
+
+def _partitions(connection) -> list:
+    return list(connection.execute(sa.text("""
+        SELECT child.relname FROM pg_inherits
+        JOIN pg_class child ON child.oid = pg_inherits.inhrelid
+        WHERE pg_inherits.inhparent = CAST('card_operations' AS regclass)
+        ORDER BY child.relname
+    """)).scalars())
+
+
+def upgrade() -> None:
+    # CREATE INDEX CONCURRENTLY est impossible sur un parent partitionné :
+    # index créé sur le parent seul (invalide), puis construit sans bloquer
+    # les écritures sur chaque partition et rattaché ; il devient valide
+    # quand toutes les partitions sont rattachées
+    op.execute(f"CREATE INDEX IF NOT EXISTS {INDEX} ON ONLY card_operations (card_id, created_at, id)")
+    with op.get_context().autocommit_block():
+        for partition in _partitions(op.get_bind()):
+            op.execute(
+                f"CREATE INDEX CONCURRENTLY IF NOT EXISTS {partition}_card_created "
+                f"ON {partition} (card_id, created_at, id)"
+            )
+            op.execute(f"ALTER INDEX {INDEX} ATTACH PARTITION {partition}_card_created")
+    # Préfixe du nouvel index : l'index simple sur card_id est redondant
+    op.execute("DROP INDEX IF EXISTS idx_card_id")
+
+
+def downgrade() -> None:
+    op.execute("CREATE INDEX IF NOT EXISTS idx_card_id ON card_operations (card_id)")
+    op.execute(f"DROP INDEX IF EXISTS {INDEX}")
@@ -0,0 +1,36 @@
+"""Partial (job_id, position) index on pending bulk items
+
+Revision ID: 009
+Revises: 008
+Create Date: 2026-10-18 00:00:00.000000
+
+"""
+from alembic import op
+
+# revision identifiers, used by Alembic.
+revision = '009'
+down_revision = '008'
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    # claim_pending_items trie par (job_id, position) : avec l'index partiel sur
+    # leased_until, le planner parcourait l'index unique (job_id, position) de
+    # toutes les lignes, traitées comprises. Le nouvel index partiel sert le
+    # filtre et le tri ; le bail est vérifié sur les seules lignes PENDING
+    with op.get_context().autocommit_block():
+        op.execute(
+            "CREATE INDEX CONCURRENTLY IF NOT EXISTS idx_bulk_items_pending_position "
+            "ON bulk_operation_items (job_id, position) WHERE status = 'PENDING'"
+        )
+        op.execute("DROP INDEX CONCURRENTLY IF EXISTS idx_bulk_items_pending")
+
+
+def downgrade() -> None:
+    with op.get_context().autocommit_block():
+        op.execute(
+            "CREATE INDEX CONCURRENTLY IF NOT EXISTS idx_bulk_items_pending "
+            "ON bulk_operation_items (leased_until) WHERE status = 'PENDING'"
+        )
+        op.execute("DROP INDEX CONCURRENTLY IF EXISTS idx_bulk_items_pending_position")
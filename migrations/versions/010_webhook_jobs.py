@@ -0,0 +1,54 @@
+"""Webhook jobs queue for asynchronous acknowledgement
+
+Revision ID: 010
+Revises: 009
+Create Date: 2026-10-18 00:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy.dialects import postgresql
+
+# revision identifiers, used by Alembic.
+revision = '010'
+down_revision = '009'
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    # Webhooks carte acceptés en mode asynchrone (WEBHOOK_ACK_MODE=async)
+    op.create_table(
+        'webhook_jobs',
+        sa.Column('id', postgresql.UUID(as_uuid=True), nullable=False),
+        sa.Column('skaleet_webhook_id', sa.String(), nullable=False),
+        sa.Column('skaleet_card_id', sa.Integer(), nullable=False),
+        sa.Column('event', sa.String(), nullable=False),
+        sa.Column('payload', postgresql.JSONB(astext_type=sa.Text()), nullable=False),
+        sa.Column('correlation_id', sa.String(), nullable=True),
+        sa.Column('status', sa.String(), nullable=False),
+        sa.Column('attempts', sa.Integer(), nullable=False),
+        sa.Column('next_attempt_at', sa.DateTime(), nullable=False),
+        sa.Column('last_error', sa.Text(), nullable=True),
+        sa.Column('created_at', sa.DateTime(), nullable=False),
+        sa.Column('finished_at', sa.DateTime(), nullable=True),
+        sa.PrimaryKeyConstraint('id')
+    )
+    # Réservation du webhookId dès la réception (INSERT ... ON CONFLICT DO NOTHING)
+    op.create_index('idx_webhook_jobs_webhook_id', 'webhook_jobs', ['skaleet_webhook_id'], unique=True)
+    # Index partiel : seuls les jobs à traiter sont parcourus par les workers
+    op.create_index(
+        'idx_webhook_jobs_pending_next_attempt',
+        'webhook_jobs',
+        ['next_attempt_at'],
+        unique=False,
+        postgresql_where=sa.text("status = 'PENDING'")
+    )
+    op.create_index('idx_webhook_jobs_created_at', 'webhook_jobs', ['created_at'], unique=False)
+
+
+def downgrade() -> None:
+    op.drop_index('idx_webhook_jobs_created_at', table_name='webhook_jobs')
+    op.drop_index('idx_webhook_jobs_pending_next_attempt', table_name='webhook_jobs')
+    op.drop_index('idx_webhook_jobs_webhook_id', table_name='webhook_jobs')
+    op.drop_table('webhook_jobs')
@@ -0,0 +1,29 @@
+"""(created_at, id) index on bulk operation jobs
+
+Revision ID: 011
+Revises: 010
+Create Date: 2026-10-18 00:00:00.000000
+
+"""
+from alembic import op
+
+# revision identifiers, used by Alembic.
+revision = '011'
+down_revision = '010'
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    # claim_pending_items sert les jobs dans l'ordre de réception (created_at, id)
+    # puis leurs lignes PENDING via idx_bulk_items_pending_position
+    with op.get_context().autocommit_block():
+        op.execute(
+            "CREATE INDEX CONCURRENTLY IF NOT EXISTS idx_bulk_jobs_created_at "
+            "ON bulk_operation_jobs (created_at, id)"
+        )
+
+
+def downgrade() -> None:
+    with op.get_context().autocommit_block():
+        op.execute("DROP INDEX CONCURRENTLY IF EXISTS idx_bulk_jobs_created_at")
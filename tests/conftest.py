@@ -1,9 +1,22 @@
+import os
 import pytest
+
+# Pas de préchauffage réseau vers NI / Skaleet pendant les tests
+os.environ.setdefault("HTTP_PREWARM_CONNECTIONS", "0")
+# Les workers de fond sont pilotés explicitement par les tests
+os.environ.setdefault("OUTBOX_WORKERS", "0")
+os.environ.setdefault("BULK_WORKERS", "0")
+os.environ.setdefault("WEBHOOK_JOB_WORKERS", "0")
+os.environ.setdefault("CARD_CACHE_PREWARM", "0")
+os.environ.setdefault("PARTITION_MAINTENANCE_INTERVAL", "0")
+
 from fastapi.testclient import TestClient
 from sqlalchemy.ext.asyncio import create_async_engine, AsyncSession, async_sessionmaker
 from sqlalchemy.pool import StaticPool
 from app.main import app
-from app.infra.db import Base, get_db
+from app.infra.db import Base, get_db, get_read_db, read_session_factory, DeadlineAwareSession
+from app.core.metrics import instrument_engine
+from app.infra.card_cache import card_cache
 
 
 # Base de données de test en mémoire (SQLite async)
@@ -15,10 +28,11 @@ test_engine = create_async_engine(
     poolclass=StaticPool,
     echo=False,
 )
+instrument_engine(test_engine)
 
 TestSessionLocal = async_sessionmaker(
     test_engine,
-    class_=AsyncSession,
+    class_=DeadlineAwareSession,
     expire_on_commit=False,
 )
 
@@ -46,8 +60,12 @@ def client():
             await conn.run_sync(Base.metadata.create_all)
     
     asyncio.run(setup())
+    # La base est recréée à chaque test : le cache d'identité des cartes aussi
+    card_cache.clear()
     
     app.dependency_overrides[get_db] = override_get_db
+    app.dependency_overrides[get_read_db] = override_get_db
+    app.dependency_overrides[read_session_factory] = lambda: TestSessionLocal
     with TestClient(app) as test_client:
         yield test_client
     app.dependency_overrides.clear()
@@ -59,3 +77,17 @@ def client():
     
     asyncio.run(cleanup())
 
+
+
+@pytest.fixture
+async def db_session():
+    """Fixture fournissant une session sur la base de test (tables créées puis supprimées)"""
+    async with test_engine.begin() as conn:
+        await conn.run_sync(Base.metadata.create_all)
+    card_cache.clear()
+    
+    async with TestSessionLocal() as session:
+        yield session
+    
+    async with test_engine.begin() as conn:
+        await conn.run_sync(Base.metadata.drop_all)
@@ -0,0 +1,167 @@
+import asyncio
+import uuid
+import pytest
+from datetime import datetime, timedelta
+from unittest.mock import AsyncMock, MagicMock, patch
+from sqlalchemy import select, update
+from app.domain.bulk import BulkOperationRunner
+from app.domain.enums import BulkJobStatus, OperationSource, OperationStatus
+from app.domain.models import BulkOperationItem, BulkOperationJob, CardOperation, SkaleetResultOutbox
+from app.infra.repositories import BulkOperationRepository
+from app.schemas.ni import NIResponse
+from tests.conftest import TestSessionLocal
+
+
+async def create_job(session, operations):
+    repo = BulkOperationRepository(session)
+    job = repo.create_job("test-correlation")
+    await session.flush()
+    await repo.add_items(job.id, [
+        {"position": position, "skaleet_card_id": card_id, "pan_alias": None, "operation_type": operation}
+        for position, (card_id, operation) in enumerate(operations, start=1)
+    ])
+    job.total_items = len(operations)
+    await session.commit()
+    return job.id
+
+
+async def load_all(session, model):
+    session.expire_all()
+    result = await session.execute(select(model))
+    return list(result.scalars().all())
+
+
+@pytest.fixture
+def ni_client():
+    """NIClient mocké : blocage OK, opposition refusée par NI"""
+    with patch("app.domain.services.NIClient") as ni_class:
+        ni = MagicMock()
+        ni.block_card_in_ni = AsyncMock(return_value=NIResponse(success=True, status="success"))
+        ni.oppose_card_in_ni = AsyncMock(return_value=NIResponse(success=False, status="error"))
+        ni_class.return_value = ni
+        yield ni
+
+
+def test_create_job_from_ndjson_stream(client):
+    """Test qu'un flux NDJSON crée un job et renvoie son id"""
+    body = (
+        b'{"cardId": 12345, "panAlias": "CMSPARTNER-12345", "operation": "card_blocking"}\n'
+        b'{"cardId": 12346, "operation": "card_opposition"}\n'
+        b'\n'
+        b'{"cardId": 12347, "operation": "card_blocking"}'
+    )
+    
+    response = client.post(
+        "/api/v1/internal/cards/bulk-operations",
+        content=body,
+        headers={"Content-Type": "application/x-ndjson"}
+    )
+    
+    assert response.status_code == 202
+    job = response.json()
+    assert job["totalItems"] == 3
+    assert job["status"] == BulkJobStatus.RUNNING.value
+    
+    progress = client.get(f"/api/v1/internal/cards/bulk-operations/{job['jobId']}")
+    assert progress.status_code == 200
+    assert progress.json()["processedItems"] == 0
+    
+    items = client.get(f"/api/v1/internal/cards/bulk-operations/{job['jobId']}/items", params={"limit": 2})
+    page = items.json()
+    assert [item["cardId"] for item in page["items"]] == [12345, 12346]
+    assert page["nextAfter"] == 2
+
+
+def test_invalid_line_rejects_whole_job(client):
+    """Test qu'une ligne invalide rejette la liste entière sans créer de job"""
+    response = client.post(
+        "/api/v1/internal/cards/bulk-operations",
+        json=[
+            {"cardId": 12345, "operation": "card_blocking"},
+            {"cardId": 12346, "operation": "card_teleport"}
+        ]
+    )
+    
+    assert response.status_code == 422
+    assert "Line 2" in response.json()["detail"]
+    
+    async def count_jobs():
+        async with TestSessionLocal() as session:
+            return len(await load_all(session, BulkOperationJob))
+    assert asyncio.run(count_jobs()) == 0
+
+
+async def test_runner_processes_items_and_completes_job(db_session, ni_client):
+    """Test que le runner traite les opérations, enregistre les résultats et clôture le job"""
+    job_id = await create_job(db_session, [
+        (12345, "card_blocking"),
+        (12346, "card_opposition"),
+        (12347, "card_blocking"),
+    ])
+    
+    # concurrency=1 : la base de test partage une seule connexion entre les sessions
+    runner = BulkOperationRunner(TestSessionLocal, workers=0, chunk_size=10, concurrency=1)
+    assert await runner.run_once() == 3
+    assert await runner.run_once() == 0
+    
+    items = sorted(await load_all(db_session, BulkOperationItem), key=lambda item: item.position)
+    assert [item.status for item in items] == [
+        OperationStatus.SUCCESS.value,
+        OperationStatus.ERROR.value,
+        OperationStatus.SUCCESS.value,
+    ]
+    assert all(item.card_operation_id and item.processed_at for item in items)
+    
+    job = (await load_all(db_session, BulkOperationJob))[0]
+    assert job.id == job_id
+    assert job.status == BulkJobStatus.COMPLETED.value
+    assert (job.processed_items, job.succeeded_items, job.failed_items) == (3, 2, 1)
+    
+    operations = await load_all(db_session, CardOperation)
+    assert {operation.source for operation in operations} == {OperationSource.INTERNAL.value}
+    assert {operation.skaleet_webhook_id for operation in operations} == {
+        f"bulk:{job_id}:{position}" for position in (1, 2, 3)
+    }
+    outbox = await load_all(db_session, SkaleetResultOutbox)
+    assert sorted(message.result for message in outbox) == ["accept", "accept", "error"]
+
+
+async def test_reclaimed_item_is_not_sent_twice_to_ni(db_session, ni_client):
+    """Test qu'un lot repris après un crash ne rappelle pas NI pour une opération déjà traitée"""
+    await create_job(db_session, [(12345, "card_blocking")])
+    runner = BulkOperationRunner(TestSessionLocal, workers=0, concurrency=1)
+    await runner.run_once()
+    
+    # Simuler un crash entre l'appel NI et l'écriture du résultat du lot
+    await db_session.execute(
+        update(BulkOperationItem).values(status=OperationStatus.PENDING.value, leased_until=None)
+    )
+    await db_session.commit()
+    
+    assert await runner.run_once() == 1
+    assert ni_client.block_card_in_ni.await_count == 1
+    item = (await load_all(db_session, BulkOperationItem))[0]
+    assert item.status == OperationStatus.SUCCESS.value
+
+
+async def test_jobs_are_claimed_in_submission_order(db_session):
+    """Test qu'un job reçu plus tôt est servi en premier, quel que soit son id"""
+    now = datetime.utcnow()
+    earlier = BulkOperationJob(id=uuid.UUID("f" * 32), status=BulkJobStatus.RUNNING.value, created_at=now - timedelta(hours=1))
+    later = BulkOperationJob(id=uuid.UUID("0a" + "0" * 30), status=BulkJobStatus.RUNNING.value, created_at=now)
+    db_session.add_all([earlier, later])
+    await db_session.flush()
+    repo = BulkOperationRepository(db_session)
+    for job in (later, earlier):
+        await repo.add_items(job.id, [
+            {"position": position, "skaleet_card_id": 20000 + position, "pan_alias": None, "operation_type": "card_blocking"}
+            for position in range(1, 4)
+        ])
+    await db_session.commit()
+    
+    async with TestSessionLocal() as session:
+        items = await BulkOperationRepository(session).claim_pending_items(limit=4, lease_seconds=30)
+    
+    assert [(item.job_id, item.position) for item in items] == [
+        (earlier.id, 1), (earlier.id, 2), (earlier.id, 3), (later.id, 1)
+    ]
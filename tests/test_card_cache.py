@@ -0,0 +1,71 @@
+import uuid
+from unittest.mock import AsyncMock, MagicMock, patch
+from app.infra.card_cache import CardIdentity, CardIdentityCache, card_cache
+from app.infra.repositories import CardRepository
+from app.schemas.ni import NIResponse
+
+
+def test_cache_evicts_least_recently_used_and_expired_entries():
+    """Test de l'éviction LRU, du TTL et du taux de hit"""
+    now = [0.0]
+    cache = CardIdentityCache(max_size=2, ttl=10.0, clock=lambda: now[0])
+    for skaleet_card_id in (1, 2):
+        cache.put(CardIdentity(uuid.uuid4(), skaleet_card_id))
+    
+    assert cache.get(1) is not None  # 1 devient la plus récente
+    cache.put(CardIdentity(uuid.uuid4(), 3))
+    assert cache.get(2) is None
+    
+    now[0] = 11.0
+    assert cache.get(1) is None
+    assert cache.snapshot() == {"size": 1, "max_size": 2, "hits": 1, "misses": 2, "hit_ratio": 0.3333}
+
+
+async def test_cache_is_populated_on_upsert_and_status_update(db_session):
+    """Test que l'upsert et la mise à jour du statut NI alimentent le cache, puis le préchauffage"""
+    repo = CardRepository(db_session)
+    card = await repo.get_or_create(32345)
+    await repo.update_status_ni(card.id, "BLOCKED")
+    await db_session.commit()
+    
+    assert card_cache.get(32345) == CardIdentity(card.id, 32345, None, "BLOCKED")
+    # Un pan_alias encore inconnu passe par la base pour y être enregistré
+    identity = await repo.resolve(32345, "CMSPARTNER-32345")
+    assert identity.pan_alias == "CMSPARTNER-32345"
+    
+    card_cache.clear()
+    assert await card_cache.prewarm(db_session, 10) == 1
+    assert card_cache.get(32345).id == card.id
+
+
+def test_second_webhook_for_a_card_skips_the_card_lookup(client):
+    """Test que le second webhook d'une carte résout son identité depuis le cache"""
+    with patch("app.domain.services.NIClient") as ni_class:
+        ni = MagicMock()
+        ni.block_card_in_ni = AsyncMock(return_value=NIResponse(success=True, status="success"))
+        ni_class.return_value = ni
+        for index in range(2):
+            response = client.post(
+                "/api/v1/webhooks/skaleet/card",
+                json={
+                    "id": f"24016{index}",
+                    "webhookId": f"0189fc90-73ae-701f-90a2-116ab0f552{index}0",
+                    "type": "card",
+                    "event": "card.status.block_requested",
+                    "data": {"cardId": 32346, "panAlias": "CMSPARTNER-32346"}
+                }
+            )
+            assert response.status_code == 200
+    
+    assert card_cache.hits == 1
+    assert card_cache.get(32346).status_ni == "BLOCKED"
+
+
+def test_support_lookups_do_not_count_in_cache_stats(client):
+    """Test que l'historique d'une carte (endpoint de support) ne fausse pas le taux de hit"""
+    card_cache.put(CardIdentity(uuid.uuid4(), 32347))
+    hits, misses = card_cache.hits, card_cache.misses
+    
+    assert client.get("/api/v1/internal/cards/32347/operations").status_code == 200
+    assert client.get("/api/v1/internal/cards/32348/operations").status_code == 404
+    assert (card_cache.hits, card_cache.misses) == (hits, misses)
@@ -0,0 +1,185 @@
+import asyncio
+import os
+from contextlib import asynccontextmanager, nullcontext
+import pytest
+from unittest.mock import AsyncMock, MagicMock, patch
+from sqlalchemy import text
+from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
+from app.core.metrics import CARD_LOCK_WAIT_SECONDS
+from app.infra.card_lock import CardLockManager, CardLockTimeout
+from app.schemas.ni import NIResponse
+from tests.conftest import test_engine
+
+
+async def test_same_card_operations_run_one_after_the_other():
+    """Test que deux opérations sur la même carte ne se chevauchent pas, dans l'ordre d'arrivée"""
+    locks = CardLockManager()
+    events = []
+    
+    async def operation(name):
+        async with locks.hold(12345):
+            events.append(f"{name}:start")
+            await asyncio.sleep(0.01)
+            events.append(f"{name}:end")
+    
+    await asyncio.gather(operation("block"), operation("unblock"))
+    
+    assert events == ["block:start", "block:end", "unblock:start", "unblock:end"]
+    assert locks.active_cards == 0
+    assert CARD_LOCK_WAIT_SECONDS.snapshot("local")["count"] >= 2
+
+
+async def test_different_cards_stay_parallel():
+    """Test que des cartes différentes ne s'attendent pas"""
+    locks = CardLockManager()
+    inside = asyncio.Event()
+    
+    async def first():
+        async with locks.hold(1):
+            await asyncio.wait_for(inside.wait(), timeout=1)
+    
+    async def second():
+        async with locks.hold(2):
+            inside.set()
+    
+    await asyncio.gather(first(), second())
+    assert locks.active_cards == 0
+
+
+async def test_lock_wait_is_bounded(caplog):
+    """Test du timeout d'attente du verrou et du log des cartes chaudes"""
+    locks = CardLockManager(timeout=0.05, slow_wait=0.0)
+    
+    async with locks.hold(7):
+        with pytest.raises(CardLockTimeout):
+            async with locks.hold(7):
+                pass
+    
+    assert locks.active_cards == 0
+    assert "Card 7 lock acquired" in caplog.text
+
+
+async def test_advisory_lock_skipped_outside_postgresql():
+    """Test que le verrou entre nœuds n'est pris que sous PostgreSQL"""
+    locks = CardLockManager(advisory=True)
+    
+    assert locks._uses_advisory(test_engine) is False
+    async with locks.hold(3, test_engine):
+        pass
+
+
+async def test_distinct_cards_run_in_parallel():
+    """Test que les opérations sur des cartes différentes ne sont pas plafonnées"""
+    locks = CardLockManager(pool_size=2)
+    cards = 20
+    all_inside = asyncio.Event()
+    
+    async def operation(card_id):
+        async with locks.hold(card_id):
+            if locks.in_flight == cards:
+                all_inside.set()
+            await asyncio.wait_for(all_inside.wait(), 1.0)
+    
+    await asyncio.gather(*(operation(card_id) for card_id in range(cards)))
+    assert locks.in_flight == 0 and locks.active_cards == 0
+
+
+async def test_advisory_path_is_capped_by_lock_pool(monkeypatch):
+    """Test que seul le chemin du verrou consultatif attend une connexion du pool dédié"""
+    locks = CardLockManager(advisory=True, pool_size=2)
+    connected = []
+    peak = 0
+    
+    @asynccontextmanager
+    async def connect():
+        nonlocal peak
+        connected.append(1)
+        peak = max(peak, len(connected))
+        try:
+            yield MagicMock(begin=MagicMock(return_value=nullcontext()))
+        finally:
+            connected.pop()
+    
+    monkeypatch.setattr(locks, "_uses_advisory", lambda engine: True)
+    monkeypatch.setattr(locks, "_lock_engine", lambda engine: MagicMock(connect=connect))
+    monkeypatch.setattr(locks, "_advisory_lock", AsyncMock())
+    
+    async def operation(card_id):
+        async with locks.hold(card_id, test_engine):
+            await asyncio.sleep(0.01)
+    
+    await asyncio.gather(*(operation(card_id) for card_id in range(6)))
+    assert peak == 2
+    assert locks._advisory_lock.await_count == 6
+
+
+@pytest.fixture
+async def pg_engine():
+    """Engine PostgreSQL au pool volontairement petit (TEST_POSTGRESQL_URL)"""
+    url = os.environ.get("TEST_POSTGRESQL_URL")
+    if not url:
+        pytest.skip("TEST_POSTGRESQL_URL non défini")
+    engine = create_async_engine(url, pool_size=2, max_overflow=0, pool_timeout=2)
+    yield engine
+    await engine.dispose()
+
+
+async def test_advisory_lock_does_not_use_the_operation_pool(pg_engine):
+    """
+    Test du chemin PostgreSQL : plus d'opérations que de connexions dans le pool
+    principal, chacune avec une requête sous verrou, sans épuisement du pool
+    """
+    locks = CardLockManager(advisory=True, pool_size=4)
+    sessions = async_sessionmaker(pg_engine, expire_on_commit=False)
+    
+    async def operation(card_id):
+        async with locks.hold(card_id, pg_engine):
+            async with sessions() as session:
+                await session.execute(text("SELECT pg_sleep(0.05)"))
+                await session.commit()
+    
+    try:
+        await asyncio.gather(*(operation(900000 + index) for index in range(8)))
+        assert pg_engine.pool.checkedout() == 0
+        assert CARD_LOCK_WAIT_SECONDS.snapshot("advisory")["count"] >= 8
+    finally:
+        await locks.close()
+
+
+async def test_advisory_lock_serializes_nodes(pg_engine):
+    """Test du chemin PostgreSQL : deux gestionnaires (deux nœuds) sur la même carte"""
+    first_node = CardLockManager(advisory=True)
+    second_node = CardLockManager(advisory=True, timeout=0.2)
+    
+    try:
+        async with first_node.hold(900100, pg_engine):
+            with pytest.raises(CardLockTimeout):
+                async with second_node.hold(900100, pg_engine):
+                    pass
+        async with second_node.hold(900100, pg_engine):
+            pass
+    finally:
+        await first_node.close()
+        await second_node.close()
+
+
+def test_busy_card_webhook_returns_retryable_503(client):
+    """Test qu'un webhook dont la carte reste occupée reçoit un 503 (retry Skaleet)"""
+    with patch("app.domain.services.NIClient") as ni_class, \
+            patch("app.domain.services.card_locks.hold", side_effect=CardLockTimeout(82345)):
+        ni = MagicMock()
+        ni.block_card_in_ni = AsyncMock(return_value=NIResponse(success=True, status="success"))
+        ni_class.return_value = ni
+        
+        response = client.post("/api/v1/webhooks/skaleet/card", json={
+            "id": "evt-lock-1",
+            "webhookId": "wh-lock-1",
+            "type": "card",
+            "event": "card.status.block_requested",
+            "data": {"cardId": 82345, "panAlias": "CMSPARTNER-82345"}
+        })
+    
+    assert response.status_code == 503
+    assert response.headers["retry-after"] == "1"
+    assert response.json()["error"] == "card_lock_timeout"
+    ni.block_card_in_ni.assert_not_called()
@@ -0,0 +1,81 @@
+import io
+import json
+from collections import Counter
+from datetime import datetime
+from sqlalchemy import func, select
+from app.domain.models import Card, CardOperation, WebhookClaim, WebhookEvent
+from tools.datagen import DatasetGenerator, DatasetSpec, build_parser, load_dataset, spec_from_args, write_webhooks
+from tools.loadtest import WebhookReplay
+from tests.conftest import test_engine
+
+END = datetime(2026, 10, 1)
+
+
+def _generator(**overrides) -> DatasetGenerator:
+    values = dict(cards=200, operations=5000, events=500, end=END, seed=7)
+    values.update(overrides)
+    return DatasetGenerator(DatasetSpec(**values))
+
+
+def test_same_seed_same_dataset():
+    """Test du déterminisme : même graine, mêmes lignes ; autre graine, autres lignes"""
+    first = next(_generator().operation_batches(100))[0]
+    second = next(_generator().operation_batches(100))[0]
+    other = next(_generator(seed=8).operation_batches(100))[0]
+    
+    assert first == second
+    assert [row[0] for row in first] != [row[0] for row in other]
+    assert list(_generator().webhooks(50, 0.1)) == list(_generator().webhooks(50, 0.1))
+
+
+def test_distributions():
+    """Test de l'activité inégale des cartes, de la répartition des statuts et de l'ordre chronologique"""
+    operations = [row for rows, _ in _generator().operation_batches(1000) for row in rows]
+    
+    by_card = Counter(row[1] for row in operations)
+    hottest = sum(count for _, count in by_card.most_common(10))
+    # 5 % des cartes concentrent bien plus de 5 % des opérations
+    assert hottest > 0.3 * len(operations)
+    statuses = Counter(row[4] for row in operations)
+    assert 0.9 < statuses["SUCCESS"] / len(operations) < 0.96
+    assert statuses["ERROR"] and statuses["PENDING"]
+    created = [row[-1] for row in operations]
+    assert created == sorted(created) and created[-1] < END
+    sizes = [len(row[10]["data"]["metadata"]["note"]) for row in operations]
+    assert min(sizes) < 600 < max(sizes)
+
+
+async def test_load_dataset(db_session):
+    """Test du chargement par lots : lignes, réservations et références aux cartes cohérentes"""
+    report = await load_dataset(test_engine, _generator(), batch_size=700)
+    
+    assert report["rows"] == {"cards": 200, "card_operations": 5000, "webhook_claims": 5000, "webhook_events": 500}
+    assert (await db_session.execute(select(func.count()).select_from(WebhookEvent))).scalar() == 500
+    orphans = await db_session.execute(
+        select(func.count()).select_from(CardOperation).outerjoin(Card, Card.id == CardOperation.card_id).where(Card.id.is_(None))
+    )
+    assert orphans.scalar() == 0
+    unclaimed = await db_session.execute(
+        select(func.count()).select_from(CardOperation)
+        .outerjoin(WebhookClaim, WebhookClaim.skaleet_webhook_id == CardOperation.skaleet_webhook_id)
+        .where(WebhookClaim.card_operation_id.is_(None))
+    )
+    assert unclaimed.scalar() == 0
+
+
+def test_webhook_stream_replays_in_loadtest(tmp_path):
+    """Test du flux de webhooks : cartes du jeu de données, doublons reconnus au rejeu"""
+    args = build_parser().parse_args(["--cards", "50", "--seed", "3", "--end", "2026-10-01", "--first-card-id", "500"])
+    generator = DatasetGenerator(spec_from_args(args))
+    output = io.StringIO()
+    assert write_webhooks(output, generator, 200, 0.2) == 200
+    stream = tmp_path / "webhooks.ndjson"
+    stream.write_text(output.getvalue())
+    
+    bodies = [json.loads(line) for line in output.getvalue().splitlines()]
+    assert all(500 <= body["data"]["cardId"] < 550 for body in bodies)
+    replay = WebhookReplay(str(stream))
+    replayed = [replay.next() for _ in range(200)]
+    replay.close()
+    assert sum(duplicate for _, _, duplicate in replayed) == 200 - len({body["webhookId"] for body in bodies})
+    assert {name for name, _, _ in replayed} <= {"activation", "block", "unblock", "oppose"}
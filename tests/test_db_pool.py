@@ -0,0 +1,44 @@
+import pytest
+from sqlalchemy import exc, text
+from sqlalchemy.ext.asyncio import create_async_engine
+from app.core.metrics import DB_POOL_CHECKOUT_SECONDS, render_metrics
+from app.infra.db import InstrumentedQueuePool, engine_options, instrument_pool
+
+
+def test_engine_options_expose_pool_and_asyncpg_caches(monkeypatch):
+    """Test que les réglages du pool et des caches asyncpg viennent des settings"""
+    monkeypatch.setattr("app.infra.db.settings.db_pool_size", 25)
+    monkeypatch.setattr("app.infra.db.settings.db_statement_cache_size", 0)
+    
+    options = engine_options("postgresql+asyncpg://user:pass@db/cards")
+    
+    assert options["poolclass"] is InstrumentedQueuePool
+    assert options["pool_size"] == 25
+    assert options["pool_pre_ping"] is True
+    assert options["connect_args"]["statement_cache_size"] == 0
+    assert "pool_size" not in engine_options("sqlite+aiosqlite:///:memory:")
+
+
+async def test_pool_gauges_and_checkout_wait(tmp_path, monkeypatch):
+    """Test des jauges du pool, du temps d'obtention et du comptage des timeouts"""
+    monkeypatch.setattr("app.infra.db.settings.db_pool_size", 1)
+    monkeypatch.setattr("app.infra.db.settings.db_max_overflow", 0)
+    monkeypatch.setattr("app.infra.db.settings.db_pool_timeout", 0.05)
+    url = f"sqlite+aiosqlite:///{tmp_path / 'pool.db'}"
+    engine = create_async_engine(url, **engine_options(url, pool_name="test"))
+    instrument_pool(engine, "test")
+    
+    try:
+        async with engine.connect() as conn:
+            await conn.execute(text("SELECT 1"))
+            assert 'db_pool_checked_out{pool="test"} 1' in render_metrics()
+            with pytest.raises(exc.TimeoutError):
+                async with engine.connect():
+                    pass
+    finally:
+        await engine.dispose()
+    
+    metrics = render_metrics()
+    assert 'db_pool_checked_out{pool="test"} 0' in metrics
+    assert 'db_pool_timeouts_total{pool="test"} 1' in metrics
+    assert DB_POOL_CHECKOUT_SECONDS.snapshot("test")["count"] == 2
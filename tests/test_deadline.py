@@ -0,0 +1,172 @@
+import asyncio
+import os
+import httpx
+import pytest
+from sqlalchemy import select, text
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker, create_async_engine
+from app.domain.models import Card
+from app.infra.db import DeadlineAwareSession
+from app.infra.ni_client import NIClient
+from app.utils.deadline import (
+    DeadlineExceeded,
+    bounded_timeout,
+    deadline_exempt,
+    detached_deadline,
+    remaining,
+    resolve_request_budget,
+    set_deadline,
+    within_deadline,
+    deadline_var,
+)
+
+
+@pytest.fixture(autouse=True)
+def no_deadline():
+    token = deadline_var.set(None)
+    yield
+    deadline_var.reset(token)
+
+
+def test_request_budget_uses_smallest_of_config_and_header(monkeypatch):
+    """Test que le budget retenu est le plus petit entre configuration et header, moins la marge"""
+    monkeypatch.setattr("app.utils.deadline.settings.request_deadline_seconds", 10.0)
+    monkeypatch.setattr("app.utils.deadline.settings.request_deadline_margin", 0.5)
+    
+    assert resolve_request_budget(None) == 9.5
+    assert resolve_request_budget("2000") == 1.5
+    assert resolve_request_budget("60000") == 9.5
+    assert resolve_request_budget("not-a-number") == 9.5
+    assert resolve_request_budget("100") == 0.0
+
+
+def test_no_deadline_when_disabled(monkeypatch):
+    """Test qu'aucune deadline n'est fixée si elle est désactivée et absente du header"""
+    monkeypatch.setattr("app.utils.deadline.settings.request_deadline_seconds", 0)
+    
+    assert resolve_request_budget(None) is None
+    assert bounded_timeout(30.0, "ni") == 30.0
+
+
+def test_bounded_timeout_uses_remaining_budget():
+    """Test que le timeout d'un appel ne dépasse pas le budget restant"""
+    set_deadline(1.0)
+    assert bounded_timeout(30.0, "ni") <= 1.0
+    
+    set_deadline(0.0)
+    with pytest.raises(DeadlineExceeded):
+        bounded_timeout(30.0, "ni")
+
+
+async def test_within_deadline_cuts_work_short():
+    """Test qu'une attente plus longue que le budget est interrompue"""
+    set_deadline(0.05)
+    with pytest.raises(DeadlineExceeded) as exc_info:
+        await within_deadline(asyncio.sleep(1), "ni")
+    assert exc_info.value.stage == "ni"
+
+
+async def test_detached_deadline_suspends_budget():
+    """Test qu'un bloc détaché n'est pas soumis à la deadline"""
+    set_deadline(0.0)
+    with detached_deadline():
+        assert remaining() is None
+        await within_deadline(asyncio.sleep(0), "ni")
+    assert remaining() <= 0
+
+
+async def test_ni_call_is_skipped_when_budget_is_exhausted(monkeypatch):
+    """Test que NI n'est pas appelé quand le budget est épuisé"""
+    monkeypatch.setattr("app.infra.ni_client.settings.ni_use_mock", False)
+    calls = []
+    
+    def handler(request: httpx.Request) -> httpx.Response:
+        calls.append(request)
+        return httpx.Response(200, json={"success": True})
+    
+    set_deadline(0.0)
+    async with httpx.AsyncClient(transport=httpx.MockTransport(handler)) as client:
+        response = await NIClient(http_client=client).block_card_in_ni(12346, None)
+    
+    assert response.success is False
+    assert response.status == "deadline_exceeded"
+    assert calls == []
+
+
+def test_webhook_returns_504_when_caller_budget_is_exhausted(client):
+    """Test que le webhook répond 504 si le budget annoncé par l'appelant est déjà épuisé"""
+    response = client.post(
+        "/api/v1/webhooks/skaleet/card",
+        json={
+            "id": "2401598",
+            "webhookId": "0189fc90-73ae-701f-90a2-116ab0f5521d",
+            "type": "card",
+            "event": "card.status.block_requested",
+            "data": {"cardId": 12346, "panAlias": "CMSPARTNER-12346"}
+        },
+        headers={"X-Request-Timeout-Ms": "100"}
+    )
+    
+    assert response.status_code == 504
+    assert response.json()["error"] == "deadline_exceeded"
+
+
+def test_long_internal_endpoints_are_exempt():
+    """Test que la réception des opérations en masse et les exports n'ont pas de deadline"""
+    assert deadline_exempt("/api/v1/internal/cards/bulk-operations")
+    assert deadline_exempt("/api/v1/internal/operations/export")
+    assert not deadline_exempt("/api/v1/webhooks/skaleet/card")
+    assert not deadline_exempt("/api/v1/internal/operations")
+
+
+async def test_commit_is_never_cancelled(db_session, monkeypatch):
+    """Test qu'un COMMIT plus long que le budget restant va à son terme"""
+    original_commit = AsyncSession.commit
+    
+    async def slow_commit(self):
+        await asyncio.sleep(0.1)
+        await original_commit(self)
+    
+    monkeypatch.setattr(AsyncSession, "commit", slow_commit)
+    db_session.add(Card(skaleet_card_id=70001, status_skaleet="ACTIVE"))
+    set_deadline(0.02)
+    await db_session.commit()
+    
+    with detached_deadline():
+        assert (await db_session.execute(select(Card.skaleet_card_id))).scalar_one() == 70001
+
+
+async def test_expired_budget_is_checked_before_commit(db_session):
+    """Test qu'un budget épuisé est constaté avant le COMMIT : rien n'est validé"""
+    db_session.add(Card(skaleet_card_id=70002, status_skaleet="ACTIVE"))
+    await db_session.flush()
+    set_deadline(0.0)
+    with pytest.raises(DeadlineExceeded) as exc_info:
+        await db_session.commit()
+    assert exc_info.value.stage == "db.commit"
+    
+    with detached_deadline():
+        await db_session.rollback()
+        assert (await db_session.execute(select(Card))).first() is None
+
+
+async def test_postgresql_statement_timeout_follows_budget():
+    """Test du chemin PostgreSQL : le budget est imposé par statement_timeout, côté serveur"""
+    url = os.environ.get("TEST_POSTGRESQL_URL")
+    if not url:
+        pytest.skip("TEST_POSTGRESQL_URL non défini")
+    engine = create_async_engine(url)
+    sessions = async_sessionmaker(engine, class_=DeadlineAwareSession, expire_on_commit=False)
+    try:
+        async with sessions() as session:
+            set_deadline(5.0)
+            timeout = (await session.execute(text("SHOW statement_timeout"))).scalar_one()
+            assert timeout.endswith("ms") or timeout.endswith("s")
+            set_deadline(0.2)
+            with pytest.raises(DeadlineExceeded):
+                await session.execute(text("SELECT pg_sleep(2)"))
+            await session.rollback()
+            # Bloc détaché : plus de statement_timeout dans la transaction
+            with detached_deadline():
+                assert (await session.execute(text("SHOW statement_timeout"))).scalar_one() == "0"
+    finally:
+        await engine.dispose()
@@ -0,0 +1,58 @@
+import httpx
+import pytest
+from app.infra import http_clients
+from app.infra.http_clients import get_http_client, close_http_clients, NI, SKALEET_ADMIN
+from app.infra.ni_client import NIClient
+from app.infra.skaleet_auth import SkaleetTokenManager
+from app.infra.skaleet_client import send_card_operation_result
+
+
+def test_shared_client_is_reused():
+    """Test qu'un seul client est créé par upstream"""
+    assert get_http_client(NI) is get_http_client(NI)
+    assert get_http_client(NI) is not get_http_client(SKALEET_ADMIN)
+
+
+async def test_close_http_clients_resets_registry():
+    """Test que la fermeture vide le registre et ferme les clients"""
+    client = get_http_client(NI)
+    await close_http_clients()
+    
+    assert client.is_closed
+    assert http_clients._clients == {}
+    assert get_http_client(NI) is not client
+
+
+async def test_ni_client_uses_injected_http_client(monkeypatch):
+    """Test que NIClient utilise le client HTTP injecté"""
+    monkeypatch.setattr("app.infra.ni_client.settings.ni_use_mock", False)
+    seen = []
+    
+    def handler(request: httpx.Request) -> httpx.Response:
+        seen.append(request.url.path)
+        return httpx.Response(200, json={"success": True, "status": "BLOCKED"})
+    
+    async with httpx.AsyncClient(transport=httpx.MockTransport(handler)) as client:
+        ni_client = NIClient(http_client=client)
+        response = await ni_client.block_card_in_ni(12346, "CMSPARTNER-12346")
+    
+    assert response.success is True
+    assert response.status == "BLOCKED"
+    assert seen == ["/cards/block"]
+
+
+async def test_send_card_operation_result_uses_injected_http_client(monkeypatch):
+    """Test que le token et le callback Skaleet passent par le même client"""
+    seen = []
+    
+    def handler(request: httpx.Request) -> httpx.Response:
+        seen.append(request.url.path)
+        if request.url.path == "/oauth/token":
+            return httpx.Response(200, json={"access_token": "token"})
+        return httpx.Response(200, json={})
+    
+    async with httpx.AsyncClient(transport=httpx.MockTransport(handler)) as client:
+        monkeypatch.setattr("app.infra.skaleet_client.admin_token_manager", SkaleetTokenManager(http_client=client))
+        await send_card_operation_result(12345, "card_activation", "accept", http_client=client)
+    
+    assert seen == ["/oauth/token", "/cards/12345/operation/card_activation/accept"]
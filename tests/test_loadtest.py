@@ -0,0 +1,42 @@
+import json
+import httpx
+from tools.loadtest import WebhookGenerator, build_parser, parse_card_range, parse_mix, percentile, run
+
+
+def test_percentile_nearest_rank():
+    """Test du calcul des percentiles (rang le plus proche)"""
+    values = [float(v) for v in range(1, 101)]
+    assert percentile(values, 50) == 50.0
+    assert percentile(values, 99) == 99.0
+    assert percentile([], 50) is None
+
+
+def test_generator_mix_and_duplicates():
+    """Test que les webhookIds sont uniques hors doublons volontaires"""
+    generator = WebhookGenerator(parse_mix("block=1,oppose=1"), parse_card_range("100-199"), 0.2, seed=1)
+    payloads = [generator.next() for _ in range(500)]
+    
+    fresh = [body["webhookId"] for _, body, duplicate in payloads if not duplicate]
+    duplicates = [body["webhookId"] for _, body, duplicate in payloads if duplicate]
+    assert len(set(fresh)) == len(fresh)
+    assert duplicates and set(duplicates) <= set(fresh)
+    assert {name for name, _, _ in payloads} == {"block", "oppose"}
+    assert all(100 <= body["data"]["cardId"] <= 199 for _, body, _ in payloads)
+
+
+async def test_run_produces_json_report():
+    """Test qu'un run court produit un rapport complet"""
+    def handler(request: httpx.Request) -> httpx.Response:
+        event = json.loads(request.content)["event"]
+        status = 500 if event == "card.status.opposed_requested" else 200
+        return httpx.Response(status, json={"ok": status == 200})
+    
+    args = build_parser().parse_args(["--concurrency", "4", "--duration", "0.2", "--mix", "block=1,oppose=1", "--seed", "3"])
+    report = await run(args, transport=httpx.MockTransport(handler))
+    
+    assert report["requests"] > 0
+    assert report["latency_ms"]["p99"] is not None
+    assert report["by_event"]["oppose"]["errors"] == report["by_event"]["oppose"]["count"]
+    assert report["by_event"]["block"]["errors"] == 0
+    assert report["db_connections"]["available"] is False
+    json.dumps(report)
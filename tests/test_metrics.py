@@ -0,0 +1,78 @@
+import logging
+import httpx
+from unittest.mock import AsyncMock, MagicMock, patch
+from app.core.metrics import (
+    Histogram,
+    RequestCost,
+    http_cost_hooks,
+    request_cost_var,
+    REQUEST_DB_STATEMENTS,
+    reset_metrics,
+)
+from app.schemas.ni import NIResponse
+
+
+def test_histogram_renders_prometheus_text():
+    """Test du rendu cumulatif des buckets"""
+    histogram = Histogram("test_seconds", "Test", (0.1, 1.0))
+    histogram.observe(0.05, "/a")
+    histogram.observe(0.5, "/a")
+    histogram.observe(5.0, "/a")
+    
+    text = histogram.render()
+    assert 'test_seconds_bucket{route="/a",le="0.1"} 1' in text
+    assert 'test_seconds_bucket{route="/a",le="1"} 2' in text
+    assert 'test_seconds_bucket{route="/a",le="+Inf"} 3' in text
+    assert 'test_seconds_count{route="/a"} 3' in text
+
+
+async def test_http_hooks_add_upstream_time():
+    """Test que les hooks httpx ajoutent le temps d'attente de l'upstream au coût de la requête"""
+    cost = RequestCost()
+    token = request_cost_var.set(cost)
+    try:
+        transport = httpx.MockTransport(lambda request: httpx.Response(200, json={}))
+        async with httpx.AsyncClient(transport=transport, event_hooks=http_cost_hooks("ni")) as client:
+            await client.post("http://ni/cards/block", json={})
+            await client.post("http://ni/cards/oppose", json={})
+    finally:
+        request_cost_var.reset(token)
+    
+    assert cost.ni_calls == 2
+    assert cost.skaleet_calls == 0
+
+
+def test_webhook_access_log_carries_request_cost(client, caplog):
+    """Test que la ligne de log d'accès contient le coût SQL de la requête et alimente les histogrammes"""
+    reset_metrics()
+    with patch("app.domain.services.NIClient") as ni_class:
+        ni = MagicMock()
+        ni.block_card_in_ni = AsyncMock(return_value=NIResponse(success=True, status="success"))
+        ni_class.return_value = ni
+        with caplog.at_level(logging.INFO, logger="app.access"):
+            response = client.post(
+                "/api/v1/webhooks/skaleet/card",
+                json={
+                    "id": "2401598",
+                    "webhookId": "0189fc90-73ae-701f-90a2-116ab0f5521d",
+                    "type": "card",
+                    "event": "card.status.block_requested",
+                    "data": {"cardId": 12346, "panAlias": "CMSPARTNER-12346"}
+                }
+            )
+    
+    assert response.status_code == 200
+    access = [r for r in caplog.records if r.name == "app.access"][-1]
+    assert access.status_code == 200
+    assert access.route == "/api/v1/webhooks/skaleet/card"
+    assert access.db_statements > 0
+    # Une transaction avant l'appel NI, une après
+    assert access.db_commits == 2
+    assert access.db_ms >= 0 and access.cpu_ms >= 0
+    
+    snapshot = REQUEST_DB_STATEMENTS.snapshot("/api/v1/webhooks/skaleet/card")
+    assert snapshot["count"] == 1
+    
+    metrics = client.get("/api/v1/metrics")
+    assert metrics.status_code == 200
+    assert 'http_request_db_statements_count{route="/api/v1/webhooks/skaleet/card"} 1' in metrics.text
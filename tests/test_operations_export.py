@@ -0,0 +1,99 @@
+import asyncio
+import csv
+import gzip
+import io
+import json
+import logging
+from datetime import datetime, timedelta
+from app.domain.enums import ExportFormat
+from app.domain.exports import EXPORT_FIELDS, export_query, iter_export
+from app.domain.models import CardOperation
+from app.infra.repositories import CardRepository
+from tests.conftest import TestSessionLocal
+
+DAY = datetime(2026, 10, 17)
+
+
+async def seed(session):
+    """6 opérations le 17/10 (une sur deux en erreur) et une le 18/10"""
+    card = await CardRepository(session).get_or_create(72345, "CMSPARTNER-72345")
+    for index in range(7):
+        session.add(CardOperation(
+            card_id=card.id,
+            operation_type="card_blocking",
+            source="SKA",
+            status="ERROR" if index % 2 else "SUCCESS",
+            skaleet_webhook_id=f"wh-{index}",
+            created_at=DAY + timedelta(hours=4 * index + 1)
+        ))
+    await session.commit()
+
+
+def test_ndjson_export_filtered_by_day_and_status(client):
+    """Test de l'export NDJSON filtré par période et statut"""
+    async def setup():
+        async with TestSessionLocal() as session:
+            await seed(session)
+    asyncio.run(setup())
+    
+    response = client.get("/api/v1/internal/operations/export", params={
+        "from": DAY.isoformat(),
+        "to": (DAY + timedelta(days=1)).isoformat(),
+        "status": "SUCCESS"
+    })
+    
+    assert response.status_code == 200
+    assert response.headers["content-type"].startswith("application/x-ndjson")
+    rows = [json.loads(line) for line in response.text.splitlines()]
+    assert [row["skaleet_webhook_id"] for row in rows] == ["wh-0", "wh-2", "wh-4"]
+    assert rows[0]["skaleet_card_id"] == 72345
+    assert rows[0]["pan_alias"] == "CMSPARTNER-72345"
+    assert set(rows[0]) == set(EXPORT_FIELDS)
+
+
+def test_streamed_export_access_log_covers_the_body(client, caplog):
+    """Test que la ligne de log d'accès d'un export est écrite après le corps, avec son coût réel"""
+    async def setup():
+        async with TestSessionLocal() as session:
+            await seed(session)
+    asyncio.run(setup())
+    
+    with caplog.at_level(logging.INFO, logger="app.access"):
+        response = client.get("/api/v1/internal/operations/export", params={
+            "from": DAY.isoformat(),
+            "to": (DAY + timedelta(days=2)).isoformat()
+        })
+    
+    assert response.status_code == 200
+    access = [r for r in caplog.records if r.name == "app.access"][-1]
+    assert access.route == "/api/v1/internal/operations/export"
+    assert access.response_bytes == len(response.content)
+    # Les lignes sont lues pendant le streaming du corps
+    assert access.db_statements > 0
+
+
+def test_gzip_csv_export(client):
+    """Test de l'export CSV compressé : fichier gzip valide, en-tête puis lignes chronologiques"""
+    async def setup():
+        async with TestSessionLocal() as session:
+            await seed(session)
+    asyncio.run(setup())
+    
+    response = client.get("/api/v1/internal/operations/export", params={"format": "csv", "gzip": "true"})
+    
+    assert response.status_code == 200
+    assert 'filename="card_operations.csv.gz"' in response.headers["content-disposition"]
+    rows = list(csv.DictReader(io.StringIO(gzip.decompress(response.content).decode())))
+    assert [row["skaleet_webhook_id"] for row in rows] == [f"wh-{index}" for index in range(7)]
+
+
+async def test_export_is_emitted_batch_by_batch(db_session):
+    """Test du streaming : un morceau par paquet du curseur plutôt qu'un seul bloc"""
+    await seed(db_session)
+    
+    chunks = [
+        chunk
+        async for chunk in iter_export(db_session, export_query(), ExportFormat.NDJSON, batch_size=2)
+    ]
+    
+    assert [chunk.count(b"\n") for chunk in chunks] == [2, 2, 2, 1]
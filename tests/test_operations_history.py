@@ -0,0 +1,94 @@
+import asyncio
+import uuid
+from datetime import datetime, timedelta
+from app.domain.models import CardOperation
+from app.infra.repositories import CardRepository
+from app.utils.pagination import decode_cursor, encode_cursor
+from tests.conftest import TestSessionLocal
+
+START = datetime(2026, 10, 1, 12, 0)
+
+
+def seed_operations():
+    """5 opérations sur la carte 62345 (deux au même instant) et une sur une autre carte"""
+    async def seed():
+        async with TestSessionLocal() as session:
+            card = await CardRepository(session).get_or_create(62345)
+            other = await CardRepository(session).get_or_create(62346)
+            for index, minutes in enumerate((0, 1, 2, 2, 3)):
+                session.add(CardOperation(
+                    card_id=card.id,
+                    operation_type="card_blocking",
+                    source="SKA",
+                    status="SUCCESS",
+                    skaleet_webhook_id=f"wh-{index}",
+                    correlation_id="corr-1" if index < 3 else "corr-2",
+                    created_at=START + timedelta(minutes=minutes)
+                ))
+            session.add(CardOperation(
+                card_id=other.id,
+                operation_type="card_blocking",
+                source="SKA",
+                status="SUCCESS",
+                correlation_id="corr-1",
+                created_at=START + timedelta(minutes=10)
+            ))
+            await session.commit()
+    
+    asyncio.run(seed())
+
+
+def test_card_history_pages_with_stable_cursors(client):
+    """Test de la pagination keyset : pages sans doublon ni trou, plus récentes d'abord"""
+    seed_operations()
+    
+    seen = []
+    cursor = None
+    pages = 0
+    while True:
+        params = {"limit": 2, **({"cursor": cursor} if cursor else {})}
+        response = client.get("/api/v1/internal/cards/62345/operations", params=params)
+        assert response.status_code == 200
+        page = response.json()
+        seen.extend(page["items"])
+        pages += 1
+        cursor = page["nextCursor"]
+        if cursor is None:
+            break
+    
+    assert pages == 3
+    assert len({item["operationId"] for item in seen}) == 5
+    assert all(item["cardId"] == 62345 for item in seen)
+    keys = [(item["createdAt"], item["operationId"]) for item in seen]
+    assert keys == sorted(keys, reverse=True)
+
+
+def test_lookup_by_correlation_id_and_webhook_id(client):
+    """Test de la recherche par correlationId (toutes cartes) et par webhookId"""
+    seed_operations()
+    
+    by_correlation = client.get("/api/v1/internal/operations", params={"correlationId": "corr-1"}).json()
+    assert [item["cardId"] for item in by_correlation["items"]] == [62346, 62345, 62345, 62345]
+    assert by_correlation["nextCursor"] is None
+    
+    by_webhook = client.get("/api/v1/internal/operations", params={"webhookId": "wh-4"}).json()
+    assert [item["webhookId"] for item in by_webhook["items"]] == ["wh-4"]
+    
+    assert client.get("/api/v1/internal/operations").status_code == 422
+    assert client.get("/api/v1/internal/operations", params={"correlationId": "c", "webhookId": "w"}).status_code == 422
+
+
+def test_unknown_card_and_invalid_cursor(client):
+    """Test des erreurs : carte inconnue (404), curseur altéré (422)"""
+    seed_operations()
+    
+    assert client.get("/api/v1/internal/cards/99999/operations").status_code == 404
+    response = client.get("/api/v1/internal/cards/62345/operations", params={"cursor": "not-a-cursor"})
+    assert response.status_code == 422
+
+
+def test_cursor_round_trip():
+    """Test de l'encodage du curseur (created_at, id)"""
+    row_id = uuid.uuid4()
+    
+    assert decode_cursor(encode_cursor(START, row_id)) == (START, row_id)
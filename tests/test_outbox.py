@@ -0,0 +1,105 @@
+import httpx
+import pytest
+from datetime import datetime
+from sqlalchemy import select
+from app.domain.enums import OutboxStatus
+from app.domain.models import SkaleetResultOutbox
+from app.domain.outbox import OutboxDispatcher, compute_backoff, is_retryable
+from app.infra.repositories import OutboxRepository
+from tests.conftest import TestSessionLocal
+
+
+async def enqueue(session, card_id: int = 12345, result: str = "accept"):
+    OutboxRepository(session).enqueue(
+        None,
+        card_id,
+        "card_activation",
+        result,
+        visa_card_number="4532123456789012",
+        ni_details={"niCardId": f"NI-{card_id}"}
+    )
+    await session.commit()
+
+
+async def load_messages(session):
+    session.expire_all()
+    result = await session.execute(select(SkaleetResultOutbox))
+    return list(result.scalars().all())
+
+
+async def test_dispatcher_delivers_pending_messages(db_session):
+    """Test que les messages PENDING sont livrés puis marqués DELIVERED"""
+    await enqueue(db_session, 12345)
+    await enqueue(db_session, 12346, "error")
+    sent = []
+    
+    async def sender(card_id, operation_type, result, visa_card_number=None, ni_details=None):
+        sent.append((card_id, operation_type, result, visa_card_number))
+    
+    dispatcher = OutboxDispatcher(TestSessionLocal, sender=sender, workers=0)
+    assert await dispatcher.run_once() == 2
+    assert await dispatcher.run_once() == 0
+    
+    assert sorted(sent) == [
+        (12345, "card_activation", "accept", "4532123456789012"),
+        (12346, "card_activation", "error", "4532123456789012"),
+    ]
+    messages = await load_messages(db_session)
+    assert {m.status for m in messages} == {OutboxStatus.DELIVERED.value}
+    assert all(m.attempts == 1 and m.delivered_at for m in messages)
+
+
+async def test_failed_delivery_is_rescheduled_with_backoff(db_session):
+    """Test qu'un échec transitoire repousse le message sans le perdre"""
+    await enqueue(db_session)
+    
+    async def sender(*args, **kwargs):
+        raise httpx.ConnectError("connection refused")
+    
+    dispatcher = OutboxDispatcher(TestSessionLocal, sender=sender, workers=0)
+    await dispatcher.run_once()
+    
+    [message] = await load_messages(db_session)
+    assert message.status == OutboxStatus.PENDING.value
+    assert message.attempts == 1
+    assert message.next_attempt_at > datetime.utcnow()
+    assert "connection refused" in message.last_error
+    # Le message n'est pas repris avant son prochain essai
+    assert await dispatcher.run_once() == 0
+
+
+async def test_message_goes_to_dead_letter_after_max_attempts(db_session, monkeypatch):
+    """Test qu'un message passe en DEAD après le nombre maximal d'essais"""
+    monkeypatch.setattr("app.domain.outbox.settings.outbox_max_attempts", 1)
+    await enqueue(db_session)
+    
+    async def sender(*args, **kwargs):
+        raise httpx.ConnectError("connection refused")
+    
+    await OutboxDispatcher(TestSessionLocal, sender=sender, workers=0).run_once()
+    
+    [message] = await load_messages(db_session)
+    assert message.status == OutboxStatus.DEAD.value
+
+
+def test_client_errors_are_not_retried():
+    """Test que les 4xx définitifs ne sont pas réessayés, contrairement aux 5xx et 429"""
+    request = httpx.Request("POST", "http://skaleet/cards/1/operation/card_activation/accept")
+    
+    def status_error(status_code: int) -> httpx.HTTPStatusError:
+        response = httpx.Response(status_code, request=request)
+        return httpx.HTTPStatusError("error", request=request, response=response)
+    
+    assert is_retryable(status_error(503))
+    assert is_retryable(status_error(429))
+    assert not is_retryable(status_error(404))
+
+
+def test_backoff_is_capped_and_jittered(monkeypatch):
+    """Test que le backoff croît exponentiellement et reste plafonné"""
+    monkeypatch.setattr("app.domain.outbox.settings.outbox_backoff_base", 2.0)
+    monkeypatch.setattr("app.domain.outbox.settings.outbox_backoff_max", 60.0)
+    
+    assert 1.0 <= compute_backoff(1) <= 2.0
+    assert 8.0 <= compute_backoff(4) <= 16.0
+    assert 30.0 <= compute_backoff(20) <= 60.0
@@ -0,0 +1,30 @@
+from datetime import datetime
+from app.jobs.partitions import _covers, _parse_bound, add_months, maintain_partitions, month_start, partition_name
+from tests.conftest import test_engine
+
+
+def test_month_arithmetic_and_partition_names():
+    """Test du calcul des mois (changement d'année) et des noms de partitions"""
+    month = month_start(datetime(2026, 11, 17, 8, 30))
+    
+    assert month == datetime(2026, 11, 1)
+    assert add_months(month, 2) == datetime(2027, 1, 1)
+    assert add_months(month, -11) == datetime(2025, 12, 1)
+    assert partition_name(add_months(month, 2)) == "card_operations_2027_01"
+
+
+def test_partition_bounds_cover_months():
+    """Test de la lecture des bornes PostgreSQL, y compris la partition historique (MINVALUE)"""
+    partitions = [
+        ("card_operations_legacy", _parse_bound("MINVALUE"), _parse_bound("'2026-11-01 00:00:00'")),
+        ("card_operations_2026_11", datetime(2026, 11, 1), datetime(2026, 12, 1)),
+    ]
+    
+    assert _covers(partitions, datetime(2024, 3, 1))
+    assert _covers(partitions, datetime(2026, 11, 1))
+    assert not _covers(partitions, datetime(2026, 12, 1))
+
+
+async def test_maintenance_is_a_no_op_outside_postgresql():
+    """Test que la maintenance ne fait rien sur SQLite (tests)"""
+    assert await maintain_partitions(test_engine) == {"created": [], "detached": []}
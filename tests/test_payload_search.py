@@ -0,0 +1,42 @@
+import pytest
+from sqlalchemy import select
+from sqlalchemy.dialects import postgresql
+from sqlalchemy.schema import CreateIndex
+from app.domain.models import CardOperation, WebhookEvent
+from app.infra.db import json_path_text
+from app.infra.repositories import CardOperationRepository, CardRepository, OutboxRepository, WebhookRepository
+
+
+def test_query_and_index_use_the_same_postgresql_expression():
+    """Test que la requête produit l'expression de l'index, condition pour que le planner l'utilise"""
+    index = next(i for i in CardOperation.__table__.indexes if i.name == "idx_card_operations_webhook_pan_alias")
+    query = select(CardOperation.id).where(json_path_text(CardOperation.raw_webhook, "data", "panAlias") == "x")
+    
+    expression = "((raw_webhook -> 'data') ->> 'panAlias')"
+    assert expression in str(CreateIndex(index).compile(dialect=postgresql.dialect()))
+    assert "((card_operations.raw_webhook -> 'data') ->> 'panAlias')" in str(query.compile(dialect=postgresql.dialect()))
+    with pytest.raises(ValueError):
+        json_path_text(CardOperation.raw_webhook, "data'; --")
+
+
+async def test_indexed_payload_lookups(db_session):
+    """Test des recherches support par panAlias, accountId, niCardId et contenu du payload"""
+    card = await CardRepository(db_session).get_or_create(42345)
+    operations = CardOperationRepository(db_session)
+    operation = await operations.create(
+        card.id,
+        "card_blocking",
+        "SKA",
+        "SUCCESS",
+        raw_webhook={"data": {"cardId": 42345, "panAlias": "CMSPARTNER-42345", "accountId": "ACC-042"}}
+    )
+    OutboxRepository(db_session).enqueue(operation.id, 42345, "card_blocking", "accept", ni_details={"niCardId": "NI-42345"})
+    db_session.add(WebhookEvent(id="evt-1", event_type="card.created", payload={"accountId": "ACC-042"}))
+    await db_session.commit()
+    
+    assert [o.id for o in await operations.find_by_webhook_field("panAlias", "CMSPARTNER-42345")] == [operation.id]
+    assert [o.id for o in await operations.find_by_webhook_field("accountId", "ACC-042")] == [operation.id]
+    assert [o.id for o in await operations.find_by_ni_card_id("NI-42345")] == [operation.id]
+    assert [e.id for e in await WebhookRepository(db_session).find_events_by_payload({"accountId": "ACC-042"})] == ["evt-1"]
+    with pytest.raises(ValueError):
+        await operations.find_by_webhook_field("cardType", "VIRTUAL")
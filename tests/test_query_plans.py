@@ -0,0 +1,595 @@
+import inspect
+import json
+import os
+import uuid
+from contextlib import contextmanager
+from datetime import datetime, timedelta
+from pathlib import Path
+import pytest
+from sqlalchemy import event, insert, text
+from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
+from app.domain.models import (
+    BulkOperationItem,
+    BulkOperationJob,
+    Card,
+    CardOperation,
+    SkaleetResultOutbox,
+    WebhookClaim,
+    WebhookEvent,
+    WebhookJob
+)
+from app.infra import repositories
+from app.infra.card_cache import card_cache
+from app.infra.db import Base, DeadlineAwareSession
+from app.jobs.partitions import ensure_partitions
+from app.schemas.webhook import SkaleetWebhook, WebhookRequest
+from app.utils import idempotency
+from tests.conftest import test_engine
+
+# Non-régression des plans d'exécution : chaque requête émise par les
+# repositories et par app/utils/idempotency.py est rejouée sous EXPLAIN sur un
+# jeu de données volumineux. Un parcours complet d'une grande table échoue, tout
+# comme (PostgreSQL) un coût supérieur au seuil enregistré.
+#   - SQLite (toujours) : EXPLAIN QUERY PLAN
+#   - PostgreSQL : QUERY_PLAN_DATABASE_URL=postgresql+asyncpg://... (base dédiée :
+#     les tables y sont recréées), QUERY_PLAN_RECORD=1 pour enregistrer les coûts
+
+LARGE_TABLES = (
+    "cards",
+    "card_operations",
+    "webhook_claims",
+    "webhook_events",
+    "skaleet_result_outbox",
+    "bulk_operation_items",
+    "webhook_jobs",
+)
+
+# Parcours complets acceptés, par dialecte et par requête, avec leur raison
+ALLOWED_SCANS = {
+    # Sous SQLite le critère passe par json_extract, sans index ; sous
+    # PostgreSQL l'inclusion JSONB est servie par l'index GIN
+    "sqlite": {"WebhookRepository.find_events_by_payload": {"webhook_events"}},
+    "postgresql": {},
+}
+
+COSTS_FILE = Path(__file__).with_name("query_plan_costs.json")
+# Marge tolérée au-dessus du coût enregistré (variations des statistiques)
+COST_TOLERANCE = 1.5
+
+ROWS = int(os.environ.get("QUERY_PLAN_ROWS", "2000"))
+NOW = datetime.utcnow().replace(microsecond=0)
+START = NOW - timedelta(days=60)
+
+CASES = {}
+
+
+def plan_case(target: str):
+    """Déclare le scénario qui exerce les requêtes de `target` (Classe.méthode ou idempotency.fonction)"""
+    def register(function):
+        CASES[target] = function
+        return function
+    return register
+
+
+def query_targets() -> set:
+    """Méthodes des repositories et fonctions d'idempotence qui interrogent la base"""
+    targets = {
+        f"idempotency.{name}"
+        for name, function in vars(idempotency).items()
+        if inspect.iscoroutinefunction(function) and function.__module__ == idempotency.__name__
+    }
+    for name, cls in vars(repositories).items():
+        if inspect.isclass(cls) and cls.__module__ == repositories.__name__ and name.endswith("Repository"):
+            targets |= {
+                f"{name}.{method}"
+                for method, function in vars(cls).items()
+                if inspect.iscoroutinefunction(function) and not method.startswith("_")
+            }
+    return targets
+
+
+class StatementRecorder:
+    """Requêtes (SQL, paramètres) envoyées au driver pendant capture()"""
+    
+    def __init__(self, engine):
+        self.engine = engine
+        self.statements = None
+        event.listen(engine.sync_engine, "before_cursor_execute", self._record)
+    
+    def _record(self, conn, cursor, statement, parameters, context, executemany):
+        if self.statements is None:
+            return
+        if statement.lstrip().split(None, 1)[0].upper() not in ("SELECT", "INSERT", "UPDATE", "DELETE", "WITH"):
+            return
+        # executemany : le plan est le même pour chaque jeu de paramètres
+        self.statements.append((statement, parameters[0] if executemany else parameters))
+    
+    @contextmanager
+    def capture(self):
+        self.statements = []
+        try:
+            yield self.statements
+        finally:
+            self.statements = None
+    
+    def close(self):
+        event.remove(self.engine.sync_engine, "before_cursor_execute", self._record)
+
+
+def _large_table(relation: str):
+    for table in LARGE_TABLES:
+        # Les partitions de card_operations sont nommées card_operations_<mois>
+        if relation == table or relation.startswith(f"{table}_"):
+            return table
+    return None
+
+
+# Index partiels : les parcourir ne lit que les lignes de leur prédicat
+PARTIAL_INDEXES = {
+    index.name
+    for table in Base.metadata.tables.values()
+    for index in table.indexes
+    if index.dialect_options["sqlite"].get("where") is not None
+}
+
+
+def sqlite_full_scans(plan_rows) -> set:
+    """Grandes tables parcourues entièrement (SCAN, avec ou sans index non partiel) d'un EXPLAIN QUERY PLAN"""
+    scans = set()
+    for row in plan_rows:
+        words = row[-1].split()
+        if len(words) < 2 or words[0] != "SCAN" or not _large_table(words[1]):
+            continue
+        if words[-1] in PARTIAL_INDEXES and "INDEX" in words:
+            continue
+        scans.add(_large_table(words[1]))
+    return scans
+
+
+def postgresql_plan_summary(plan) -> tuple:
+    """(grandes tables en Seq Scan, coût total) d'un EXPLAIN (FORMAT JSON)"""
+    if isinstance(plan, str):
+        plan = json.loads(plan)
+    root = plan[0]["Plan"]
+    scans = set()
+    nodes = [root]
+    while nodes:
+        node = nodes.pop()
+        nodes.extend(node.get("Plans", []))
+        if node["Node Type"] == "Seq Scan" and _large_table(node.get("Relation Name", "")):
+            scans.add(_large_table(node["Relation Name"]))
+    return scans, root["Total Cost"]
+
+
+async def explain(connection, statement: str, parameters) -> tuple:
+    if connection.dialect.name == "postgresql":
+        result = await connection.exec_driver_sql(f"EXPLAIN (FORMAT JSON) {statement}", parameters)
+        return postgresql_plan_summary(result.scalar())
+    result = await connection.exec_driver_sql(f"EXPLAIN QUERY PLAN {statement}", parameters)
+    return sqlite_full_scans(result.all()), None
+
+
+async def _insert_rows(session, model, rows, chunk: int = 1000):
+    for offset in range(0, len(rows), chunk):
+        await session.execute(insert(model), rows[offset:offset + chunk])
+
+
+async def seed(session_factory, rows: int = ROWS) -> dict:
+    """Jeu de données : `rows` opérations sur 60 jours, réparties sur rows/10 cartes"""
+    step = timedelta(days=60) / rows
+    cards = [
+        {
+            "id": uuid.uuid4(),
+            "skaleet_card_id": 100000 + index,
+            "pan_alias": f"CMSPARTNER-{100000 + index}",
+            "status_skaleet": "ACTIVE",
+            "created_at": START,
+            "updated_at": START,
+        }
+        for index in range(max(rows // 10, 1))
+    ]
+    operations = []
+    for index in range(rows):
+        card = cards[index % len(cards)]
+        operations.append({
+            "id": uuid.uuid4(),
+            "card_id": card["id"],
+            "operation_type": "card_blocking" if index % 2 else "card_unblocking",
+            "source": "SKA",
+            "status": "SUCCESS",
+            "skaleet_event": "card.blocked",
+            "skaleet_event_id": f"evt-{index}",
+            "skaleet_webhook_id": f"wh-{index}",
+            "correlation_id": f"corr-{index // 10}",
+            "raw_webhook": {"data": {
+                "cardId": card["skaleet_card_id"],
+                "panAlias": card["pan_alias"],
+                "accountId": f"ACC-{index % 1000}",
+            }},
+            "created_at": START + step * index,
+        })
+    jobs = [{"id": uuid.uuid4(), "status": "RUNNING", "total_items": 0} for _ in range(10)]
+    
+    async with session_factory() as session:
+        await _insert_rows(session, Card, cards)
+        await _insert_rows(session, CardOperation, operations)
+        await _insert_rows(session, WebhookClaim, [
+            {
+                "skaleet_webhook_id": operation["skaleet_webhook_id"],
+                "card_operation_id": operation["id"],
+                "created_at": operation["created_at"],
+            }
+            for operation in operations
+        ])
+        await _insert_rows(session, WebhookEvent, [
+            {
+                "id": operation["skaleet_event_id"],
+                "event_type": "card.blocked",
+                "processed": True,
+                "payload": {"accountId": operation["raw_webhook"]["data"]["accountId"]},
+                "created_at": operation["created_at"],
+            }
+            for operation in operations[::2]
+        ])
+        await _insert_rows(session, SkaleetResultOutbox, [
+            {
+                "id": uuid.uuid4(),
+                "card_operation_id": operation["id"],
+                "skaleet_card_id": 100000 + index % len(cards),
+                "operation_type": operation["operation_type"],
+                "result": "accept",
+                "payload": {"visa_card_number": None, "ni_details": {"niCardId": f"NI-{index}"}},
+                # 5 % restent à livrer
+                "status": "PENDING" if index % 20 == 0 else "DELIVERED",
+                "next_attempt_at": operation["created_at"],
+                "created_at": operation["created_at"],
+            }
+            for index, operation in enumerate(operations[::2])
+        ])
+        await _insert_rows(session, BulkOperationJob, jobs)
+        await _insert_rows(session, BulkOperationItem, [
+            {
+                "id": uuid.uuid4(),
+                "job_id": jobs[index % len(jobs)]["id"],
+                "position": index // len(jobs) + 1,
+                "skaleet_card_id": 100000 + index % len(cards),
+                "operation_type": "card_blocking",
+                "status": "PENDING" if index % 20 == 0 else "SUCCESS",
+            }
+            for index in range(rows // 2)
+        ])
+        await _insert_rows(session, WebhookJob, [
+            {
+                "id": uuid.uuid4(),
+                "skaleet_webhook_id": operation["skaleet_webhook_id"],
+                "skaleet_card_id": operation["raw_webhook"]["data"]["cardId"],
+                "event": "card.status.block_requested",
+                "payload": {"webhookId": operation["skaleet_webhook_id"]},
+                # 5 % restent à traiter
+                "status": "PENDING" if index % 20 == 0 else "DONE",
+                "attempts": 1,
+                "next_attempt_at": operation["created_at"],
+                "created_at": operation["created_at"],
+            }
+            for index, operation in enumerate(operations)
+        ])
+        await session.commit()
+    
+    return {"cards": cards, "operations": operations, "jobs": jobs}
+
+
+@pytest.fixture(params=["sqlite", "postgresql"])
+async def plan_engine(request):
+    """Moteur sur lequel les plans sont vérifiés, tables créées puis supprimées"""
+    if request.param == "sqlite":
+        engine = test_engine
+    else:
+        url = os.environ.get("QUERY_PLAN_DATABASE_URL")
+        if not url:
+            pytest.skip("QUERY_PLAN_DATABASE_URL non défini")
+        engine = create_async_engine(url)
+    
+    async with engine.begin() as conn:
+        await conn.run_sync(Base.metadata.drop_all)
+        await conn.run_sync(Base.metadata.create_all)
+    if engine.dialect.name == "postgresql":
+        # Partitions mensuelles des données générées et du mois courant
+        await ensure_partitions(engine, months_ahead=3, now=START)
+    card_cache.clear()
+    
+    yield engine
+    
+    async with engine.begin() as conn:
+        await conn.run_sync(Base.metadata.drop_all)
+    if engine is not test_engine:
+        await engine.dispose()
+
+
+# --- Scénarios : un par méthode de repository / fonction d'idempotence ---
+
+
+@plan_case("WebhookRepository.create_event")
+async def _(session, data):
+    webhook = WebhookRequest(id="evt-new", event_type="card.blocked", timestamp=NOW, data={"cardId": 1})
+    await repositories.WebhookRepository(session).create_event(webhook, "corr-new")
+
+
+@plan_case("WebhookRepository.get_event")
+async def _(session, data):
+    await repositories.WebhookRepository(session).get_event("evt-42")
+
+
+@plan_case("WebhookRepository.mark_as_processed")
+async def _(session, data):
+    await repositories.WebhookRepository(session).mark_as_processed("evt-42", {"result": "accept"})
+    await session.flush()
+
+
+@plan_case("WebhookRepository.find_events_by_payload")
+async def _(session, data):
+    await repositories.WebhookRepository(session).find_events_by_payload({"accountId": "ACC-42"})
+
+
+@plan_case("CardRepository.get_by_skaleet_id")
+async def _(session, data):
+    await repositories.CardRepository(session).get_by_skaleet_id(data["cards"][7]["skaleet_card_id"])
+
+
+@plan_case("CardRepository.create")
+async def _(session, data):
+    await repositories.CardRepository(session).create(9000001)
+
+
+@plan_case("CardRepository.get_or_create")
+async def _(session, data):
+    await repositories.CardRepository(session).get_or_create(data["cards"][7]["skaleet_card_id"])
+
+
+@plan_case("CardRepository.resolve")
+async def _(session, data):
+    card_cache.clear()
+    await repositories.CardRepository(session).resolve(data["cards"][8]["skaleet_card_id"])
+
+
+@plan_case("CardRepository.update_status_ni")
+async def _(session, data):
+    await repositories.CardRepository(session).update_status_ni(data["cards"][7]["id"], "ACTIVE", "4111")
+
+
+@plan_case("CardOperationRepository.create")
+async def _(session, data):
+    await repositories.CardOperationRepository(session).create(data["cards"][7]["id"], "card_blocking", "SKA", "PENDING")
+
+
+@plan_case("CardOperationRepository.update_status")
+async def _(session, data):
+    await repositories.CardOperationRepository(session).update_status(data["operations"][42]["id"], "SUCCESS", "00")
+
+
+@plan_case("CardOperationRepository.find_by_webhook_field")
+async def _(session, data):
+    operations = repositories.CardOperationRepository(session)
+    await operations.find_by_webhook_field("panAlias", data["cards"][7]["pan_alias"])
+    await operations.find_by_webhook_field("accountId", "ACC-42")
+
+
+@plan_case("CardOperationRepository.find_by_ni_card_id")
+async def _(session, data):
+    await repositories.CardOperationRepository(session).find_by_ni_card_id("NI-42")
+
+
+@plan_case("CardOperationRepository.list_by_card")
+async def _(session, data):
+    operation = data["operations"][-1]
+    operations = repositories.CardOperationRepository(session)
+    await operations.list_by_card(operation["card_id"], limit=20)
+    await operations.list_by_card(operation["card_id"], after=(operation["created_at"], operation["id"]), limit=20)
+
+
+@plan_case("CardOperationRepository.list_by_correlation_id")
+async def _(session, data):
+    await repositories.CardOperationRepository(session).list_by_correlation_id("corr-42")
+
+
+@plan_case("CardOperationRepository.list_by_webhook_id")
+async def _(session, data):
+    await repositories.CardOperationRepository(session).list_by_webhook_id("wh-42")
+
+
+@plan_case("CardOperationRepository.get_by_webhook_id")
+async def _(session, data):
+    await repositories.CardOperationRepository(session).get_by_webhook_id("wh-43", "card_blocking")
+
+
+@plan_case("OutboxRepository.claim_due_batch")
+async def _(session, data):
+    await repositories.OutboxRepository(session).claim_due_batch(limit=50, lease_seconds=30)
+
+
+@plan_case("OutboxRepository.mark_delivered")
+async def _(session, data):
+    outbox = repositories.OutboxRepository(session)
+    message = outbox.enqueue(data["operations"][42]["id"], 100042, "card_blocking", "accept")
+    await session.flush()
+    await outbox.mark_delivered([message.id])
+
+
+@plan_case("OutboxRepository.mark_failed")
+async def _(session, data):
+    outbox = repositories.OutboxRepository(session)
+    message = outbox.enqueue(data["operations"][42]["id"], 100042, "card_blocking", "accept")
+    await session.flush()
+    await outbox.mark_failed(message.id, "timeout", NOW + timedelta(seconds=30))
+
+
+def _skaleet_webhook(webhook_id: str) -> SkaleetWebhook:
+    return SkaleetWebhook.model_validate({
+        "id": "1",
+        "webhookId": webhook_id,
+        "type": "card",
+        "event": "card.status.block_requested",
+        "data": {"cardId": 100007, "panAlias": "CMSPARTNER-100007"},
+    })
+
+
+@plan_case("WebhookJobRepository.enqueue")
+async def _(session, data):
+    jobs = repositories.WebhookJobRepository(session)
+    await jobs.enqueue(_skaleet_webhook("wh-new"), "corr-new")
+    # Doublon : ON CONFLICT sur l'index unique du webhookId
+    await jobs.enqueue(_skaleet_webhook("wh-42"), "corr-new")
+
+
+@plan_case("WebhookJobRepository.claim_due_batch")
+async def _(session, data):
+    await repositories.WebhookJobRepository(session).claim_due_batch(limit=10, lease_seconds=120)
+
+
+@plan_case("WebhookJobRepository.mark_done")
+async def _(session, data):
+    jobs = repositories.WebhookJobRepository(session)
+    await jobs.enqueue(_skaleet_webhook("wh-new"), "corr-new")
+    [job] = await jobs.claim_due_batch(limit=1, lease_seconds=120)
+    await jobs.mark_done([job.id])
+
+
+@plan_case("WebhookJobRepository.mark_failed")
+async def _(session, data):
+    jobs = repositories.WebhookJobRepository(session)
+    await jobs.enqueue(_skaleet_webhook("wh-new"), "corr-new")
+    [job] = await jobs.claim_due_batch(limit=1, lease_seconds=120)
+    await jobs.mark_failed(job.id, "timeout", NOW + timedelta(seconds=30))
+
+
+@plan_case("BulkOperationRepository.add_items")
+async def _(session, data):
+    item = {"position": 100000, "skaleet_card_id": 100007, "pan_alias": None, "operation_type": "card_blocking"}
+    await repositories.BulkOperationRepository(session).add_items(data["jobs"][0]["id"], [item])
+
+
+@plan_case("BulkOperationRepository.get_job")
+async def _(session, data):
+    await repositories.BulkOperationRepository(session).get_job(data["jobs"][0]["id"])
+
+
+@plan_case("BulkOperationRepository.list_items")
+async def _(session, data):
+    bulk = repositories.BulkOperationRepository(session)
+    await bulk.list_items(data["jobs"][0]["id"], after_position=10, limit=20)
+    await bulk.list_items(data["jobs"][0]["id"], status="PENDING", limit=20)
+
+
+@plan_case("BulkOperationRepository.claim_pending_items")
+async def _(session, data):
+    await repositories.BulkOperationRepository(session).claim_pending_items(limit=50, lease_seconds=30)
+
+
+@plan_case("BulkOperationRepository.get_operations_by_webhook_ids")
+async def _(session, data):
+    await repositories.BulkOperationRepository(session).get_operations_by_webhook_ids([f"wh-{index}" for index in range(40, 60)])
+
+
+@plan_case("BulkOperationRepository.record_results")
+async def _(session, data):
+    job_id = data["jobs"][0]["id"]
+    item = (await repositories.BulkOperationRepository(session).list_items(job_id, status="PENDING", limit=1))[0]
+    await repositories.BulkOperationRepository(session).record_results([
+        {"id": item.id, "job_id": job_id, "status": "SUCCESS", "card_operation_id": data["operations"][42]["id"]}
+    ])
+
+
+@plan_case("idempotency.check_idempotency")
+async def _(session, data):
+    await idempotency.check_idempotency("evt-42", "corr-42", session)
+
+
+@plan_case("idempotency.check_card_operation_idempotency")
+async def _(session, data):
+    await idempotency.check_card_operation_idempotency("wh-43", "card_blocking", session)
+
+
+@plan_case("idempotency.is_webhook_processed")
+async def _(session, data):
+    await idempotency.is_webhook_processed(session, "wh-42")
+
+
+@plan_case("idempotency.find_claimed_operation")
+async def _(session, data):
+    assert await idempotency.find_claimed_operation(session, "wh-42") is not None
+
+
+@plan_case("idempotency.mark_webhook_started")
+async def _(session, data):
+    await idempotency.mark_webhook_started(session, "wh-new", data["cards"][7]["id"], "card_blocking", "card.blocked", "evt-new")
+
+
+@plan_case("idempotency.mark_webhook_finished")
+async def _(session, data):
+    operation = data["operations"][42]
+    await idempotency.mark_webhook_finished(session, operation["id"], "SUCCESS", "00", created_at=operation["created_at"])
+
+
+def test_every_repository_query_has_a_plan_case():
+    """Test qu'une nouvelle méthode de repository ou d'idempotence ne peut pas échapper à la vérification des plans"""
+    assert set(CASES) == query_targets()
+
+
+def test_plan_analysis_detects_full_scans():
+    """Test de la lecture des plans SQLite et PostgreSQL (parcours complets, partitions, coût)"""
+    assert sqlite_full_scans([(2, 0, 0, "SCAN card_operations USING INDEX idx_created_at")]) == {"card_operations"}
+    assert sqlite_full_scans([
+        (2, 0, 0, "SEARCH card_operations USING INDEX idx_correlation_id (correlation_id=?)"),
+        (9, 0, 0, "SCAN bulk_operation_jobs"),
+        (10, 0, 0, "SCAN bulk_operation_items USING INDEX idx_bulk_items_pending_position"),
+        (12, 0, 0, "USE TEMP B-TREE FOR ORDER BY"),
+    ]) == set()
+    
+    plan = json.dumps([{"Plan": {
+        "Node Type": "Limit",
+        "Total Cost": 1250.5,
+        "Plans": [{"Node Type": "Append", "Plans": [
+            {"Node Type": "Index Scan", "Relation Name": "card_operations_2026_09"},
+            {"Node Type": "Seq Scan", "Relation Name": "card_operations_2026_10"},
+        ]}],
+    }}])
+    assert postgresql_plan_summary(plan) == ({"card_operations"}, 1250.5)
+
+
+async def test_repository_queries_avoid_full_scans(plan_engine):
+    """Test des plans de toutes les requêtes des repositories sur un jeu de données volumineux"""
+    session_factory = async_sessionmaker(plan_engine, class_=DeadlineAwareSession, expire_on_commit=False)
+    data = await seed(session_factory)
+    async with plan_engine.begin() as connection:
+        await connection.execute(text("ANALYZE"))
+    
+    dialect = plan_engine.dialect.name
+    recorded = json.loads(COSTS_FILE.read_text()) if COSTS_FILE.exists() else {}
+    costs = {}
+    failures = []
+    recorder = StatementRecorder(plan_engine)
+    try:
+        for target, case in sorted(CASES.items()):
+            async with session_factory() as session:
+                with recorder.capture() as statements:
+                    await case(session, data)
+                await session.rollback()
+            assert statements, f"{target}: no statement captured"
+            
+            async with plan_engine.connect() as connection:
+                for statement, parameters in statements:
+                    scans, cost = await explain(connection, statement, parameters)
+                    allowed = ALLOWED_SCANS[dialect].get(target, set())
+                    if scans - allowed:
+                        failures.append(f"{target}: full scan of {', '.join(sorted(scans - allowed))}\n  {statement}")
+                    if cost is not None:
+                        costs[target] = max(costs.get(target, 0), cost)
+            
+            threshold = recorded.get(target)
+            if threshold is not None and costs.get(target, 0) > threshold * COST_TOLERANCE:
+                failures.append(f"{target}: cost {costs[target]:.1f} above recorded {threshold:.1f}")
+    finally:
+        recorder.close()
+    
+    if costs and os.environ.get("QUERY_PLAN_RECORD") == "1":
+        COSTS_FILE.write_text(json.dumps(dict(sorted(costs.items())), indent=2) + "\n")
+    assert not failures, "\n".join(failures)
@@ -0,0 +1,61 @@
+import asyncio
+from app.infra import db
+from app.infra.db import ReplicaLagGuard, read_session_factory
+from tests.conftest import TestSessionLocal, test_engine
+
+
+class FakeLagGuard(ReplicaLagGuard):
+    """Retard simulé (la base de test SQLite n'a pas de réplication)"""
+    
+    def __init__(self, lags, **kwargs):
+        super().__init__(test_engine, **kwargs)
+        self.lags = list(lags)
+        self.checks = 0
+    
+    async def _query_lag(self) -> float:
+        self.checks += 1
+        lag = self.lags.pop(0)
+        if lag == "hang":
+            await asyncio.sleep(1)
+        return lag
+
+
+async def test_lag_guard_falls_back_to_primary_when_replica_lags():
+    """Test du garde-fou : réplica utilisé sous max_lag, primaire au-delà ou si le réplica ne répond pas"""
+    guard = FakeLagGuard([0.5, 12.0, "hang"], max_lag=5.0, check_interval=0, check_timeout=0.05)
+    
+    assert await guard.available() is True
+    assert await guard.available() is False
+    assert await guard.available() is False
+    assert guard.lag is None
+    assert guard.fallbacks == 2
+    assert "db_replica_lag_seconds -1.000" in guard.render()
+    assert "db_replica_fallbacks_total 2" in guard.render()
+
+
+async def test_lag_is_measured_at_most_once_per_interval():
+    """Test que le retard n'est pas mesuré à chaque requête"""
+    guard = FakeLagGuard([0.0], max_lag=5.0, check_interval=60)
+    
+    results = await asyncio.gather(*(guard.available() for _ in range(10)))
+    
+    assert all(results)
+    assert guard.checks == 1
+
+
+async def test_real_lag_query_on_non_postgresql_replica():
+    """Test qu'un réplica non PostgreSQL (tests) est considéré à jour"""
+    assert await ReplicaLagGuard(test_engine, max_lag=1.0, check_interval=0).available() is True
+    assert await ReplicaLagGuard(None).available() is False
+
+
+async def test_read_sessions_routed_to_replica_or_primary(monkeypatch):
+    """Test du routage des lectures : primaire sans réplica, réplica s'il est à jour, sinon primaire"""
+    assert await read_session_factory() is db.AsyncSessionLocal
+    
+    guard = FakeLagGuard([1.0, 30.0], max_lag=5.0, check_interval=0)
+    monkeypatch.setattr(db, "ReplicaSessionLocal", TestSessionLocal)
+    monkeypatch.setattr(db, "replica_guard", guard)
+    
+    assert await read_session_factory() is TestSessionLocal
+    assert await read_session_factory() is db.AsyncSessionLocal
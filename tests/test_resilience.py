@@ -0,0 +1,197 @@
+import asyncio
+import httpx
+import pytest
+from app.infra.ni_client import NIClient
+from app.infra.resilience import (
+    AdaptiveConcurrencyLimiter,
+    CircuitBreaker,
+    CircuitOpenError,
+    ConcurrencyLimitExceeded,
+    get_guard,
+    reset_guards,
+)
+
+
+@pytest.fixture(autouse=True)
+def clean_guards():
+    reset_guards()
+    yield
+    reset_guards()
+
+
+def make_breaker(**overrides) -> CircuitBreaker:
+    params = dict(
+        window_size=10,
+        min_calls=4,
+        failure_rate_threshold=0.5,
+        slow_call_threshold=1.0,
+        slow_call_rate_threshold=0.5,
+        open_duration=30.0,
+        half_open_max_calls=1,
+    )
+    params.update(overrides)
+    return CircuitBreaker(**params)
+
+
+def test_breaker_opens_on_error_rate():
+    """Test que le breaker s'ouvre quand le taux d'erreurs dépasse le seuil"""
+    breaker = make_breaker()
+    for ok in (True, False, True, False):
+        breaker.before_call()
+        breaker.record(0.01, ok)
+    
+    assert breaker.state == CircuitBreaker.OPEN
+    with pytest.raises(CircuitOpenError):
+        breaker.before_call()
+
+
+def test_breaker_opens_on_slow_calls():
+    """Test que le breaker s'ouvre quand trop d'appels sont lents"""
+    breaker = make_breaker()
+    for _ in range(4):
+        breaker.before_call()
+        breaker.record(2.0, True)
+    
+    assert breaker.state == CircuitBreaker.OPEN
+
+
+def test_breaker_half_open_trial_closes_circuit():
+    """Test qu'après open_duration un appel d'essai réussi referme le circuit"""
+    breaker = make_breaker(open_duration=0.0)
+    for _ in range(4):
+        breaker.before_call()
+        breaker.record(0.01, False)
+    assert breaker.state == CircuitBreaker.OPEN
+    
+    breaker.before_call()
+    assert breaker.state == CircuitBreaker.HALF_OPEN
+    # Un seul appel d'essai autorisé à la fois
+    with pytest.raises(CircuitOpenError):
+        breaker.before_call()
+    
+    breaker.record(0.01, True)
+    assert breaker.state == CircuitBreaker.CLOSED
+
+
+def test_limiter_is_aimd():
+    """Test que la limite diminue sur latence élevée et remonte progressivement"""
+    limiter = AdaptiveConcurrencyLimiter(
+        initial_limit=10, min_limit=2, max_limit=20, latency_target=0.5, decrease_factor=0.5
+    )
+    limiter.record(1.0, True)
+    assert limiter.limit == 5
+    limiter.record(1.0, True)
+    limiter.record(1.0, True)
+    assert limiter.limit == 2
+    
+    for _ in range(10):
+        limiter.record(0.1, True)
+    assert limiter.limit > 2
+
+
+async def test_limiter_queues_and_times_out():
+    """Test que les appels au-delà de la limite attendent puis échouent rapidement"""
+    limiter = AdaptiveConcurrencyLimiter(
+        initial_limit=1, min_limit=1, max_limit=1, latency_target=1.0, decrease_factor=0.5
+    )
+    await limiter.acquire(timeout=0.1)
+    with pytest.raises(ConcurrencyLimitExceeded):
+        await limiter.acquire(timeout=0.05)
+    
+    waiter = asyncio.create_task(limiter.acquire(timeout=1.0))
+    await asyncio.sleep(0)
+    limiter.release()
+    await waiter
+    assert limiter.in_flight == 1
+
+
+async def test_cancelled_waiter_does_not_leak_a_slot(monkeypatch):
+    """Test qu'une attente annulée (ex: deadline) ne garde pas de place, même attribuée"""
+    limiter = AdaptiveConcurrencyLimiter(
+        initial_limit=1, min_limit=1, max_limit=1, latency_target=1.0, decrease_factor=0.5
+    )
+    await limiter.acquire(timeout=0.1)
+    
+    # Annulée en attente : aucune place prise
+    waiter = asyncio.create_task(limiter.acquire(timeout=1.0))
+    await asyncio.sleep(0)
+    waiter.cancel()
+    with pytest.raises(asyncio.CancelledError):
+        await waiter
+    assert limiter.snapshot() == {"limit": 1, "in_flight": 1, "queued": 0}
+    
+    # Annulée juste après l'attribution de la place : selon la version de Python,
+    # wait_for rend la place obtenue ou lève CancelledError ; dans ce cas la place
+    # doit être rendue, sinon in_flight ne redescend jamais
+    waiter = asyncio.create_task(limiter.acquire(timeout=1.0))
+    await asyncio.sleep(0)
+    limiter.release()
+    waiter.cancel()
+    try:
+        await waiter
+        holders = 1
+    except asyncio.CancelledError:
+        holders = 0
+    assert limiter.in_flight == holders
+    for _ in range(holders):
+        limiter.release()
+    await limiter.acquire(timeout=0.1)
+    assert limiter.in_flight == 1
+    
+    # Comportement de wait_for en Python 3.12+ : CancelledError alors que la place est attribuée
+    async def cancelled_after_grant(future, timeout):
+        await future
+        raise asyncio.CancelledError
+    
+    monkeypatch.setattr("app.infra.resilience.asyncio.wait_for", cancelled_after_grant)
+    waiter = asyncio.create_task(limiter.acquire(timeout=1.0))
+    await asyncio.sleep(0)
+    limiter.release()
+    with pytest.raises(asyncio.CancelledError):
+        await waiter
+    assert limiter.snapshot() == {"limit": 1, "in_flight": 0, "queued": 0}
+
+
+async def test_guard_does_not_count_client_errors(monkeypatch):
+    """Test qu'un 4xx ne dégrade pas l'état de la garde, contrairement à un 5xx"""
+    guard = get_guard("ni.block")
+    request = httpx.Request("POST", "http://ni/cards/block")
+    
+    with pytest.raises(httpx.HTTPStatusError):
+        async with guard.protect():
+            httpx.Response(404, request=request).raise_for_status()
+    assert guard.breaker.snapshot()["failure_rate"] == 0.0
+    
+    async with guard.protect() as call:
+        call.record_response(httpx.Response(503, request=request))
+    assert guard.breaker.snapshot()["failure_rate"] == 0.5
+
+
+async def test_ni_client_fails_fast_when_circuit_is_open(monkeypatch):
+    """Test que NIClient n'appelle pas NI quand le circuit est ouvert"""
+    monkeypatch.setattr("app.infra.ni_client.settings.ni_use_mock", False)
+    get_guard("ni.activate").breaker._open()
+    calls = []
+    
+    def handler(request: httpx.Request) -> httpx.Response:
+        calls.append(request)
+        return httpx.Response(200, json={"success": True})
+    
+    async with httpx.AsyncClient(transport=httpx.MockTransport(handler)) as client:
+        response = await NIClient(http_client=client).activate_card_in_ni(12345, None)
+    
+    assert response.success is False
+    assert response.status == "circuit_open"
+    assert calls == []
+
+
+def test_upstreams_endpoint_exposes_guards(client):
+    """Test que l'état des gardes est exposé pour le monitoring"""
+    get_guard("ni.oppose")
+    
+    response = client.get("/api/v1/health/upstreams")
+    
+    assert response.status_code == 200
+    upstream = response.json()["upstreams"]["ni.oppose"]
+    assert upstream["breaker"]["state"] == "closed"
+    assert upstream["concurrency"]["limit"] >= 1
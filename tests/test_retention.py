@@ -0,0 +1,157 @@
+import gzip
+import json
+import os
+import pytest
+from datetime import datetime, timedelta
+from sqlalchemy import func, select, text
+from sqlalchemy.ext.asyncio import create_async_engine
+from app.domain.models import CardOperation, WebhookClaim, WebhookEvent
+from app.infra.repositories import CardRepository
+from app.jobs.partitions import DETACHED_COMMENT
+from app.jobs.retention import TableArchiver, _Checkpoint, is_detached_partition_name, run_retention
+from tests.conftest import test_engine
+
+NOW = datetime(2026, 10, 18, 9, 0)
+
+
+async def _seed(db_session):
+    card = await CardRepository(db_session).get_or_create(52345)
+    for days, hour in ((400, 8), (400, 17), (380, 12), (10, 12)):
+        created_at = NOW - timedelta(days=days, hours=NOW.hour - hour)
+        operation = CardOperation(
+            card_id=card.id,
+            operation_type="card_blocking",
+            source="SKA",
+            status="SUCCESS",
+            skaleet_webhook_id=f"wh-{days}-{hour}",
+            raw_webhook={"data": {"cardId": 52345}},
+            created_at=created_at
+        )
+        db_session.add(operation)
+        db_session.add(WebhookClaim(skaleet_webhook_id=operation.skaleet_webhook_id, card_operation_id=card.id, created_at=created_at))
+        db_session.add(WebhookEvent(id=f"evt-{days}-{hour}", event_type="card.blocked", payload={"days": days}, created_at=created_at))
+    await db_session.commit()
+
+
+async def _count(db_session, model):
+    return (await db_session.execute(select(func.count()).select_from(model))).scalar()
+
+
+async def test_archives_old_days_then_purges_them(db_session, tmp_path):
+    """Test de l'export NDJSON compressé par jour, du manifeste et de la purge des lignes archivées"""
+    await _seed(db_session)
+    
+    report = await run_retention(test_engine, older_than_days=365, archive_dir=str(tmp_path), now=NOW)
+    
+    assert report["tables"]["card_operations"]["rows"] == 3
+    assert report["tables"]["card_operations"]["deleted"] == 3
+    assert report["tables"]["webhook_events"]["deleted"] == 3
+    assert report["tables"]["webhook_claims"]["deleted"] == 3
+    assert await _count(db_session, CardOperation) == 1
+    assert await _count(db_session, WebhookEvent) == 1
+    assert await _count(db_session, WebhookClaim) == 1
+    
+    day = NOW - timedelta(days=400)
+    archive = tmp_path / "card_operations" / f"{day:%Y}" / f"{day:%m}" / f"card_operations_{day:%Y-%m-%d}.ndjson.gz"
+    with gzip.open(archive, "rt") as lines:
+        rows = [json.loads(line) for line in lines]
+    assert [row["skaleet_webhook_id"] for row in rows] == ["wh-400-8", "wh-400-17"]
+    assert rows[0]["raw_webhook"] == {"data": {"cardId": 52345}}
+    manifest = [json.loads(line) for line in (tmp_path / "card_operations" / "manifest.ndjson").read_text().splitlines()]
+    assert [(entry["day"], entry["rows"]) for entry in manifest] == [(f"{day:%Y-%m-%d}", 2), (f"{NOW - timedelta(days=380):%Y-%m-%d}", 1)]
+
+
+async def test_dry_run_counts_without_writing_or_deleting(db_session, tmp_path):
+    """Test du mode dry-run : comptage par jour, aucune archive ni suppression"""
+    await _seed(db_session)
+    
+    report = await run_retention(test_engine, older_than_days=365, archive_dir=str(tmp_path), dry_run=True, now=NOW)
+    
+    assert report["tables"]["card_operations"]["rows"] == 3
+    assert sorted(report["tables"]["card_operations"]["days"].values()) == [1, 2]
+    assert report["tables"]["webhook_claims"]["rows"] == 3
+    assert await _count(db_session, CardOperation) == 4
+    assert list(tmp_path.iterdir()) == []
+
+
+async def test_interrupted_purge_resumes_without_reexport(db_session, tmp_path):
+    """Test de la reprise : un jour archivé mais pas entièrement purgé n'est pas réexporté"""
+    await _seed(db_session)
+    archiver = TableArchiver(test_engine, CardOperation.__table__, tmp_path, batch_size=1, batch_pause=0)
+    day = (NOW - timedelta(days=400)).replace(hour=0)
+    entry = await archiver.export_day(day)
+    (tmp_path / "card_operations" / "_checkpoint_card_operations.json").write_text(json.dumps({"status": "archived", **entry}))
+    
+    # Purge interrompue après le premier lot
+    await db_session.execute(CardOperation.__table__.delete().where(CardOperation.skaleet_webhook_id == "wh-400-8"))
+    await db_session.commit()
+    
+    report = await archiver.run(NOW - timedelta(days=365))
+    
+    assert report["deleted"] == 2
+    next_day = NOW - timedelta(days=380)
+    assert report["files"] == [f"{next_day:%Y}/{next_day:%m}/card_operations_{next_day:%Y-%m-%d}.ndjson.gz"]
+    assert len(list((tmp_path / "card_operations").rglob("*.ndjson.gz"))) == 2
+    assert await _count(db_session, CardOperation) == 1
+
+
+async def test_interrupted_export_rewrites_the_same_file(db_session, tmp_path, monkeypatch):
+    """Test qu'un arrêt entre l'export et le checkpoint ne crée pas de seconde partie du même jour"""
+    await _seed(db_session)
+    archiver = TableArchiver(test_engine, CardOperation.__table__, tmp_path, batch_pause=0)
+    save = _Checkpoint.save
+    
+    def crash_once_archived(checkpoint, **state):
+        if state.get("status") == "archived":
+            monkeypatch.setattr(_Checkpoint, "save", save)
+            raise RuntimeError("process killed")
+        save(checkpoint, **state)
+    
+    monkeypatch.setattr(_Checkpoint, "save", crash_once_archived)
+    with pytest.raises(RuntimeError):
+        await archiver.run(NOW - timedelta(days=365))
+    report = await archiver.run(NOW - timedelta(days=365))
+    
+    assert report["deleted"] == 3
+    assert len(list((tmp_path / "card_operations").rglob("*.ndjson.gz"))) == 2
+    manifest = [json.loads(line) for line in (tmp_path / "card_operations" / "manifest.ndjson").read_text().splitlines()]
+    assert [entry["rows"] for entry in manifest] == [2, 1]
+
+
+def test_only_partition_names_are_dropped():
+    """Test du filtre de noms : partitions mensuelles et historique, aucune autre table"""
+    assert is_detached_partition_name("card_operations_2025_03")
+    assert is_detached_partition_name("card_operations_legacy")
+    for name in ("card_operations_backup", "card_operations_2025_03_old", "card_operations_2025", "card_operations_legacy2"):
+        assert not is_detached_partition_name(name)
+
+
+async def test_unrelated_tables_survive_partition_cleanup(tmp_path):
+    """Test du chemin PostgreSQL : seules les partitions détachées et marquées sont supprimées"""
+    url = os.environ.get("TEST_POSTGRESQL_URL")
+    if not url:
+        pytest.skip("TEST_POSTGRESQL_URL non défini")
+    engine = create_async_engine(url)
+    tables = ("card_operations_2001_01", "card_operations_backup", "card_operations_2001_02")
+    try:
+        async with engine.begin() as connection:
+            for name in tables:
+                await connection.execute(text(f'DROP TABLE IF EXISTS "{name}"'))
+                await connection.execute(text(f'CREATE TABLE "{name}" (LIKE card_operations)'))
+            # Seule card_operations_2001_01 a été détachée par app/jobs/partitions.py
+            await connection.execute(text(f"COMMENT ON TABLE card_operations_2001_01 IS '{DETACHED_COMMENT}'"))
+            await connection.execute(text("COMMENT ON TABLE card_operations_backup IS 'manual backup'"))
+        
+        report = await run_retention(engine, older_than_days=365, archive_dir=str(tmp_path))
+        
+        assert "card_operations_2001_01" in report["tables"]
+        async with engine.connect() as connection:
+            remaining = set((await connection.execute(text(
+                "SELECT relname FROM pg_class WHERE relname = ANY(:names)"
+            ), {"names": list(tables)})).scalars())
+        assert remaining == {"card_operations_backup", "card_operations_2001_02"}
+    finally:
+        async with engine.begin() as connection:
+            for name in tables:
+                await connection.execute(text(f'DROP TABLE IF EXISTS "{name}"'))
+        await engine.dispose()
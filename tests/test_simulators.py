@@ -0,0 +1,81 @@
+import httpx
+import pytest
+from app.infra.ni_client import NIClient
+from app.infra.resilience import reset_guards
+from app.infra.skaleet_auth import SkaleetTokenManager
+from app.infra.skaleet_client import send_card_operation_result
+from tools.simulators import (
+    LatencyDistribution,
+    SimulatorProfile,
+    create_ni_simulator,
+    create_skaleet_admin_simulator,
+)
+
+
+@pytest.fixture(autouse=True)
+def clean_guards():
+    reset_guards()
+    yield
+    reset_guards()
+
+
+def asgi_client(app, base_url: str) -> httpx.AsyncClient:
+    return httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url=base_url)
+
+
+def test_latency_distribution_parsing():
+    """Test du format des distributions de latence"""
+    assert str(LatencyDistribution.parse("lognormal:0.08:0.5")) == "lognormal:0.08:0.5"
+    assert LatencyDistribution.parse("fixed:0.1").sample(None) == 0.1
+    with pytest.raises(ValueError):
+        LatencyDistribution.parse("pareto:1")
+
+
+async def test_ni_client_against_ni_simulator(monkeypatch):
+    """Test que NIClient obtient les réponses de mock_data via HTTP"""
+    monkeypatch.setattr("app.infra.ni_client.settings.ni_use_mock", False)
+    simulator = create_ni_simulator()
+    
+    async with asgi_client(simulator, "http://ni") as client:
+        ni = NIClient(http_client=client)
+        ni.base_url = "http://ni"
+        response = await ni.activate_card_in_ni(12345, "CMSPARTNER-12345")
+    
+    assert response.success is True
+    assert response.details["visaCardNumber"] == "4532123456789012"
+    assert simulator.state.injector.stats["ok"] == 1
+
+
+async def test_ni_simulator_throttles_and_sends_slow_bodies():
+    """Test que le profil produit des 429 (avec Retry-After) et des corps lents"""
+    simulator = create_ni_simulator(SimulatorProfile(throttle_rate=1.0, retry_after=3.0))
+    
+    async with asgi_client(simulator, "http://ni") as client:
+        throttled = await client.post("/cards/block", json={"cardReference": "CMSPARTNER-12346"})
+        await client.put("/_sim/profile", json={"throttle_rate": 0.0, "slow_body_rate": 1.0, "slow_body_seconds": 0.05})
+        slow = await client.post("/cards/block", json={"cardReference": "CMSPARTNER-12346"})
+    
+    assert throttled.status_code == 429
+    assert throttled.headers["Retry-After"] == "3"
+    assert slow.status_code == 200
+    assert slow.json()["status"] == "BLOCKED"
+    assert simulator.state.injector.stats["slow_body"] == 1
+
+
+async def test_skaleet_simulator_records_callbacks_and_rejects_revoked_tokens(monkeypatch):
+    """Test du chemin OAuth + callback, y compris le rejeu sur 401 après révocation du token"""
+    monkeypatch.setattr("app.infra.skaleet_client.settings.skaleet_admin_base_url", "http://skaleet")
+    simulator = create_skaleet_admin_simulator()
+    
+    async with asgi_client(simulator, "http://skaleet") as client:
+        monkeypatch.setattr("app.infra.skaleet_client.admin_token_manager", SkaleetTokenManager(http_client=client))
+        await send_card_operation_result(12345, "card_activation", "accept", "4532123456789012", http_client=client)
+        await client.post("/_sim/revoke-tokens")
+        await send_card_operation_result(12346, "card_blocking", "error", http_client=client)
+        callbacks = (await client.get("/_sim/callbacks")).json()["callbacks"]
+    
+    assert [(c["cardId"], c["operationType"], c["result"], c["status"]) for c in callbacks] == [
+        (12345, "card_activation", "accept", 200),
+        (12346, "card_blocking", "error", 200),
+    ]
+    assert callbacks[0]["body"]["visaCardNumber"] == "4532123456789012"
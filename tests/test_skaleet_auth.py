@@ -0,0 +1,106 @@
+import asyncio
+import httpx
+import pytest
+from app.infra.skaleet_auth import SkaleetTokenManager
+from app.infra.skaleet_client import request_with_admin_token
+
+
+def make_oauth_handler(calls: list, expires_in: int = 3600, delay: float = 0.0):
+    """Construit un handler MockTransport qui compte les appels à /oauth/token"""
+    async def handler(request: httpx.Request) -> httpx.Response:
+        if request.url.path == "/oauth/token":
+            calls.append(request)
+            await asyncio.sleep(delay)
+            return httpx.Response(200, json={"access_token": f"token-{len(calls)}", "expires_in": expires_in})
+        return httpx.Response(200, json={})
+    return handler
+
+
+async def test_token_is_cached_until_expiry():
+    """Test que le token est réutilisé tant qu'il n'a pas expiré"""
+    calls = []
+    async with httpx.AsyncClient(transport=httpx.MockTransport(make_oauth_handler(calls))) as client:
+        manager = SkaleetTokenManager(http_client=client)
+        first = await manager.get_token()
+        second = await manager.get_token()
+    
+    assert first == second == "token-1"
+    assert len(calls) == 1
+
+
+async def test_expired_token_is_refreshed():
+    """Test qu'un token dont expires_in est dépassé est redemandé"""
+    calls = []
+    async with httpx.AsyncClient(transport=httpx.MockTransport(make_oauth_handler(calls, expires_in=0.2))) as client:
+        manager = SkaleetTokenManager(http_client=client)
+        await manager.get_token()
+        await asyncio.sleep(0.25)
+        token = await manager.get_token()
+        await manager.close()
+    
+    assert token == "token-2"
+    assert len(calls) == 2
+
+
+async def test_short_lived_token_is_reused():
+    """Test qu'un token plus court que la marge de sécurité (expires_in <= 5) reste utilisé"""
+    calls = []
+    async with httpx.AsyncClient(transport=httpx.MockTransport(make_oauth_handler(calls, expires_in=4))) as client:
+        manager = SkaleetTokenManager(http_client=client)
+        first = await manager.get_token()
+        second = await manager.get_token()
+        await manager.close()
+    
+    assert first == second == "token-1"
+    assert len(calls) == 1
+
+
+async def test_concurrent_callers_share_one_refresh():
+    """Test que les appelants concurrents attendent un seul appel /oauth/token"""
+    calls = []
+    handler = make_oauth_handler(calls, delay=0.05)
+    async with httpx.AsyncClient(transport=httpx.MockTransport(handler)) as client:
+        manager = SkaleetTokenManager(http_client=client)
+        tokens = await asyncio.gather(*(manager.get_token() for _ in range(20)))
+    
+    assert set(tokens) == {"token-1"}
+    assert len(calls) == 1
+
+
+async def test_token_is_refreshed_in_background_before_expiry():
+    """Test que le token est rafraîchi en arrière-plan dans la marge de rafraîchissement"""
+    calls = []
+    async with httpx.AsyncClient(transport=httpx.MockTransport(make_oauth_handler(calls))) as client:
+        manager = SkaleetTokenManager(http_client=client)
+        first = await manager.get_token()
+        manager._refresh_at = 0.0
+        # Dans la marge : le token courant est retourné et un rafraîchissement est lancé
+        second = await manager.get_token()
+        await manager._refresh_task
+        third = await manager.get_token()
+        await manager.close()
+    
+    assert first == second == "token-1"
+    assert third == "token-2"
+
+
+async def test_401_invalidates_token_and_retries_once(monkeypatch):
+    """Test qu'un 401 Skaleet invalide le token et rejoue la requête une fois"""
+    calls = []
+    seen_tokens = []
+    
+    async def handler(request: httpx.Request) -> httpx.Response:
+        if request.url.path == "/oauth/token":
+            calls.append(request)
+            return httpx.Response(200, json={"access_token": f"token-{len(calls)}", "expires_in": 3600})
+        seen_tokens.append(request.headers["Authorization"])
+        if request.headers["Authorization"] == "Bearer token-1":
+            return httpx.Response(401)
+        return httpx.Response(200, json={})
+    
+    async with httpx.AsyncClient(transport=httpx.MockTransport(handler)) as client:
+        monkeypatch.setattr("app.infra.skaleet_client.admin_token_manager", SkaleetTokenManager(http_client=client))
+        response = await request_with_admin_token(client, "POST", "http://skaleet/cards/1/operation/card_activation/accept")
+    
+    assert response.status_code == 200
+    assert seen_tokens == ["Bearer token-1", "Bearer token-2"]
@@ -0,0 +1,72 @@
+import pytest
+from sqlalchemy import text
+from app.core.startup import StartupReport
+from app.infra.db import Base, SchemaVersionMismatch, init_db, migration_heads
+from tests.conftest import test_engine
+
+
+async def _set_revision(revision):
+    async with test_engine.begin() as conn:
+        await conn.execute(text("CREATE TABLE IF NOT EXISTS alembic_version (version_num VARCHAR(32) NOT NULL)"))
+        await conn.execute(text("DELETE FROM alembic_version"))
+        await conn.execute(text("INSERT INTO alembic_version (version_num) VALUES (:revision)"), {"revision": revision})
+
+
+async def _drop_revision_table():
+    async with test_engine.begin() as conn:
+        await conn.execute(text("DROP TABLE IF EXISTS alembic_version"))
+
+
+def test_migration_head_is_read_from_the_migration_files():
+    """Test de la lecture de la révision head sans base de données"""
+    heads = migration_heads()
+    
+    assert len(heads) == 1
+    assert next(iter(heads)).isdigit()
+
+
+async def test_schema_check_modes():
+    """Test des modes check (warning) et strict (échec) selon la révision de la base"""
+    try:
+        assert await init_db(test_engine, mode="check") == "none"
+        with pytest.raises(SchemaVersionMismatch):
+            await init_db(test_engine, mode="strict")
+        
+        await _set_revision("007")
+        with pytest.raises(SchemaVersionMismatch, match="revision 007"):
+            await init_db(test_engine, mode="strict")
+        
+        head = next(iter(migration_heads()))
+        await _set_revision(head)
+        assert await init_db(test_engine, mode="strict") == head
+    finally:
+        await _drop_revision_table()
+
+
+async def test_create_mode_creates_tables():
+    """Test du mode create (développement local) : create_all"""
+    try:
+        assert await init_db(test_engine, mode="create") == "create_all"
+        async with test_engine.connect() as conn:
+            tables = set((await conn.execute(text("SELECT name FROM sqlite_master WHERE type = 'table'"))).scalars())
+        assert {"cards", "card_operations", "webhook_claims"} <= tables
+    finally:
+        async with test_engine.begin() as conn:
+            await conn.run_sync(Base.metadata.drop_all)
+
+
+def test_startup_report_stages_and_metrics():
+    """Test du rapport de démarrage : durée par étape et rendu Prometheus"""
+    report = StartupReport()
+    assert report.render() == ""
+    
+    with report.stage("database"):
+        pass
+    with pytest.raises(RuntimeError):
+        with report.stage("http_clients"):
+            raise RuntimeError("boom")
+    report.finish()
+    
+    assert set(report.snapshot()["stages"]) == {"database", "http_clients"}
+    assert 'app_startup_stage_seconds{stage="database"}' in report.render()
+    assert "app_startup_seconds " in report.render()
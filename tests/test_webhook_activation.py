@@ -1,7 +1,20 @@
+import asyncio
+import re
 import pytest
 from unittest.mock import AsyncMock, patch, MagicMock
+from sqlalchemy import event, select
+from app.domain.models import Card, CardOperation, SkaleetResultOutbox
+from app.infra.repositories import CardRepository
 from app.schemas.webhook import SkaleetCardEvent
 from app.schemas.ni import NIResponse
+from app.utils.idempotency import mark_webhook_started
+from tests.conftest import TestSessionLocal, test_engine
+
+
+async def _load_outbox():
+    async with TestSessionLocal() as session:
+        result = await session.execute(select(SkaleetResultOutbox))
+        return list(result.scalars().all())
 
 
 @pytest.fixture
@@ -26,8 +39,7 @@ def test_webhook_activation_endpoint(client, activation_webhook_payload):
     with patch('app.utils.idempotency.is_webhook_processed', new_callable=AsyncMock, return_value=False), \
          patch('app.utils.idempotency.mark_webhook_started', new_callable=AsyncMock) as mock_mark_started, \
          patch('app.utils.idempotency.mark_webhook_finished', new_callable=AsyncMock) as mock_mark_finished, \
-         patch('app.domain.services.NIClient') as mock_ni_class, \
-         patch('app.domain.services.send_card_operation_result', new_callable=AsyncMock) as mock_skaleet:
+         patch('app.domain.services.NIClient') as mock_ni_class:
         
         # Configurer les mocks
         mock_ni_instance = MagicMock()
@@ -40,8 +52,6 @@ def test_webhook_activation_endpoint(client, activation_webhook_payload):
         )
         mock_ni_class.return_value = mock_ni_instance
         
-        mock_skaleet.return_value = None
-        
         mock_operation = MagicMock()
         mock_operation.id = "test-operation-id"
         mock_mark_started.return_value = mock_operation
@@ -58,6 +68,12 @@ def test_webhook_activation_endpoint(client, activation_webhook_payload):
         data = response.json()
         assert data["ok"] is True
         assert data["event"] == "card.status.activation_requested"
+        
+        # Le résultat pour Skaleet est écrit dans l'outbox, pas envoyé pendant la requête
+        outbox = asyncio.run(_load_outbox())
+        assert [(m.skaleet_card_id, m.operation_type, m.result) for m in outbox] == [
+            (12345, "card_activation", "accept")
+        ]
 
 
 def test_webhook_activation_idempotent(client, activation_webhook_payload):
@@ -77,3 +93,64 @@ def test_webhook_activation_idempotent(client, activation_webhook_payload):
         # Le service retourne toujours ok: true même si idempotent
         assert data.get("ok") is True
 
+
+
+async def test_webhook_claim_is_atomic(db_session):
+    """Test que le second claim d'un même webhookId ne crée pas d'opération"""
+    card = await CardRepository(db_session).get_or_create(22345)
+    
+    first = await mark_webhook_started(
+        db_session, "webhook-claim-1", card.id, "card_activation",
+        SkaleetCardEvent.ACTIVATION_REQUESTED.value, "1", raw_webhook={"id": "1"}
+    )
+    second = await mark_webhook_started(
+        db_session, "webhook-claim-1", card.id, "card_activation",
+        SkaleetCardEvent.ACTIVATION_REQUESTED.value, "1"
+    )
+    await db_session.commit()
+    
+    assert first is not None and first.status == "PENDING"
+    assert first.raw_webhook == {"id": "1"}
+    assert second is None
+    
+    result = await db_session.execute(
+        select(CardOperation).where(CardOperation.skaleet_webhook_id == "webhook-claim-1")
+    )
+    assert len(result.scalars().all()) == 1
+
+
+async def test_card_upsert_fills_missing_pan_alias(db_session):
+    """Test que l'upsert renvoie toujours la même carte et complète le pan_alias sans l'écraser"""
+    repo = CardRepository(db_session)
+    
+    created = await repo.get_or_create(22346)
+    completed = await repo.get_or_create(22346, "CMSPARTNER-22346")
+    unchanged = await repo.get_or_create(22346, "CMSPARTNER-OTHER")
+    await db_session.commit()
+    
+    assert created.id == completed.id == unchanged.id
+    assert unchanged.pan_alias == "CMSPARTNER-22346"
+    
+    result = await db_session.execute(select(Card).where(Card.skaleet_card_id == 22346))
+    assert len(result.scalars().all()) == 1
+
+
+async def test_card_lookup_does_not_write_an_unchanged_card(db_session):
+    """Test qu'une carte existante complète est relue sans UPDATE (pas de verrou ni de version morte)"""
+    repo = CardRepository(db_session)
+    await repo.get_or_create(22347, "CMSPARTNER-22347")
+    await db_session.commit()
+    statements = []
+    
+    def record(conn, cursor, statement, parameters, context, executemany):
+        statements.append(" ".join(statement.upper().split()))
+    
+    event.listen(test_engine.sync_engine, "before_cursor_execute", record)
+    try:
+        card = await repo.get_or_create(22347, "CMSPARTNER-22347")
+        await repo.get_or_create(22347)
+    finally:
+        event.remove(test_engine.sync_engine, "before_cursor_execute", record)
+    
+    assert card.pan_alias == "CMSPARTNER-22347"
+    assert statements and not any(re.search(r"\bUPDATE\b", statement) for statement in statements)
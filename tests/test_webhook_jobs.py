@@ -0,0 +1,158 @@
+import pytest
+import uuid
+from datetime import datetime
+from unittest.mock import AsyncMock, MagicMock, patch
+from sqlalchemy import select
+from app.domain.enums import OperationStatus, WebhookJobStatus
+from app.domain.models import CardOperation, SkaleetResultOutbox, WebhookClaim, WebhookJob
+from app.domain.webhook_jobs import WebhookJobRunner, enqueue_webhook
+from app.schemas.ni import NIResponse
+from app.schemas.webhook import SkaleetWebhook
+from tests.conftest import TestSessionLocal
+
+
+def webhook_payload(webhook_id: str = "0189fc90-73ae-701f-90a2-116ab0f5521c", card_id: int = 12345) -> dict:
+    return {
+        "id": "2401597",
+        "webhookId": webhook_id,
+        "type": "card",
+        "event": "card.status.block_requested",
+        "data": {"cardId": card_id, "panAlias": f"CMSPARTNER-{card_id}"}
+    }
+
+
+async def load_all(session, model):
+    session.expire_all()
+    result = await session.execute(select(model))
+    return list(result.scalars().all())
+
+
+@pytest.fixture
+def ni_client():
+    """NIClient mocké : blocage OK"""
+    with patch("app.domain.services.NIClient") as ni_class:
+        ni = MagicMock()
+        ni.block_card_in_ni = AsyncMock(return_value=NIResponse(success=True, status="success"))
+        ni_class.return_value = ni
+        yield ni
+
+
+def test_async_mode_acknowledges_with_202(client, monkeypatch, ni_client):
+    """Test du mode asynchrone : 202 sans appel NI, doublon reconnu au second envoi"""
+    monkeypatch.setattr("app.api.v1.card_webhooks.settings.webhook_ack_mode", "async")
+    
+    response = client.post("/api/v1/webhooks/skaleet/card", json=webhook_payload())
+    assert response.status_code == 202
+    assert response.json() == {
+        "ok": True,
+        "event": "card.status.block_requested",
+        "webhookId": "0189fc90-73ae-701f-90a2-116ab0f5521c",
+        "accepted": True,
+        "duplicate": False
+    }
+    ni_client.block_card_in_ni.assert_not_called()
+    
+    duplicate = client.post("/api/v1/webhooks/skaleet/card", json=webhook_payload())
+    assert duplicate.status_code == 202
+    assert duplicate.json()["duplicate"] is True
+
+
+async def test_runner_processes_queued_webhooks(db_session, ni_client):
+    """Test que les workers traitent les webhooks en file comme le mode synchrone"""
+    assert await enqueue_webhook(db_session, SkaleetWebhook.model_validate(webhook_payload("wh-1", 12345)), "corr-1")
+    assert await enqueue_webhook(db_session, SkaleetWebhook.model_validate(webhook_payload("wh-2", 12346)), "corr-2")
+    assert not await enqueue_webhook(db_session, SkaleetWebhook.model_validate(webhook_payload("wh-1", 12345)))
+    await db_session.commit()
+    
+    # batch_size=1 : la base de test partage une seule connexion entre les sessions
+    runner = WebhookJobRunner(TestSessionLocal, workers=0, batch_size=1, listen=False)
+    assert await runner.run_once() == 1
+    assert await runner.run_once() == 1
+    assert await runner.run_once() == 0
+    
+    jobs = await load_all(db_session, WebhookJob)
+    assert {job.status for job in jobs} == {WebhookJobStatus.DONE.value}
+    assert all(job.attempts == 1 and job.finished_at for job in jobs)
+    operations = await load_all(db_session, CardOperation)
+    assert {(operation.skaleet_webhook_id, operation.status, operation.correlation_id) for operation in operations} == {
+        ("wh-1", OperationStatus.SUCCESS.value, "corr-1"),
+        ("wh-2", OperationStatus.SUCCESS.value, "corr-2"),
+    }
+    assert ni_client.block_card_in_ni.await_count == 2
+    assert runner.results == {"done": 2, "retry": 0, "dead": 0}
+
+
+async def test_failed_job_is_retried_then_dead(db_session, monkeypatch):
+    """Test qu'un job en échec est reprogrammé avec backoff puis passe en DEAD"""
+    monkeypatch.setattr("app.domain.webhook_jobs.settings.webhook_job_max_attempts", 2)
+    monkeypatch.setattr(
+        "app.domain.webhook_jobs.CardWebhookService.process_card_webhook",
+        AsyncMock(side_effect=RuntimeError("database unavailable"))
+    )
+    await enqueue_webhook(db_session, SkaleetWebhook.model_validate(webhook_payload()))
+    await db_session.commit()
+    runner = WebhookJobRunner(TestSessionLocal, workers=0, listen=False)
+    
+    assert await runner.run_once() == 1
+    [job] = await load_all(db_session, WebhookJob)
+    assert job.status == WebhookJobStatus.PENDING.value
+    assert job.next_attempt_at > datetime.utcnow()
+    assert "database unavailable" in job.last_error
+    # Le job n'est pas repris avant son prochain essai
+    assert await runner.run_once() == 0
+    
+    job.next_attempt_at = datetime.utcnow()
+    await db_session.commit()
+    assert await runner.run_once() == 1
+    [job] = await load_all(db_session, WebhookJob)
+    assert job.status == WebhookJobStatus.DEAD.value
+    assert job.attempts == 2 and job.finished_at
+    assert runner.results == {"done": 0, "retry": 1, "dead": 1}
+
+
+async def test_retry_resumes_operation_claimed_by_failed_attempt(db_session, ni_client):
+    """Test d'un échec après la réservation (timeout NI) : le retry reprend l'opération PENDING"""
+    ni_client.block_card_in_ni.side_effect = [
+        TimeoutError("NI timeout"),
+        NIResponse(success=True, status="success"),
+    ]
+    await enqueue_webhook(db_session, SkaleetWebhook.model_validate(webhook_payload()))
+    await db_session.commit()
+    runner = WebhookJobRunner(TestSessionLocal, workers=0, listen=False)
+    
+    assert await runner.run_once() == 1
+    [operation] = await load_all(db_session, CardOperation)
+    assert operation.status == OperationStatus.PENDING.value
+    operation_id = operation.id
+    
+    [job] = await load_all(db_session, WebhookJob)
+    job.next_attempt_at = datetime.utcnow()
+    await db_session.commit()
+    assert await runner.run_once() == 1
+    
+    [job] = await load_all(db_session, WebhookJob)
+    assert job.status == WebhookJobStatus.DONE.value and job.attempts == 2
+    [resumed] = await load_all(db_session, CardOperation)
+    assert (resumed.id, resumed.status) == (operation_id, OperationStatus.SUCCESS.value)
+    [message] = await load_all(db_session, SkaleetResultOutbox)
+    assert message.card_operation_id == operation_id
+    assert ni_client.block_card_in_ni.await_count == 2
+    assert runner.results == {"done": 1, "retry": 1, "dead": 0}
+
+
+async def test_claim_without_operation_moves_job_to_dead(db_session, ni_client):
+    """Test qu'un webhook réservé sans opération à reprendre passe en DEAD au lieu de DONE"""
+    await enqueue_webhook(db_session, SkaleetWebhook.model_validate(webhook_payload()))
+    db_session.add(WebhookClaim(
+        skaleet_webhook_id="0189fc90-73ae-701f-90a2-116ab0f5521c",
+        card_operation_id=uuid.uuid4(),
+        created_at=datetime.utcnow()
+    ))
+    await db_session.commit()
+    runner = WebhookJobRunner(TestSessionLocal, workers=0, listen=False)
+    
+    assert await runner.run_once() == 1
+    [job] = await load_all(db_session, WebhookJob)
+    assert job.status == WebhookJobStatus.DEAD.value and job.attempts == 1
+    assert "cannot be found" in job.last_error
+    ni_client.block_card_in_ni.assert_not_called()
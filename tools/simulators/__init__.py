@@ -0,0 +1,18 @@
+"""
+Simulateurs locaux de NI et Skaleet Admin (applications ASGI)
+
+Permettent d'exercer toute la pile HTTP du service (clients partagés, OAuth,
+gardes, outbox) sans réseau, avec une latence et des erreurs contrôlées.
+Lancement : python -m tools.simulators --help
+"""
+from tools.simulators.ni import create_ni_simulator
+from tools.simulators.profiles import PROFILES, LatencyDistribution, SimulatorProfile
+from tools.simulators.skaleet_admin import create_skaleet_admin_simulator
+
+__all__ = [
+    "PROFILES",
+    "LatencyDistribution",
+    "SimulatorProfile",
+    "create_ni_simulator",
+    "create_skaleet_admin_simulator",
+]
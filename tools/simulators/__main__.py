@@ -0,0 +1,57 @@
+"""
+Lance un simulateur en local
+
+    python -m tools.simulators ni --port 9001 --profile realistic
+    python -m tools.simulators skaleet --port 9002 --profile degraded --token-ttl 60
+
+Puis dans .env : NI_BASE_URL=http://localhost:9001, NI_USE_MOCK=false,
+SKALEET_ADMIN_BASE_URL=http://localhost:9002
+"""
+import argparse
+
+import uvicorn
+
+from tools.simulators.ni import create_ni_simulator
+from tools.simulators.profiles import PROFILES, LatencyDistribution
+from tools.simulators.skaleet_admin import create_skaleet_admin_simulator
+
+
+def build_parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(prog="python -m tools.simulators", description=__doc__,
+                                     formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("target", choices=("ni", "skaleet"), help="Simulateur à lancer")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=9001)
+    parser.add_argument("--profile", choices=sorted(PROFILES), default="fast")
+    parser.add_argument("--latency", type=LatencyDistribution.parse,
+                        help="Distribution de latence, ex: lognormal:0.08:0.5, uniform:0.05:0.2, fixed:0.1")
+    parser.add_argument("--error-rate", type=float, help="Fraction de réponses 503")
+    parser.add_argument("--throttle-rate", type=float, help="Fraction de réponses 429")
+    parser.add_argument("--retry-after", type=float, help="Retry-After des 429 (secondes)")
+    parser.add_argument("--slow-body-rate", type=float, help="Fraction de réponses au corps lent")
+    parser.add_argument("--slow-body-seconds", type=float, help="Durée d'envoi d'un corps lent")
+    parser.add_argument("--seed", type=int, help="Graine aléatoire (runs reproductibles)")
+    parser.add_argument("--token-ttl", type=float, default=300.0, help="Durée de vie des tokens OAuth (skaleet)")
+    return parser
+
+
+def main():
+    args = build_parser().parse_args()
+    overrides = {
+        name: getattr(args, name)
+        for name in ("latency", "error_rate", "throttle_rate", "retry_after", "slow_body_rate", "slow_body_seconds")
+        if getattr(args, name) is not None
+    }
+    profile = PROFILES[args.profile].updated(overrides)
+    
+    if args.target == "ni":
+        app = create_ni_simulator(profile, args.seed)
+    else:
+        app = create_skaleet_admin_simulator(profile, args.seed, token_ttl=args.token_ttl)
+    
+    print(f"{args.target} simulator on http://{args.host}:{args.port} - profile {args.profile}: {profile.to_dict()}")
+    uvicorn.run(app, host=args.host, port=args.port, log_level="warning")
+
+
+if __name__ == "__main__":
+    main()
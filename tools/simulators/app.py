@@ -0,0 +1,36 @@
+"""
+Socle commun des simulateurs : application FastAPI avec endpoints de pilotage
+
+- GET /_sim/profile : profil courant
+- PUT /_sim/profile : modifie le profil à chaud (ex: {"error_rate": 0.2})
+- GET /_sim/stats : nombre de requêtes par issue
+"""
+from typing import Any, Dict, Optional
+
+from fastapi import Body, FastAPI, HTTPException
+
+from tools.simulators.profiles import FaultInjector, SimulatorProfile
+
+
+def create_simulator_app(title: str, profile: SimulatorProfile, seed: Optional[int] = None) -> FastAPI:
+    app = FastAPI(title=title)
+    app.state.injector = FaultInjector(profile, seed)
+    
+    @app.get("/_sim/profile")
+    async def get_profile():
+        return app.state.injector.profile.to_dict()
+    
+    @app.put("/_sim/profile")
+    async def update_profile(changes: Dict[str, Any] = Body(...)):
+        injector: FaultInjector = app.state.injector
+        try:
+            injector.profile = injector.profile.updated(changes)
+        except (TypeError, ValueError) as e:
+            raise HTTPException(status_code=422, detail=str(e))
+        return injector.profile.to_dict()
+    
+    @app.get("/_sim/stats")
+    async def get_stats():
+        return app.state.injector.stats
+    
+    return app
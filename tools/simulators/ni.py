@@ -0,0 +1,43 @@
+"""
+Simulateur du processeur NI
+
+Expose POST /cards/{activate,block,unblock,oppose} avec le même contrat que
+NIClient._send_card_operation ({"cardReference": ...}) et renvoie les réponses
+de app/utils/mock_data.py, après application du profil (latence, erreurs...).
+"""
+import re
+from typing import Any, Dict, Optional
+
+from fastapi import Body, FastAPI, HTTPException
+
+from app.utils.mock_data import get_mock_ni_response
+from tools.simulators.app import create_simulator_app
+from tools.simulators.profiles import PROFILES, SimulatorProfile
+
+NI_OPERATIONS = ("activate", "block", "unblock", "oppose")
+
+_TRAILING_DIGITS = re.compile(r"(\d+)$")
+
+
+def card_id_from_reference(card_reference: str) -> int:
+    """cardId Skaleet depuis un cardReference ("CMSPARTNER-12345" ou "12345")"""
+    match = _TRAILING_DIGITS.search(card_reference or "")
+    return int(match.group(1)) if match else 0
+
+
+def create_ni_simulator(profile: Optional[SimulatorProfile] = None, seed: Optional[int] = None) -> FastAPI:
+    app = create_simulator_app("NI simulator", profile or PROFILES["fast"], seed)
+    
+    @app.post("/cards/{operation}")
+    async def card_operation(operation: str, payload: Dict[str, Any] = Body(...)):
+        if operation not in NI_OPERATIONS:
+            raise HTTPException(status_code=404, detail=f"Unknown operation: {operation}")
+        card_reference = payload.get("cardReference")
+        if not card_reference:
+            raise HTTPException(status_code=400, detail="cardReference is required")
+        
+        pan_alias = card_reference if not card_reference.isdigit() else None
+        response = get_mock_ni_response(operation, card_id_from_reference(card_reference), pan_alias)
+        return await app.state.injector.respond(response.model_dump())
+    
+    return app
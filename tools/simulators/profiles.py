@@ -0,0 +1,156 @@
+"""
+Profils de comportement des simulateurs : latence, erreurs, 429 et corps lents
+
+Un profil décrit comment un simulateur répond :
+- latence tirée selon une distribution (fixed, uniform, normal, lognormal) ;
+- une fraction de réponses 503 (erreur amont) et de 429 (avec Retry-After) ;
+- une fraction de réponses dont le corps est envoyé lentement, par morceaux.
+
+Les profils prédéfinis (PROFILES) couvrent les cas usuels ; chaque paramètre
+peut être surchargé en ligne de commande ou à chaud via PUT /_sim/profile.
+"""
+import asyncio
+import json
+import math
+import random
+from dataclasses import asdict, dataclass, field, replace
+from typing import Any, Dict, Optional
+
+from fastapi import Response
+from fastapi.responses import JSONResponse, StreamingResponse
+
+_DISTRIBUTIONS = ("fixed", "uniform", "normal", "lognormal")
+
+
+@dataclass
+class LatencyDistribution:
+    """
+    Distribution de latence (secondes) :
+    - fixed:value
+    - uniform:low:high
+    - normal:mean:stddev (tronquée à 0)
+    - lognormal:median:sigma (queue longue, la plus réaliste)
+    """
+    kind: str = "fixed"
+    a: float = 0.0
+    b: float = 0.0
+    
+    def sample(self, rng: random.Random) -> float:
+        if self.kind == "uniform":
+            return rng.uniform(self.a, self.b)
+        if self.kind == "normal":
+            return max(rng.gauss(self.a, self.b), 0.0)
+        if self.kind == "lognormal":
+            return rng.lognormvariate(math.log(self.a), self.b) if self.a > 0 else 0.0
+        return self.a
+    
+    @classmethod
+    def parse(cls, spec: str) -> "LatencyDistribution":
+        """Construit une distribution depuis "kind:a[:b]" (ex: "lognormal:0.08:0.5")"""
+        kind, *params = spec.split(":")
+        if kind not in _DISTRIBUTIONS:
+            raise ValueError(f"Unknown latency distribution '{kind}' (expected one of {', '.join(_DISTRIBUTIONS)})")
+        values = [float(param) for param in params] + [0.0, 0.0]
+        return cls(kind, values[0], values[1])
+    
+    def __str__(self) -> str:
+        return f"{self.kind}:{self.a:g}" if self.kind == "fixed" else f"{self.kind}:{self.a:g}:{self.b:g}"
+
+
+@dataclass
+class SimulatorProfile:
+    latency: LatencyDistribution = field(default_factory=LatencyDistribution)
+    error_rate: float = 0.0  # Fraction de réponses 503
+    throttle_rate: float = 0.0  # Fraction de réponses 429
+    retry_after: float = 1.0  # Valeur du header Retry-After des 429 (secondes)
+    slow_body_rate: float = 0.0  # Fraction de réponses au corps envoyé lentement
+    slow_body_seconds: float = 2.0  # Durée d'envoi d'un corps lent
+    
+    def to_dict(self) -> Dict[str, Any]:
+        data = asdict(self)
+        data["latency"] = str(self.latency)
+        return data
+    
+    def updated(self, changes: Dict[str, Any]) -> "SimulatorProfile":
+        """Copie du profil avec les paramètres modifiés (latence au format "kind:a[:b]")"""
+        changes = dict(changes)
+        if isinstance(changes.get("latency"), str):
+            changes["latency"] = LatencyDistribution.parse(changes["latency"])
+        unknown = set(changes) - set(self.__dataclass_fields__)
+        if unknown:
+            raise ValueError(f"Unknown profile fields: {', '.join(sorted(unknown))}")
+        return replace(self, **changes)
+
+
+PROFILES: Dict[str, SimulatorProfile] = {
+    # Aucune latence ni erreur : mesure du coût propre du service
+    "fast": SimulatorProfile(),
+    # Latence de production typique, rares erreurs
+    "realistic": SimulatorProfile(
+        latency=LatencyDistribution("lognormal", 0.08, 0.5),
+        error_rate=0.005,
+        throttle_rate=0.005
+    ),
+    # Amont dégradé : latence élevée à queue longue, erreurs fréquentes
+    "degraded": SimulatorProfile(
+        latency=LatencyDistribution("lognormal", 0.8, 0.9),
+        error_rate=0.1,
+        throttle_rate=0.05,
+        slow_body_rate=0.05,
+        slow_body_seconds=3.0
+    ),
+    # Amont saturé : beaucoup de 429 avec Retry-After
+    "overloaded": SimulatorProfile(
+        latency=LatencyDistribution("uniform", 0.2, 1.5),
+        error_rate=0.05,
+        throttle_rate=0.4,
+        retry_after=2.0
+    ),
+}
+
+
+class FaultInjector:
+    """Applique un profil aux réponses d'un simulateur et compte les issues"""
+    
+    def __init__(self, profile: SimulatorProfile, seed: Optional[int] = None):
+        self.profile = profile
+        self.rng = random.Random(seed)
+        self.stats: Dict[str, int] = {"requests": 0, "ok": 0, "error": 0, "throttled": 0, "slow_body": 0}
+    
+    async def respond(self, payload: Dict[str, Any], status_code: int = 200) -> Response:
+        """Attend la latence tirée puis renvoie `payload`, une erreur, un 429 ou un corps lent"""
+        profile = self.profile
+        self.stats["requests"] += 1
+        
+        await asyncio.sleep(profile.latency.sample(self.rng))
+        
+        roll = self.rng.random()
+        if roll < profile.throttle_rate:
+            self.stats["throttled"] += 1
+            return JSONResponse(
+                status_code=429,
+                content={"success": False, "status": "throttled"},
+                headers={"Retry-After": f"{profile.retry_after:g}"}
+            )
+        if roll < profile.throttle_rate + profile.error_rate:
+            self.stats["error"] += 1
+            return JSONResponse(status_code=503, content={"success": False, "status": "unavailable"})
+        
+        if self.rng.random() < profile.slow_body_rate:
+            self.stats["slow_body"] += 1
+            return StreamingResponse(
+                _slow_body(json.dumps(payload).encode(), profile.slow_body_seconds),
+                status_code=status_code,
+                media_type="application/json"
+            )
+        
+        self.stats["ok"] += 1
+        return JSONResponse(status_code=status_code, content=payload)
+
+
+async def _slow_body(body: bytes, duration: float, chunks: int = 10):
+    """Envoie le corps en `chunks` morceaux répartis sur `duration` secondes"""
+    size = max(math.ceil(len(body) / chunks), 1)
+    for offset in range(0, len(body), size):
+        yield body[offset:offset + size]
+        await asyncio.sleep(duration / chunks)
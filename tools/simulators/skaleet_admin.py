@@ -0,0 +1,100 @@
+"""
+Simulateur de Skaleet Admin
+
+- POST /oauth/token : client credentials, émet des tokens à durée de vie configurable
+- POST /cards/{card_id}/operation/{operation_type}/{result} : callback de résultat,
+  authentifié par Bearer (401 si token inconnu ou expiré) et enregistré
+- GET /cards/{card_id} : carte de app/utils/mock_data.py
+- GET/DELETE /_sim/callbacks : callbacks reçus (vérification des tests de charge)
+"""
+import itertools
+import time
+from typing import Optional
+from urllib.parse import parse_qs
+
+from fastapi import FastAPI, HTTPException, Request
+from fastapi.responses import JSONResponse
+
+from app.utils.mock_data import MOCK_CARDS
+from tools.simulators.app import create_simulator_app
+from tools.simulators.profiles import PROFILES, SimulatorProfile
+
+
+def create_skaleet_admin_simulator(
+    profile: Optional[SimulatorProfile] = None,
+    seed: Optional[int] = None,
+    token_ttl: float = 300.0
+) -> FastAPI:
+    app = create_simulator_app("Skaleet Admin simulator", profile or PROFILES["fast"], seed)
+    # token -> échéance (time.monotonic())
+    app.state.tokens = {}
+    app.state.callbacks = []
+    app.state.token_ttl = token_ttl
+    token_counter = itertools.count(1)
+    
+    def check_token(request: Request) -> Optional[JSONResponse]:
+        authorization = request.headers.get("authorization", "")
+        token = authorization[len("Bearer "):] if authorization.startswith("Bearer ") else None
+        expires_at = app.state.tokens.get(token)
+        if expires_at is None or expires_at <= time.monotonic():
+            return JSONResponse(status_code=401, content={"error": "invalid_token"})
+        return None
+    
+    @app.post("/oauth/token")
+    async def oauth_token(request: Request):
+        # Corps application/x-www-form-urlencoded (comme SkaleetTokenManager._fetch_token)
+        form = {key: values[0] for key, values in parse_qs((await request.body()).decode()).items()}
+        if form.get("grant_type") != "client_credentials" or not form.get("client_id"):
+            return JSONResponse(status_code=400, content={"error": "invalid_request"})
+        token = f"sim-token-{next(token_counter)}"
+        app.state.tokens[token] = time.monotonic() + app.state.token_ttl
+        return await app.state.injector.respond({
+            "access_token": token,
+            "token_type": "Bearer",
+            "expires_in": app.state.token_ttl
+        })
+    
+    @app.post("/cards/{card_id}/operation/{operation_type}/{result}")
+    async def operation_result(card_id: int, operation_type: str, result: str, request: Request):
+        unauthorized = check_token(request)
+        if unauthorized is not None:
+            return unauthorized
+        body = await request.body()
+        response = await app.state.injector.respond({"success": True, "card_id": str(card_id)})
+        # Enregistré avec le statut renvoyé : un callback en 503/429 sera rejoué par l'outbox
+        app.state.callbacks.append({
+            "cardId": card_id,
+            "operationType": operation_type,
+            "result": result,
+            "body": await request.json() if body else None,
+            "status": response.status_code,
+            "receivedAt": time.time()
+        })
+        return response
+    
+    @app.get("/cards/{card_id}")
+    async def get_card(card_id: int, request: Request):
+        unauthorized = check_token(request)
+        if unauthorized is not None:
+            return unauthorized
+        card = next((card for card in MOCK_CARDS if card["cardId"] == card_id), None)
+        if card is None:
+            raise HTTPException(status_code=404, detail="Card not found")
+        return await app.state.injector.respond({"success": True, "card_id": str(card_id), "data": card})
+    
+    @app.get("/_sim/callbacks")
+    async def list_callbacks():
+        return {"count": len(app.state.callbacks), "callbacks": app.state.callbacks}
+    
+    @app.delete("/_sim/callbacks")
+    async def clear_callbacks():
+        app.state.callbacks.clear()
+        return {"count": 0}
+    
+    @app.post("/_sim/revoke-tokens")
+    async def revoke_tokens():
+        """Invalide tous les tokens émis (exerce le rejeu sur 401 du service)"""
+        app.state.tokens.clear()
+        return {"revoked": True}
+    
+    return app